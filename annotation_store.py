@@ -0,0 +1,185 @@
+"""
+Image and annotation store shared by the COCO based datasets.
+
+refcoco, refcoco+ and refcocog refer to objects of the same COCO train2014
+images, and their instances.json files largely hold the same images and
+annotations. A REFER per dataset parses its own instances.json and keeps
+its own copy of them. An AnnotationStore compiles the union of the images
+and annotations of several datasets once, keyed by their COCO ids, under
+
+	<cache_dir>/shared_<dataset>_<dataset>.../
+
+as record files (see index_cache.py) memory-mapped on load, together with
+the ids of the images and annotations of each dataset.
+
+REFER(data_root, dataset, splitBy, store=store) is then a view of the refs
+of one dataset/splitBy on top of the store: its compiled index, kept in the
+store directory, only holds the refs, sentences and tables, and Anns / Imgs
+read the records of the store. Parsing, disk and page cache grow with the
+union of the annotations rather than their sum, and MultiREFER (see
+refer.py) opens several views on one store.
+
+As the compiled index, the store records the size and mtime of the
+instances.json files and is rebuilt as soon as one of them changes. An image
+or annotation present in several files is taken from the first one, COCO ids
+being the same across the datasets.
+
+The following API functions are defined:
+AnnotationStore - images and annotations of several datasets, keyed by COCO id.
+storePath       - directory of the store of a set of datasets.
+buildStore      - compile the images and annotations of instances.json files.
+loadStore       - open a compiled store, None if missing or stale.
+"""
+
+import os
+import os.path as osp
+import json
+import shutil
+import cPickle as pickle
+import index_cache
+from index_cache import RecordFile, RecordMap, RecordList, writeRecords, sourceStamp
+from refer_tables import idColumn, saveArray, loadArray
+
+# bump whenever the on-disk layout changes, older stores are then rebuilt
+STORE_VERSION = 1
+COCO_DATASETS = ['refcoco', 'refcoco+', 'refcocog']
+
+
+def storePath(cache_dir, datasets):
+	return osp.join(cache_dir, '_'.join(['shared'] + sorted(datasets)))
+
+
+def _stamp(sources):
+	# {dataset: [size, mtime]} of the instances.json files, which all have the same name
+	return dict((dataset, sourceStamp([f]).values()[0]) for dataset, f in sources)
+
+
+def _dumps(obj):
+	return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+
+def buildStore(path, sources):
+	"""Compile the images and annotations of sources, [(dataset, instances_file)], into `path`.
+
+	The files are parsed one at a time, each one is released before the next
+	one is parsed. As saveIndex, the store is written to a temporary directory
+	moved into place at the end.
+	"""
+	tmp = '%s.tmp%d' % (path, os.getpid())
+	if osp.isdir(tmp):
+		shutil.rmtree(tmp)
+	os.makedirs(tmp)
+	join = lambda name: osp.join(tmp, name)
+
+	members = []  # [(dataset, image ids, ann ids)] in file order
+	images, categories = [], {}
+
+	def annotations():
+		seen_anns, seen_imgs = set(), set()
+		for dataset, instances_file in sources:
+			instances = json.load(open(instances_file, 'r'))
+			members.append((dataset, [img['id'] for img in instances['images']],
+							[ann['id'] for ann in instances['annotations']]))
+			for img in instances['images']:
+				if img['id'] not in seen_imgs:
+					seen_imgs.add(img['id'])
+					images.append(img)
+			for cat in instances['categories']:
+				categories.setdefault(cat['id'], cat)
+			for ann in instances['annotations']:
+				if ann['id'] not in seen_anns:
+					seen_anns.add(ann['id'])
+					yield ann['id'], _dumps(ann)
+			del instances
+
+	writeRecords(join('anns'), annotations())
+	writeRecords(join('imgs'), ((img['id'], _dumps(img)) for img in images))
+	for dataset, image_ids, ann_ids in members:
+		saveArray(join(dataset+'.image_ids.npy'), idColumn(image_ids))
+		saveArray(join(dataset+'.ann_ids.npy'), idColumn(ann_ids))
+	with open(join('categories.p'), 'wb') as f:
+		pickle.dump([categories[cat_id] for cat_id in sorted(categories)], f, pickle.HIGHEST_PROTOCOL)
+	manifest = {'version': STORE_VERSION, 'datasets': [dataset for dataset, _ in sources],
+				'sources': _stamp(sources)}
+	with open(join(index_cache.MANIFEST), 'w') as f:
+		json.dump(manifest, f)
+
+	if osp.isdir(path):
+		shutil.rmtree(path)
+	os.rename(tmp, path)
+
+
+def loadStore(path, sources=None):
+	"""Open the compiled store in `path`, or return None if there is none,
+	if it was written by another version or if sources changed since."""
+	manifest_file = osp.join(path, index_cache.MANIFEST)
+	if not osp.isfile(manifest_file):
+		return None
+	with open(manifest_file, 'r') as f:
+		manifest = json.load(f)
+	if manifest.get('version') != STORE_VERSION:
+		return None
+	if sources is not None and _stamp(sources) != manifest['sources']:
+		return None
+	return manifest
+
+
+class AnnotationStore(object):
+	"""Images and annotations of several COCO based datasets, keyed by COCO id.
+
+	anns, imgs       - record files of the union of the annotations and images
+	Anns, Imgs       - read-only {id: record} maps over them
+	categories, Cats - union of the categories
+	"""
+
+	def __init__(self, data_root, datasets=COCO_DATASETS, cache_dir=None):
+		# provide data_root folder which contains the datasets, the store is kept
+		# in cache_dir (default: data_root/cache) and reused as long as the
+		# instances.json files of the datasets are unchanged
+		for dataset in datasets:
+			if dataset not in COCO_DATASETS:
+				raise ValueError('dataset [%s] does not refer to COCO images' % dataset)
+		self.datasets = list(datasets)
+		self.CACHE_DIR = cache_dir if cache_dir is not None else osp.join(data_root, 'cache')
+		self.path = storePath(self.CACHE_DIR, self.datasets)
+		sources = [(dataset, osp.join(data_root, dataset, 'instances.json')) for dataset in self.datasets]
+		if loadStore(self.path, sources) is None:
+			print 'building annotation store %s...' % self.path
+			buildStore(self.path, sources)
+		self.open()
+
+	def open(self):
+		join = lambda name: osp.join(self.path, name)
+		self.anns = RecordFile(join('anns'))
+		self.imgs = RecordFile(join('imgs'))
+		self.Anns = RecordMap(self.anns)
+		self.Imgs = RecordMap(self.imgs)
+		with open(join('categories.p'), 'rb') as f:
+			self.categories = pickle.load(f)
+		self.Cats = {cat['id']: cat['name'] for cat in self.categories}
+
+	def __getstate__(self):
+		# pickled as its path, as a REFER on a compiled index
+		return {'datasets': self.datasets, 'CACHE_DIR': self.CACHE_DIR, 'path': self.path}
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.open()
+
+	def viewPath(self, dataset, splitBy):
+		# directory of the compiled index of a REFER view of the store
+		return index_cache.indexPath(osp.join(self.path, 'views'), dataset, splitBy)
+
+	def imageIds(self, dataset):
+		return loadArray(osp.join(self.path, dataset+'.image_ids.npy'))
+
+	def annIds(self, dataset):
+		return loadArray(osp.join(self.path, dataset+'.ann_ids.npy'))
+
+	def loadImages(self, dataset):
+		# images of the instances.json of dataset, in file order
+		return RecordList(self.imgs, rows=self.imgs.index.positions(self.imageIds(dataset)))
+
+	def loadAnnotations(self, dataset):
+		# annotations of the instances.json of dataset, in file order
+		return RecordList(self.anns, rows=self.anns.index.positions(self.annIds(dataset)))
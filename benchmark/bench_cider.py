@@ -0,0 +1,78 @@
+"""
+CIDEr of the python CiderScorer vs the vectorized backend (cider_vectorized.py),
+on synthetic tokenized expressions or on the sentences of a dataset.
+
+Usage:
+python benchmark/bench_cider.py --num_images 10000
+python benchmark/bench_cider.py --data_root data --dataset refcocog --splitBy umd
+"""
+import os.path as osp
+import sys
+import time
+import random
+import argparse
+import numpy as np
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, osp.join(ROOT_DIR, 'evaluation'))
+from cider.cider import Cider
+
+
+def syntheticData(num_images, vocab_size=2000, seed=0):
+	# zipf-like word frequencies, 1 to 4 references of 1 to 12 words
+	random.seed(seed)
+	words = ['w%d' % i for i in range(vocab_size)]
+	weights = np.cumsum(1.0 / np.arange(1, vocab_size+1))
+	def sentence():
+		ranks = np.searchsorted(weights, np.random.rand(random.randint(1, 12)) * weights[-1])
+		return ' '.join(words[r] for r in ranks)
+	np.random.seed(seed)
+	gts = dict((i, [sentence() for _ in range(random.randint(1, 4))]) for i in range(num_images))
+	res = dict((i, [sentence()]) for i in range(num_images))
+	return gts, res
+
+
+def datasetData(params):
+	from refer import REFER
+	refer = REFER(params['data_root'], params['dataset'], params['splitBy'])
+	gts, res = {}, {}
+	for ref_id in refer.getRefIds(split=params['split']):
+		sents = [' '.join(sent['tokens']) for sent in refer.Refs[ref_id]['sentences']]
+		res[ref_id] = [sents[0]]  # first expression against all of them
+		gts[ref_id] = sents
+	return gts, res
+
+
+def main(params):
+	gts, res = datasetData(params) if params['data_root'] else syntheticData(params['num_images'])
+	print '%d images, %d references' % (len(gts), sum(len(v) for v in gts.values()))
+
+	tic = time.time()
+	score, scores = Cider(backend='python').compute_score(gts, res)
+	python_time = time.time() - tic
+
+	cider = Cider()
+	tic = time.time()
+	vscore, vscores = cider.compute_score(gts, res)
+	vectorized_time = time.time() - tic
+	tic = time.time()
+	cider.compute_score(gts, res)
+	cached_time = time.time() - tic
+
+	print 'python:                   %.3fs  CIDEr %.6f' % (python_time, score)
+	print 'vectorized:               %.3fs  CIDEr %.6f  (x%.1f)' % (vectorized_time, vscore, python_time/vectorized_time)
+	print 'vectorized, cached refs:  %.3fs  (x%.1f)' % (cached_time, python_time/cached_time)
+	print 'max score difference: %g' % np.abs(np.array(scores) - vscores).max()
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--data_root', default='', help='folder containing the datasets, synthetic data if empty')
+	parser.add_argument('--dataset', default='refcoco', help='refclef, refcoco, refcoco+ or refcocog')
+	parser.add_argument('--splitBy', default='unc', help='unc, google, umd or berkeley')
+	parser.add_argument('--split', default='val', help='split of the dataset')
+	parser.add_argument('--num_images', default=10000, type=int, help='number of synthetic images')
+	args = parser.parse_args()
+	params = vars(args)
+	main(params)
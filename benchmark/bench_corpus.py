@@ -0,0 +1,86 @@
+"""
+Compare batches of encoded sentences built in python with the compiled
+token corpus (see token_corpus.py).
+
+python - vocabulary counted over sentToTokens, every batch encoded and
+         padded from the token lists
+corpus - refer.getCorpus (compiled on the first run, memory-mapped after),
+         batches gathered from the int32 token array
+
+Both walk the sentences of a split once in batches and are checked to
+produce the same ids.
+
+Usage:
+python benchmark/bench_corpus.py --data_root data --dataset refcocog --splitBy umd --split train
+"""
+import os.path as osp
+import sys
+import time
+import argparse
+import collections
+import numpy as np
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+from refer import REFER
+from bench_load import rss
+
+
+def pythonSetup(refer, min_count):
+	counts = collections.Counter(w for sent_id in refer.Sents for w in refer.sentToTokens[sent_id])
+	words = [w for w in sorted(counts, key=lambda w: (-counts[w], w)) if counts[w] >= min_count]
+	return dict((w, i+2) for i, w in enumerate(words))
+
+
+def pythonBatch(refer, wordToIx, sent_ids, max_len):
+	seqs = [[wordToIx.get(w, 1) for w in refer.sentToTokens[sent_id]][:max_len] for sent_id in sent_ids]
+	ids = np.zeros((len(seqs), max(len(seq) for seq in seqs)), dtype=np.int32)
+	for i, seq in enumerate(seqs):
+		ids[i, :len(seq)] = seq
+	return ids
+
+
+def main(params):
+	refer = REFER(params['data_root'], params['dataset'], params['splitBy'])
+	ref_ids = refer.getRefIds(split=params['split'])
+	sent_ids = [sent_id for ref in refer.loadRefs(ref_ids) for sent_id in ref['sent_ids']]
+	batches = [sent_ids[i:i+params['batch_size']] for i in range(0, len(sent_ids), params['batch_size'])]
+
+	mem = rss()
+	tic = time.time()
+	wordToIx = pythonSetup(refer, params['min_count'])
+	python_setup, python_mem = time.time()-tic, rss()-mem
+	tic = time.time()
+	python_ids = [pythonBatch(refer, wordToIx, batch, params['max_len']) for batch in batches]
+	python_epoch = time.time()-tic
+
+	mem = rss()
+	tic = time.time()
+	corpus = refer.getCorpus(params['min_count'])
+	corpus_setup, corpus_mem = time.time()-tic, rss()-mem
+	tic = time.time()
+	corpus_ids = [corpus.sentBatch(batch, params['max_len'])['ids'] for batch in batches]
+	corpus_epoch = time.time()-tic
+	assert all((a == b).all() for a, b in zip(python_ids, corpus_ids)), 'different ids'
+
+	print
+	print '%s(%s) %s: %d sentences, %d batches of %d' % (params['dataset'], params['splitBy'], params['split'],
+		len(sent_ids), len(batches), params['batch_size'])
+	print '%-8s %10s %10s %12s' % ('', 'setup', 'epoch', 'setup mem')
+	print '%-8s %9.3fs %9.3fs %10.1fMB' % ('python', python_setup, python_epoch, python_mem)
+	print '%-8s %9.3fs %9.3fs %10.1fMB' % ('corpus', corpus_setup, corpus_epoch, corpus_mem)
+	print 'epoch %.1fx faster' % (python_epoch / max(corpus_epoch, 1e-6))
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--data_root', default=osp.join(ROOT_DIR, 'data'), help='folder containing the datasets')
+	parser.add_argument('--dataset', default='refcocog', help='refclef, refcoco, refcoco+ or refcocog')
+	parser.add_argument('--splitBy', default='umd', help='unc, google, umd or berkeley')
+	parser.add_argument('--split', default='train', help='split whose sentences are batched')
+	parser.add_argument('--batch_size', default=64, type=int, help='sentences per batch')
+	parser.add_argument('--max_len', default=20, type=int, help='maximum number of tokens per sentence')
+	parser.add_argument('--min_count', default=2, type=int, help='minimum count of the words of the vocabulary')
+	args = parser.parse_args()
+	params = vars(args)
+	main(params)
@@ -0,0 +1,84 @@
+"""
+Scaling of REFER.createIndex on synthetic data with a skewed (Zipf-like)
+number of annotations and refs per image and per category, the case where
+growing the lists by copying made the build quadratic.
+
+The build time per object must stay flat while the dataset doubles; the
+script exits with status 1 if it grows by more than --max_ratio.
+
+Usage:
+python benchmark/bench_create_index.py --sizes 25000,50000,100000,200000
+"""
+import os.path as osp
+import sys
+import argparse
+import numpy as np
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+from refer import REFER
+from refer_stats import IndexStats
+
+
+def skewedData(num_anns, seed=0):
+	# one image holds ~10% of all annotations, the rest follows a Zipf law
+	rng = np.random.RandomState(seed)
+	num_images = max(1, num_anns // 10)
+	image_ids = np.minimum(rng.zipf(1.3, num_anns), num_images)
+	cat_ids = np.minimum(rng.zipf(1.5, num_anns), 80)
+	images = [{'id': i, 'height': 480, 'width': 640, 'file_name': '%d.jpg' % i} for i in range(1, num_images+1)]
+	anns, refs = [], []
+	sent_id = 0
+	for ann_id in range(num_anns):
+		image_id, cat_id = int(image_ids[ann_id]), int(cat_ids[ann_id])
+		anns.append({'id': ann_id, 'image_id': image_id, 'category_id': cat_id,
+					 'bbox': [0., 0., 10., 10.], 'segmentation': [[0, 0, 10, 0, 10, 10]]})
+		if ann_id % 2 == 0:
+			sents = [{'sent_id': sent_id+k, 'sent': 'man on left', 'tokens': ['man', 'on', 'left']} for k in range(2)]
+			sent_id += 2
+			refs.append({'ref_id': ann_id//2, 'ann_id': ann_id, 'image_id': image_id, 'category_id': cat_id,
+						 'split': 'train', 'sent_ids': [s['sent_id'] for s in sents], 'sentences': sents})
+	cats = [{'id': c, 'name': 'cat%d' % c} for c in range(1, 81)]
+	return {'dataset': 'synthetic', 'refs': refs, 'images': images, 'annotations': anns, 'categories': cats}
+
+
+class InMemoryREFER(REFER):
+	# REFER on data that is already in memory, the index is built by createIndex
+
+	def __init__(self, data):
+		self.data = data
+		self.stats = IndexStats()
+
+
+def buildTime(data):
+	refer = InMemoryREFER(data)
+	refer.createIndex()
+	return refer.stats
+
+
+def main(params):
+	sizes = [int(n) for n in params['sizes'].split(',')]
+	per_object = []
+	print '%10s %10s %12s %s' % ('anns', 'build (s)', 'us/object', 'phases')
+	for n in sizes:
+		data = skewedData(n)
+		stats = min([buildTime(data) for _ in range(params['repeat'])], key=lambda s: s.total())
+		num_objects = sum(stats.counts.values())
+		per_object.append(stats.total() / num_objects * 1e6)
+		phases = ', '.join('%s %.2fs' % p for p in stats.phases)
+		print '%10d %10.3f %12.2f %s' % (n, stats.total(), per_object[-1], phases)
+	ratio = per_object[-1] / per_object[0]
+	print 'cost per object grew %.2fx from %d to %d annotations' % (ratio, sizes[0], sizes[-1])
+	if ratio > params['max_ratio']:
+		print 'FAIL: createIndex does not scale linearly'
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--sizes', default='25000,50000,100000,200000', help='comma separated numbers of annotations')
+	parser.add_argument('--repeat', default=3, type=int, help='builds per size, the fastest is reported')
+	parser.add_argument('--max_ratio', default=2.0, type=float, help='allowed growth of the cost per object')
+	args = parser.parse_args()
+	params = vars(args)
+	main(params)
@@ -0,0 +1,62 @@
+"""
+Wall-clock time of RefEvaluation, serial and with the scorers and shards
+of refs run in --workers processes (num_workers of RefEvaluation), and
+check that the corpus and per-ref scores are the same as serial ones.
+
+Hypotheses are the first expression of each ref with one word dropped.
+
+Usage:
+python benchmark/bench_evaluation.py --data_root data --dataset refcocog --splitBy umd --workers 2,4,8
+"""
+import os.path as osp
+import sys
+import time
+import argparse
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, osp.join(ROOT_DIR, 'evaluation'))
+from refer import REFER
+from refEvaluation import RefEvaluation
+
+
+def evaluate(refer, Res, params, num_workers):
+	refEval = RefEvaluation(refer, Res, tokenizer=params['tokenizer'], meteor_workers=params['meteor_workers'],
+				num_workers=num_workers)
+	tic = time.time()
+	refEval.evaluate()
+	return time.time() - tic, refEval
+
+
+def main(params):
+	refer = REFER(params['data_root'], params['dataset'], params['splitBy'])
+	Res = []
+	for ref_id in refer.getRefIds(split=params['split']):
+		tokens = refer.Refs[ref_id]['sentences'][0]['tokens']
+		Res.append({'ref_id': ref_id, 'sent': ' '.join(tokens[:len(tokens)//2] + tokens[len(tokens)//2+1:])})
+
+	serial_time, serial = evaluate(refer, Res, params, 1)
+	times = []
+	for num_workers in [int(w) for w in params['workers'].split(',')]:
+		t, parallel = evaluate(refer, Res, params, num_workers)
+		same = parallel.eval == serial.eval and parallel.refToEval == serial.refToEval
+		times.append((num_workers, t, same))
+
+	print '%d refs' % len(Res)
+	print 'serial:        %.2fs' % serial_time
+	for num_workers, t, same in times:
+		print '%2d processes:  %.2fs  (x%.1f)  same scores: %s' % (num_workers, t, serial_time/t, same)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--data_root', default='data', help='folder containing the datasets')
+	parser.add_argument('--dataset', default='refcocog', help='refclef, refcoco, refcoco+ or refcocog')
+	parser.add_argument('--splitBy', default='umd', help='unc, google, umd or berkeley')
+	parser.add_argument('--split', default='val', help='split whose refs are evaluated')
+	parser.add_argument('--workers', default='2,4', help='comma separated numbers of processes')
+	parser.add_argument('--meteor_workers', default=1, type=int, help='number of METEOR processes')
+	parser.add_argument('--tokenizer', default='java', help='java or python')
+	args = parser.parse_args()
+	params = vars(args)
+	main(params)
@@ -0,0 +1,59 @@
+"""
+Images/s walking the refs of a split: serial imread vs REFER.iterImages.
+
+Usage:
+python benchmark/bench_images.py --data_root data --dataset refcoco --splitBy unc --split val
+"""
+import os.path as osp
+import sys
+import time
+import argparse
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+import skimage.io as io
+from refer import REFER
+
+
+def main(params):
+	refer = REFER(params['data_root'], params['dataset'], params['splitBy'])
+	ref_ids = refer.getRefIds(split=params['split'])[:params['num_refs']]
+
+	tic = time.time()
+	for ref_id in ref_ids:
+		image = refer.Imgs[refer.Refs[ref_id]['image_id']]
+		io.imread(osp.join(refer.IMAGE_DIR, image['file_name']))
+	serial = time.time() - tic
+
+	results = [('serial imread', serial)]
+	for scale in [None, params['scale']]:
+		refer.imageLoader.cache.clear()
+		refer.imageLoader.resetStats()
+		tic = time.time()
+		for image_id, I in refer.iterImages(ref_ids=ref_ids, scale=scale, prefetch=params['prefetch']):
+			pass
+		results.append(('iterImages scale=%s' % scale, time.time() - tic))
+		stats = refer.imageLoader.stats()
+		print 'scale=%s: decoded %d images (%.1f MB), %.0f decodes/s per thread, waited %.2fs, cache hit rate %.2f' % (
+			scale, stats['decoded'], stats['bytes_read']/1e6, stats['decode_rate'], stats['wait_seconds'],
+			stats['cache']['hit_rate'])
+	refer.imageLoader.close()
+
+	print
+	print '%d refs' % len(ref_ids)
+	for name, seconds in results:
+		print '%-24s %8.1f refs/s' % (name, len(ref_ids)/seconds)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--data_root', default=osp.join(ROOT_DIR, 'data'), help='folder containing the datasets')
+	parser.add_argument('--dataset', default='refcoco', help='refclef, refcoco, refcoco+ or refcocog')
+	parser.add_argument('--splitBy', default='unc', help='unc, google, umd or berkeley')
+	parser.add_argument('--split', default='val', help='split whose refs are walked')
+	parser.add_argument('--num_refs', default=2000, type=int, help='number of refs walked')
+	parser.add_argument('--prefetch', default=16, type=int, help='images read ahead')
+	parser.add_argument('--scale', default=0.5, type=float, help='downscale of the second run')
+	args = parser.parse_args()
+	params = vars(args)
+	main(params)
@@ -0,0 +1,93 @@
+"""
+Compare cold and warm REFER load times.
+
+cold - compiled index missing: parse refs(splitBy).p and instances.json,
+       build the index and compile it to disk.
+warm - open the compiled index written by the cold run.
+
+Usage:
+python benchmark/bench_load.py --data_root data --dataset refcocog --splitBy google
+"""
+import os
+import os.path as osp
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+from refer import REFER
+
+
+def rss():
+	# resident set size in MB (linux only)
+	try:
+		with open('/proc/self/status') as f:
+			return int(f.read().split('VmRSS:')[1].split()[0]) / 1024.
+	except (IOError, IndexError):
+		return float('nan')
+
+
+def residentDelta(fn):
+	# memory held by the object returned by fn
+	before = rss()
+	out = fn()
+	after = rss()
+	del out
+	return after - before
+
+
+def timeit(fn, repeat=1):
+	times = []
+	for _ in range(repeat):
+		tic = time.time()
+		out = fn()
+		times.append(time.time()-tic)
+		del out
+	return min(times)
+
+
+def main(params):
+	cache_dir = params['cache_dir'] or tempfile.mkdtemp(prefix='refer_cache_')
+	try:
+		load = lambda use_cache: REFER(params['data_root'], params['dataset'], params['splitBy'],
+									   cache_dir=cache_dir, use_cache=use_cache)
+		no_cache = timeit(lambda: load(False))
+		if osp.isdir(cache_dir):
+			shutil.rmtree(cache_dir)
+		cold = timeit(lambda: load(True))
+		warm = timeit(lambda: load(True), params['repeat'])
+		warm_mem = residentDelta(lambda: load(True))
+		no_cache_mem = residentDelta(lambda: load(False))
+		# touch the index the way a training loop would
+		refer = load(True)
+		tic = time.time()
+		ref_ids = refer.getRefIds(split='train')
+		for ref_id in ref_ids[:1000]:
+			refer.getRefBox(ref_id)
+		first_use = time.time()-tic
+	finally:
+		if not params['cache_dir']:
+			shutil.rmtree(cache_dir, ignore_errors=True)
+
+	print
+	print '%s(%s)' % (params['dataset'], params['splitBy'])
+	print 'no cache      : %8.3fs' % no_cache
+	print 'cold (+build) : %8.3fs' % cold
+	print 'warm          : %8.3fs  (%.1fx faster than no cache)' % (warm, no_cache/max(warm, 1e-6))
+	print 'resident      : %8.1fMB no cache, %.1fMB warm' % (no_cache_mem, warm_mem)
+	print 'first queries : %8.3fs  (getRefIds(split=train) + 1000 getRefBox on warm index)' % first_use
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--data_root', default=osp.join(ROOT_DIR, 'data'), help='folder containing the datasets')
+	parser.add_argument('--dataset', default='refcocog', help='refclef, refcoco, refcoco+ or refcocog')
+	parser.add_argument('--splitBy', default='google', help='unc, google, umd or berkeley')
+	parser.add_argument('--cache_dir', default='', help='keep the compiled index here (default: temporary folder)')
+	parser.add_argument('--repeat', default=3, type=int, help='number of warm loads, the fastest is reported')
+	args = parser.parse_args()
+	params = vars(args)
+	main(params)
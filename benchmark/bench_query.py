@@ -0,0 +1,64 @@
+"""
+Throughput of REFER.getRefIdArray / getAnnIdArray on random multi-criteria queries.
+
+Usage:
+python benchmark/bench_query.py --data_root data --dataset refcoco --splitBy unc
+"""
+import os.path as osp
+import sys
+import time
+import random
+import argparse
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+from refer import REFER
+
+
+def randomQueries(refer, num, seed=0):
+	random.seed(seed)
+	image_ids = refer.getImgIds()
+	cat_ids = refer.getCatIds()
+	ref_ids = refer.getRefIds()
+	queries = []
+	for _ in range(num):
+		q = {}
+		if random.random() < 0.3:
+			q['image_ids'] = random.sample(image_ids, 4)
+		if random.random() < 0.5:
+			q['cat_ids'] = random.sample(cat_ids, min(2, len(cat_ids)))
+		if random.random() < 0.2:
+			q['ref_ids'] = random.sample(ref_ids, min(100, len(ref_ids)))
+		if random.random() < 0.7:
+			q['split'] = random.choice(['train', 'val', 'test', 'testA', 'testB'])
+		queries.append(q)
+	return queries
+
+
+def main(params):
+	refer = REFER(params['data_root'], params['dataset'], params['splitBy'])
+	queries = randomQueries(refer, params['num_queries'])
+	tic = time.time()
+	n = 0
+	for q in queries:
+		n += len(refer.getRefIdArray(**q))
+	ref_time = time.time() - tic
+	tic = time.time()
+	for q in queries:
+		q.pop('split', None)
+		n += len(refer.getAnnIdArray(**q))
+	ann_time = time.time() - tic
+	print
+	print 'getRefIdArray: %8.0f queries/s' % (len(queries)/ref_time)
+	print 'getAnnIdArray: %8.0f queries/s' % (len(queries)/ann_time)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--data_root', default=osp.join(ROOT_DIR, 'data'), help='folder containing the datasets')
+	parser.add_argument('--dataset', default='refcoco', help='refclef, refcoco, refcoco+ or refcocog')
+	parser.add_argument('--splitBy', default='unc', help='unc, google, umd or berkeley')
+	parser.add_argument('--num_queries', default=5000, type=int, help='number of random queries')
+	args = parser.parse_args()
+	params = vars(args)
+	main(params)
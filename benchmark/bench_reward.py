@@ -0,0 +1,78 @@
+"""
+Time of the reward of self-critical training: RewardScorer primed once on a
+split, then scoring batches of K candidates per ref, against the python
+Cider and Bleu scorers called on every batch.
+
+Usage:
+python benchmark/bench_reward.py --data_root data --dataset refcoco --splitBy unc --batch_size 64 --K 5
+"""
+import os.path as osp
+import sys
+import time
+import random
+import argparse
+import numpy as np
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, osp.join(ROOT_DIR, 'evaluation'))
+from refer import REFER
+from rewardScorer import RewardScorer
+from cider.cider import Cider
+from bleu.bleu_scorer import BleuScorer
+
+
+def main(params):
+	refer = REFER(params['data_root'], params['dataset'], params['splitBy'])
+	metrics = {'CIDEr': 1.0, 'Bleu_4': 1.0} if params['bleu'] else {'CIDEr': 1.0}
+	tic = time.time()
+	scorer = RewardScorer(refer, params['split'], metrics, tokenizer=params['tokenizer'])
+	print 'primed on %d refs in %.3fs' % (len(scorer.refToRow), time.time() - tic)
+
+	# candidates: expressions of other refs, as sampled by a model
+	random.seed(0)
+	ref_ids = sorted(scorer.refToRow)
+	words = [' '.join(sent['tokens']) for ref_id in ref_ids[:1000] for sent in refer.Refs[ref_id]['sentences']]
+	batches = []
+	for _ in range(params['num_batches']):
+		batch = random.sample(ref_ids, min(params['batch_size'], len(ref_ids)))
+		batches.append((batch, [[random.choice(words) for _ in range(params['K'])] for _ in batch]))
+
+	tic = time.time()
+	for batch, candidates in batches:
+		scorer.score(batch, candidates)
+	reward_time = (time.time() - tic) / len(batches)
+
+	# per batch python scorers, on the tokenized ground truth of the batch
+	tic = time.time()
+	for batch, candidates in batches:
+		gts = dict((ref_id, [' '.join(sent['tokens']) for sent in refer.Refs[ref_id]['sentences']]) for ref_id in batch)
+		for k in range(params['K']):
+			res = dict((ref_id, [candidates[n][k]]) for n, ref_id in enumerate(batch))
+			Cider(backend='python').compute_score(gts, res)
+			if params['bleu']:
+				bleu_scorer = BleuScorer(n=4)
+				for ref_id in batch:
+					bleu_scorer += (res[ref_id][0], gts[ref_id])
+				bleu_scorer.compute_score(option='closest', verbose=0)
+	python_time = (time.time() - tic) / len(batches)
+
+	print 'batch of %d refs x %d candidates' % (params['batch_size'], params['K'])
+	print 'RewardScorer:    %.2fms' % (reward_time * 1000)
+	print 'python scorers:  %.2fms  (x%.1f)' % (python_time * 1000, python_time / reward_time)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--data_root', default='data', help='folder containing the datasets')
+	parser.add_argument('--dataset', default='refcoco', help='refclef, refcoco, refcoco+ or refcocog')
+	parser.add_argument('--splitBy', default='unc', help='unc, google, umd or berkeley')
+	parser.add_argument('--split', default='train', help='split the scorer is primed on')
+	parser.add_argument('--batch_size', default=64, type=int, help='number of refs per batch')
+	parser.add_argument('--K', default=5, type=int, help='number of candidates per ref')
+	parser.add_argument('--num_batches', default=50, type=int, help='number of batches timed')
+	parser.add_argument('--tokenizer', default='java', help='tokenizer of the ground truth, java or python')
+	parser.add_argument('--bleu', action='store_true', help='add Bleu_4 to the reward')
+	args = parser.parse_args()
+	params = vars(args)
+	main(params)
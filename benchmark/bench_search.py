@@ -0,0 +1,59 @@
+"""
+Compare phrase search by scanning sentToTokens with the n-gram inverted
+index (see ngram_index.py).
+
+scan  - every sentence of the refs of the split is tested for the phrase
+index - refer.findRefIds(query, split=split)
+
+Both are checked to return the same refs.
+
+Usage:
+python benchmark/bench_search.py --data_root data --dataset refcocog --splitBy umd --queries "second from left,behind,red"
+"""
+import os.path as osp
+import sys
+import time
+import argparse
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+from refer import REFER
+
+
+def contains(tokens, phrase):
+	n = len(phrase)
+	return any(tokens[i:i+n] == phrase for i in range(len(tokens)-n+1))
+
+
+def scan(refer, phrase, split):
+	return [ref_id for ref_id in refer.getRefIds(split=split)
+			if any(contains(refer.sentToTokens[sent_id], phrase) for sent_id in refer.Refs[ref_id]['sent_ids'])]
+
+
+def main(params):
+	refer = REFER(params['data_root'], params['dataset'], params['splitBy'])
+	tic = time.time()
+	refer.getNgramIndex()
+	print 'n-gram index opened in %.3fs' % (time.time()-tic)
+	print '%-24s %8s %10s %10s' % ('phrase', 'refs', 'scan', 'index')
+	for phrase in params['queries'].split(','):
+		tic = time.time()
+		scanned = scan(refer, phrase.split(), params['split'])
+		scan_time = time.time()-tic
+		tic = time.time()
+		found = refer.findRefIds('"%s"' % phrase, split=params['split'])
+		index_time = time.time()-tic
+		assert found == scanned, 'different refs for [%s]' % phrase
+		print '%-24s %8d %9.3fs %8.2fms' % (phrase, len(found), scan_time, index_time*1000)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--data_root', default=osp.join(ROOT_DIR, 'data'), help='folder containing the datasets')
+	parser.add_argument('--dataset', default='refcocog', help='refclef, refcoco, refcoco+ or refcocog')
+	parser.add_argument('--splitBy', default='umd', help='unc, google, umd or berkeley')
+	parser.add_argument('--split', default='', help='split of the refs searched, all of them if empty')
+	parser.add_argument('--queries', default='second from left,behind,red,man in white shirt', help='comma separated phrases')
+	args = parser.parse_args()
+	params = vars(args)
+	main(params)
@@ -0,0 +1,79 @@
+"""
+Compare one REFER per dataset with MultiREFER views on a shared
+annotation store (see annotation_store.py).
+
+no cache - separate REFERs parsing their refs(splitBy).p and instances.json
+cold     - separate compiled indexes / shared store and views, built and compiled
+warm     - opening the compiled indexes / the shared store and views
+disk     - size of the compiled indexes / of the store with its views, which
+           is also what the page cache holds once they are all read
+resident - memory held by the separate REFERs without cache / by the views
+
+Usage:
+python benchmark/bench_shared_store.py --data_root data --views refcoco:unc,refcoco+:unc,refcocog:umd
+"""
+import os
+import os.path as osp
+import sys
+import shutil
+import argparse
+import tempfile
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+from refer import REFER, MultiREFER
+from bench_load import residentDelta, timeit
+
+
+def folderSize(path):
+	# size in MB of the files under path
+	size = 0
+	for root, _, files in os.walk(path):
+		size += sum(osp.getsize(osp.join(root, f)) for f in files)
+	return size / 2.**20
+
+
+def main(params):
+	views = [tuple(view.split(':')) for view in params['views'].split(',')]
+	cache_dir = params['cache_dir'] or tempfile.mkdtemp(prefix='refer_cache_')
+	separate_dir = osp.join(cache_dir, 'separate')
+	shared_dir = osp.join(cache_dir, 'shared')
+	try:
+		separate = lambda use_cache: [REFER(params['data_root'], dataset, splitBy, cache_dir=separate_dir,
+											use_cache=use_cache) for dataset, splitBy in views]
+		shared = lambda: MultiREFER(params['data_root'], views, cache_dir=shared_dir)
+		for path in [separate_dir, shared_dir]:
+			if osp.isdir(path):
+				shutil.rmtree(path)
+		no_cache = timeit(lambda: separate(False))
+		separate_cold = timeit(lambda: separate(True))
+		shared_cold = timeit(shared)
+		separate_warm = timeit(lambda: separate(True), params['repeat'])
+		shared_warm = timeit(shared, params['repeat'])
+		no_cache_mem = residentDelta(lambda: separate(False))
+		shared_mem = residentDelta(shared)
+		separate_disk = folderSize(separate_dir)
+		shared_disk = folderSize(shared_dir)
+	finally:
+		if not params['cache_dir']:
+			shutil.rmtree(cache_dir, ignore_errors=True)
+
+	print
+	print ', '.join('%s(%s)' % view for view in views)
+	print '%-10s %12s %12s' % ('', 'separate', 'shared')
+	print '%-10s %11.3fs %12s' % ('no cache', no_cache, '-')
+	print '%-10s %11.3fs %11.3fs' % ('cold', separate_cold, shared_cold)
+	print '%-10s %11.3fs %11.3fs' % ('warm', separate_warm, shared_warm)
+	print '%-10s %10.1fMB %10.1fMB' % ('disk', separate_disk, shared_disk)
+	print '%-10s %10.1fMB %10.1fMB' % ('resident', no_cache_mem, shared_mem)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--data_root', default=osp.join(ROOT_DIR, 'data'), help='folder containing the datasets')
+	parser.add_argument('--views', default='refcoco:unc,refcoco+:unc,refcocog:umd', help='dataset:splitBy list')
+	parser.add_argument('--cache_dir', default='', help='keep the compiled indexes here (default: temporary folder)')
+	parser.add_argument('--repeat', default=3, type=int, help='number of warm loads, the fastest is reported')
+	args = parser.parse_args()
+	params = vars(args)
+	main(params)
@@ -0,0 +1,306 @@
+"""
+Offline benchmark suite on a synthetic dataset (see synthetic_refer.py),
+compared to a baseline measured on the same machine.
+
+Benchmarks:
+load_source_s        - REFER load from refs(splitBy).p and instances.json, without compiled index
+load_cold_s          - REFER load building and compiling the index
+load_warm_s          - REFER load from the compiled index
+index_memory_mb      - resident memory added by a REFER loaded from the source files
+compiled_memory_mb   - resident memory added by a REFER opened from the compiled index
+queries_per_s        - getRefIds on random image / category / split filters
+masks_per_s          - getMask of distinct refs, RLEs computed from the segmentations
+bleu_s_per_1k        - Bleu (cook and compute) seconds per 1000 refs
+rouge_s_per_1k       - Rouge seconds per 1000 refs
+cider_s_per_1k       - Cider seconds per 1000 refs
+
+Timings and sizes depend on the machine, so no baseline is shipped. The
+baseline is either
+- the suite run again with the code of a git revision (--baseline_rev), on
+  the same synthetic dataset right after the current code, or
+- the results recorded on this machine with --save_baselines (by default in
+  benchmark/baselines.json, not versioned), used only if they were recorded
+  with the same settings on the same host.
+A benchmark regresses when it is more than its tolerance (TOLERANCES, else
+--tolerance) slower / bigger than the baseline, and the script then exits
+with status 1. Without a baseline the results are only reported.
+
+Usage:
+python benchmark/bench_suite.py --baseline_rev master
+python benchmark/bench_suite.py --save_baselines
+python benchmark/bench_suite.py
+"""
+import os
+import os.path as osp
+import sys
+import gc
+import glob
+import json
+import time
+import inspect
+import shutil
+import random
+import platform
+import tempfile
+import argparse
+import resource
+import subprocess
+import multiprocessing
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), '..'))
+# tree whose code is benchmarked, the checkout of --baseline_rev in the baseline run
+CODE_DIR = os.environ.get('REFER_BENCH_CODE_DIR', ROOT_DIR)
+sys.path.insert(0, CODE_DIR)
+sys.path.insert(0, osp.join(CODE_DIR, 'evaluation'))
+from refer import REFER
+from synthetic_refer import writeDataset
+from bleu.bleu import Bleu
+from rouge.rouge import Rouge
+from cider.cider import Cider
+
+BASELINES_FILE = osp.join(osp.dirname(osp.abspath(__file__)), 'baselines.json')
+# benchmarks whose larger values are better, the others are times and sizes
+HIGHER_IS_BETTER = set(['queries_per_s', 'masks_per_s'])
+# tolerances of the benchmarks noisier or steadier than --tolerance
+TOLERANCES = {'index_memory_mb': 0.2, 'compiled_memory_mb': 0.5, 'load_warm_s': 1.0}
+
+
+def hostInfo():
+	# baselines recorded on another host are not compared
+	return {'node': platform.node(), 'machine': platform.machine(), 'cpus': multiprocessing.cpu_count(),
+			'python': platform.python_version()}
+
+
+def currentRSS():
+	# resident memory of the process in bytes
+	try:
+		with open('/proc/self/statm') as f:
+			return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+	except IOError:
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def timed(f):
+	tic = time.time()
+	result = f()
+	return time.time() - tic, result
+
+
+def loadREFER(params, **kwargs):
+	# options the REFER of the benchmarked code does not have yet are left out
+	kwargs['cache_dir'] = params['cache_dir']
+	args = inspect.getargspec(REFER.__init__).args
+	kwargs = dict((key, value) for key, value in kwargs.items() if key in args)
+	return REFER(params['data_root'], params['dataset'], params['splitBy'], **kwargs)
+
+
+def _memory(params, use_cache, out):
+	# in a child process, so that each REFER starts from the same memory
+	gc.collect()
+	before = currentRSS()
+	refer = loadREFER(params, use_cache=use_cache)
+	gc.collect()
+	out.put((currentRSS() - before) / 2.**20)
+
+
+def indexMemory(params, use_cache):
+	out = multiprocessing.Queue()
+	p = multiprocessing.Process(target=_memory, args=(params, use_cache, out))
+	p.start()
+	mb = out.get()
+	p.join()
+	return mb
+
+
+def coldLoad(params):
+	if osp.isdir(params['cache_dir']):
+		shutil.rmtree(params['cache_dir'])
+	return loadREFER(params)
+
+
+def loadBenchmarks(params, results):
+	# fastest of --repeat loads, the first ones also warm the page cache
+	repeat = range(params['repeat'])
+	results['load_source_s'] = min(timed(lambda: loadREFER(params, use_cache=False))[0] for _ in repeat)
+	results['load_cold_s'] = min(timed(lambda: coldLoad(params))[0] for _ in repeat)
+	results['load_warm_s'], refer = min(timed(lambda: loadREFER(params)) for _ in repeat)
+	results['index_memory_mb'] = indexMemory(params, False)
+	results['compiled_memory_mb'] = indexMemory(params, True)
+	return refer
+
+
+def queryBenchmark(refer, params, results):
+	random.seed(0)
+	image_ids = refer.getImgIds()
+	cat_ids = refer.getCatIds()
+	splits = ['train', 'val', 'testA', 'testB', 'test', '']
+	queries = []
+	for _ in range(params['num_queries']):
+		queries.append({'image_ids': random.sample(image_ids, random.randint(0, 20)),
+						'cat_ids': random.sample(cat_ids, random.randint(0, 3)),
+						'split': random.choice(splits)})
+	t, _ = timed(lambda: [refer.getRefIds(**query) for query in queries])
+	results['queries_per_s'] = len(queries) / t
+
+
+def maskBenchmark(refer, params, results):
+	random.seed(0)
+	ref_ids = refer.getRefIds()
+	refs = refer.loadRefs(random.sample(ref_ids, min(params['num_masks'], len(ref_ids))))
+	t, _ = timed(lambda: [refer.getMask(ref) for ref in refs])
+	results['masks_per_s'] = len(refs) / t
+
+
+def metricBenchmarks(refer, params, results):
+	# first expression of each ref with its last word dropped, against all its expressions
+	gts, res = {}, {}
+	for ref_id in refer.getRefIds()[:params['num_eval_refs']]:
+		sents = [' '.join(sent['tokens']) for sent in refer.Refs[ref_id]['sentences']]
+		gts[ref_id] = sents
+		res[ref_id] = [' '.join(refer.Refs[ref_id]['sentences'][0]['tokens'][:-1] or ['left'])]
+	per_1k = 1000. / len(gts)
+	t, _ = timed(lambda: Bleu(4).compute_score(gts, res))
+	results['bleu_s_per_1k'] = t * per_1k
+	t, _ = timed(lambda: Rouge().compute_score(gts, res))
+	results['rouge_s_per_1k'] = t * per_1k
+	t, _ = timed(lambda: Cider().compute_score(gts, res))
+	results['cider_s_per_1k'] = t * per_1k
+
+
+def compare(results, baselines, tolerance):
+	# [(name, value, baseline, change, regressed)]
+	rows = []
+	for name in sorted(results):
+		value = results[name]
+		baseline = baselines.get(name)
+		if baseline is None:
+			rows.append((name, value, None, None, False))
+			continue
+		limit = TOLERANCES.get(name, tolerance)
+		if name in HIGHER_IS_BETTER:
+			change = baseline / value - 1
+		else:
+			change = value / baseline - 1
+		rows.append((name, value, baseline, change, change > limit))
+	return rows
+
+
+def datasetSettings(params):
+	return dict((key, params[key]) for key in ['dataset', 'splitBy', 'num_images', 'seed'])
+
+
+def runSuite(params):
+	# the dataset is kept for the baseline run and later runs in the same work_dir
+	settings_file = osp.join(params['data_root'], 'settings.json')
+	if not osp.isfile(settings_file) or json.load(open(settings_file)) != datasetSettings(params):
+		counts = writeDataset(params['data_root'], params['dataset'], params['splitBy'], params['num_images'],
+							  seed=params['seed'])
+		print 'synthetic %s (%s): %d images, %d annotations, %d refs, %d sentences' % (params['dataset'],
+			params['splitBy'], counts['images'], counts['annotations'], counts['refs'], counts['sentences'])
+		with open(settings_file, 'w') as f:
+			json.dump(datasetSettings(params), f)
+	results = {}
+	refer = loadBenchmarks(params, results)
+	for benchmark in [queryBenchmark, maskBenchmark, metricBenchmarks]:
+		try:
+			benchmark(refer, params, results)
+		except Exception as e:
+			if not params['results_json']:
+				raise
+			# older code of a baseline run, the benchmark is not compared
+			print '%s failed with the code of %s: %r' % (benchmark.__name__, CODE_DIR, e)
+	return results
+
+
+def baselineRun(params, work_dir):
+	# results of the code of --baseline_rev on the same dataset, None if it fails
+	code_dir = tempfile.mkdtemp(prefix='refer_baseline_')
+	try:
+		archive = subprocess.Popen(['git', 'archive', params['baseline_rev']], cwd=ROOT_DIR, stdout=subprocess.PIPE)
+		subprocess.check_call(['tar', '-x', '-C', code_dir], stdin=archive.stdout)
+		if archive.wait() != 0:
+			print 'could not check out %s' % params['baseline_rev']
+			return None
+		# the compiled mask extension is not versioned, the one built here is used
+		for path in glob.glob(osp.join(ROOT_DIR, 'external', '*.so')):
+			if not osp.isfile(osp.join(code_dir, 'external', osp.basename(path))):
+				shutil.copy(path, osp.join(code_dir, 'external'))
+		results_file = osp.join(code_dir, 'results.json')
+		cmd = [sys.executable, osp.abspath(__file__), '--work_dir', work_dir, '--results_json', results_file]
+		for key in ['dataset', 'splitBy', 'num_images', 'seed', 'num_queries', 'num_masks', 'num_eval_refs', 'repeat']:
+			cmd += ['--' + key, str(params[key])]
+		print 'running the suite with the code of %s...' % params['baseline_rev']
+		if subprocess.call(cmd, env=dict(os.environ, REFER_BENCH_CODE_DIR=code_dir)) != 0:
+			print 'the suite failed with the code of %s' % params['baseline_rev']
+			return None
+		return json.load(open(results_file))
+	finally:
+		shutil.rmtree(code_dir)
+
+
+def main(params):
+	work_dir = params['work_dir'] or tempfile.mkdtemp(prefix='refer_bench_')
+	params['data_root'] = osp.join(work_dir, 'data')
+	params['cache_dir'] = osp.join(work_dir, 'cache')
+	settings = datasetSettings(params)
+	try:
+		results = runSuite(params)
+		if params['results_json']:
+			with open(params['results_json'], 'w') as f:
+				json.dump(results, f)
+			return
+		baselines = baselineRun(params, work_dir) if params['baseline_rev'] else None
+	finally:
+		if not params['work_dir']:
+			shutil.rmtree(work_dir)
+
+	if baselines is not None:
+		source = 'the code of %s' % params['baseline_rev']
+	elif params['baseline_rev']:
+		source = None
+	elif not osp.isfile(params['baselines']):
+		print 'no baselines in %s, results only reported' % params['baselines']
+		source = None
+	else:
+		stored = json.load(open(params['baselines']))
+		if stored.get('settings') != settings or stored.get('host') != hostInfo():
+			print 'baselines of %s were recorded with %s on %s, results only reported' % (params['baselines'],
+				stored.get('settings'), stored.get('host'))
+			source = None
+		else:
+			baselines = stored['benchmarks']
+			source = params['baselines']
+	rows = compare(results, baselines or {}, params['tolerance'])
+	print '%-20s %12s %12s %9s' % ('benchmark', 'value', 'baseline', 'change')
+	for name, value, baseline, change, regressed in rows:
+		print '%-20s %12.4f %12s %9s %s' % (name, value, '-' if baseline is None else '%.4f' % baseline,
+			'-' if change is None else '%+.0f%%' % (change * 100), 'REGRESSION' if regressed else '')
+
+	if params['save_baselines']:
+		with open(params['baselines'], 'w') as f:
+			json.dump({'settings': settings, 'host': hostInfo(), 'benchmarks': results}, f, indent=2, sort_keys=True)
+		print 'baselines written to %s' % params['baselines']
+	elif source is not None and any(regressed for _, _, _, _, regressed in rows):
+		print 'FAIL: regressions beyond the tolerance of %s' % source
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--dataset', default='refcoco', help='refclef, refcoco, refcoco+ or refcocog')
+	parser.add_argument('--splitBy', default='unc', help='unc, google, umd or berkeley')
+	parser.add_argument('--num_images', default=5000, type=int, help='number of synthetic images')
+	parser.add_argument('--seed', default=0, type=int, help='random seed of the synthetic dataset')
+	parser.add_argument('--num_queries', default=20000, type=int, help='number of getRefIds queries')
+	parser.add_argument('--num_masks', default=2000, type=int, help='number of getMask calls')
+	parser.add_argument('--num_eval_refs', default=5000, type=int, help='number of refs scored by the metrics')
+	parser.add_argument('--repeat', default=3, type=int, help='number of timed loads, the fastest is reported')
+	parser.add_argument('--work_dir', default='', help='folder of the dataset and index, a removed temporary one if empty')
+	parser.add_argument('--baseline_rev', default='', help='git revision whose code is the baseline, run on the same dataset')
+	parser.add_argument('--baselines', default=BASELINES_FILE, help='json file of the baselines of this machine')
+	parser.add_argument('--tolerance', default=0.5, type=float, help='allowed regression, 0.5 = 50%% slower')
+	parser.add_argument('--save_baselines', action='store_true', help='record the results as the baselines of this machine')
+	parser.add_argument('--results_json', default='', help='only write the results to this json file (baseline run)')
+	args = parser.parse_args()
+	params = vars(args)
+	main(params)
@@ -0,0 +1,54 @@
+"""
+Sentences/s of the PTB tokenizer backends of RefEvaluation: the in-process
+python port, the persistent PTBTokenizer JVM and one JVM per call.
+
+Usage:
+python benchmark/bench_tokenizer.py --num_sentences 50000
+"""
+import os.path as osp
+import sys
+import time
+import argparse
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), '..'))
+sys.path.insert(0, osp.join(ROOT_DIR, 'evaluation'))
+from tokenizer.ptbtokenizer import PTBTokenizer
+from tokenizer.pytokenizer import PyPTBTokenizer
+from check_tokenizer import syntheticSentences
+
+
+def timeTokenizer(tokenizer, captions, repeat):
+	# best of repeat runs
+	best = None
+	for _ in range(repeat):
+		tic = time.time()
+		tokenizer.tokenize(captions)
+		seconds = time.time() - tic
+		best = seconds if best is None else min(best, seconds)
+	return best
+
+
+def main(params):
+	sentences = syntheticSentences(params['num_sentences'])
+	captions = dict((i, [s]) for i, s in enumerate(sentences))
+	small = {0: ['man on left'], 1: ['woman in red']}
+	backends = [('python', PyPTBTokenizer()), ('java, persistent', PTBTokenizer()),
+				('java, one per call', PTBTokenizer(persistent=False))]
+	print '%-20s %14s %18s' % ('backend', 'sentences/s', 'small call (ms)')
+	for name, tokenizer in backends:
+		try:
+			seconds = timeTokenizer(tokenizer, captions, params['repeat'])
+			small_seconds = timeTokenizer(tokenizer, small, params['repeat'])
+		except (OSError, IOError) as e:
+			print '%-20s not available (%s)' % (name, e)
+			continue
+		print '%-20s %14.0f %18.2f' % (name, len(sentences)/seconds, small_seconds*1000)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--num_sentences', default=50000, type=int, help='number of synthetic sentences')
+	parser.add_argument('--repeat', default=3, type=int, help='runs per backend, the best is reported')
+	args = parser.parse_args()
+	params = vars(args)
+	main(params)
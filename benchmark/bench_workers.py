@@ -0,0 +1,80 @@
+"""
+Node memory of REFER shared by forked data loader workers.
+
+The parent loads REFER, forks --workers processes which each walk over all
+refs the way a data loader does (loadRefs, getRefBox, sentToTokens), and
+the proportional set size (PSS, shared pages split between the processes
+using them) of all processes is summed while the workers are alive.
+
+With the dict index (use_cache=False) every worker ends up with a private
+copy of the pages it touches, since updating reference counts writes to
+them. With the compiled index the workers read the same memory-mapped
+files, so node memory stays flat as the number of workers grows.
+
+Usage (linux only):
+python benchmark/bench_workers.py --data_root data --dataset refcoco --splitBy unc --workers 1,4,8,16
+"""
+import os
+import os.path as osp
+import sys
+import argparse
+import multiprocessing
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+from refer import REFER
+
+
+def pss(pid):
+	# proportional set size of a process in MB
+	try:
+		with open('/proc/%d/smaps_rollup' % pid) as f:
+			lines = f.readlines()
+	except IOError:
+		with open('/proc/%d/smaps' % pid) as f:
+			lines = f.readlines()
+	return sum(int(line.split()[1]) for line in lines if line.startswith('Pss:')) / 1024.
+
+
+def work(refer, ready, done):
+	for ref_id in refer.getRefIds():
+		ref = refer.loadRefs(ref_id)[0]
+		refer.getRefBox(ref_id)
+		for sent_id in ref['sent_ids']:
+			refer.sentToTokens[sent_id]
+	ready.put(os.getpid())
+	done.wait()
+
+
+def nodeMemory(refer, num_workers):
+	ready, done = multiprocessing.Queue(), multiprocessing.Event()
+	workers = [multiprocessing.Process(target=work, args=(refer, ready, done)) for _ in range(num_workers)]
+	for w in workers:
+		w.start()
+	pids = [ready.get() for _ in workers]
+	total = pss(os.getpid()) + sum(pss(pid) for pid in pids)
+	done.set()
+	for w in workers:
+		w.join()
+	return total
+
+
+def main(params):
+	counts = [int(n) for n in params['workers'].split(',')]
+	print '%-10s %s' % ('index', ' '.join('%9s' % ('%d wrk' % n) for n in counts))
+	for name, use_cache in [('compiled', True), ('dicts', False)]:
+		refer = REFER(params['data_root'], params['dataset'], params['splitBy'], use_cache=use_cache)
+		memory = [nodeMemory(refer, n) for n in counts]
+		print '%-10s %s  (MB, PSS of parent + workers)' % (name, ' '.join('%9.1f' % m for m in memory))
+		del refer
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--data_root', default=osp.join(ROOT_DIR, 'data'), help='folder containing the datasets')
+	parser.add_argument('--dataset', default='refcoco', help='refclef, refcoco, refcoco+ or refcocog')
+	parser.add_argument('--splitBy', default='unc', help='unc, google, umd or berkeley')
+	parser.add_argument('--workers', default='1,4,8', help='comma separated numbers of workers')
+	args = parser.parse_args()
+	params = vars(args)
+	main(params)
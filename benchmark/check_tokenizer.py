@@ -0,0 +1,159 @@
+"""
+Parity of the in-process PTB tokenizer (evaluation/tokenizer/pytokenizer.py)
+with the Stanford PTBTokenizer.
+
+The expected outputs are the output of PTBTokenizer -preserveLines -lowerCase
+followed by the PUNCTUATIONS removal on CASES and the sample expressions of
+test/, recorded in test/ptbtokenizer_expected.json by running this script
+with --record on a host with java and stanford-corenlp-3.4.1.jar. The python
+tokenizer is checked against this table, and when java is available also
+against PTBTokenizer on a synthetic corpus of referring expressions with
+punctuation, contractions, brackets, ... and optionally the sentences of a
+dataset. Every difference is reported and the script exits with 1. Without
+java nor the table nothing is compared, the script prints SKIPPED and exits
+with 2.
+
+Usage:
+python benchmark/check_tokenizer.py --record
+python benchmark/check_tokenizer.py
+python benchmark/check_tokenizer.py --data_root data --dataset refcoco --splitBy unc
+"""
+import os.path as osp
+import sys
+import json
+import random
+import argparse
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, osp.join(ROOT_DIR, 'evaluation'))
+from tokenizer.ptbtokenizer import PTBTokenizer
+from tokenizer.pytokenizer import PyPTBTokenizer
+
+EXPECTED_FILE = osp.join(ROOT_DIR, 'test', 'ptbtokenizer_expected.json')
+
+# sentences recorded with the sample expressions, for constructs they may lack
+CASES = [
+	'man on left',
+	'The man on the LEFT.',
+	"man's shirt",
+	"don't pick the grey one",
+	"can't see it",
+	"players' bench",
+	'guy (in red)',
+	'guy [in red] {left}',
+	'"big" dog, left',
+	't-shirt guy -- right',
+	'50% of the pizza',
+	'number 1,000 at 3.5',
+	'cannot see',
+	'left...',
+	'colour of the sky',
+	'man in the corner.the one with a hat',
+	'bottom left corner.',
+	'u.s. flag',
+	'mr. smith on the left',
+	'what?the one on the right',
+	'3 1/2 slices left',
+	'U.S.A. team, 2nd from left',
+]
+
+WORDS = ['man', 'woman', 'guy', 'left', 'right', 'red', 'shirt', 'grey', 'colour', 'player', 'dog', 'car',
+		 'the', 'on', 'in', 'with', 'bottom', 'top', 'middle', 'blue', '2nd', '3', 't-shirt', 'half', 'UNK']
+DECORATIONS = [lambda w: w, lambda w: w, lambda w: w, lambda w: w.upper(), lambda w: w.capitalize(),
+			   lambda w: w+"'s", lambda w: w+',', lambda w: w+'.', lambda w: '('+w+')', lambda w: '"'+w+'"',
+			   lambda w: w+"'", lambda w: w+'!', lambda w: w+'?', lambda w: w+'...', lambda w: w+' --',
+			   lambda w: w+'/'+w, lambda w: w+'-'+w, lambda w: "don't "+w, lambda w: w+' & '+w,
+			   lambda w: w+';', lambda w: w+':', lambda w: '$'+w, lambda w: w+'%', lambda w: w+'.'+w,
+			   lambda w: '['+w+']', lambda w: '{'+w+'}', lambda w: w+'!'+w]
+
+
+def syntheticSentences(num, seed=0):
+	random.seed(seed)
+	sentences = []
+	for _ in range(num):
+		words = [random.choice(DECORATIONS)(random.choice(WORDS)) for _ in range(random.randint(1, 8))]
+		sentences.append(' '.join(words))
+	return sentences
+
+
+def sampleSentences():
+	sentences = []
+	for split in ['testA', 'testB']:
+		predictions = json.load(open(osp.join(ROOT_DIR, 'test', 'sample_expressions_%s.json' % split)))['predictions']
+		sentences += [pred['sent'] for pred in predictions]
+	return sentences
+
+
+def compare(name, sentences, expected, actual):
+	mismatches = [(sentences[i], expected[i][0], actual[i][0]) for i in range(len(sentences)) if expected[i] != actual[i]]
+	print '%-10s %6d sentences, %d mismatches' % (name, len(sentences), len(mismatches))
+	for sent, exp, act in mismatches[:10]:
+		print '    %r: java %r, python %r' % (sent, exp, act)
+	return len(mismatches)
+
+
+def javaTokenizer():
+	try:
+		java = PTBTokenizer()
+		java.tokenize({0: ['java']})
+	except (OSError, IOError) as e:
+		print 'PTBTokenizer not available (%s)' % e
+		return None
+	return java
+
+
+def record(java):
+	sentences = CASES + sampleSentences()
+	tokens = java.tokenize(dict((i, [s]) for i, s in enumerate(sentences)))
+	table = {'tokenizer': 'stanford-corenlp-3.4.1 PTBTokenizer -preserveLines -lowerCase, PUNCTUATIONS removed',
+			 'sentences': [[sentences[i], tokens[i][0]] for i in range(len(sentences))]}
+	with open(EXPECTED_FILE, 'w') as f:
+		json.dump(table, f, indent=1, separators=(',', ': '))
+	print 'recorded %d sentences into %s' % (len(sentences), EXPECTED_FILE)
+
+
+def main(params):
+	java = javaTokenizer()
+	if params['record']:
+		if java is None:
+			sys.exit(1)
+		record(java)
+	python = PyPTBTokenizer()
+	mismatches = 0
+	compared = 0
+	if osp.isfile(EXPECTED_FILE):
+		table = json.load(open(EXPECTED_FILE))['sentences']
+		sentences = [sent.encode('utf-8') for sent, _ in table]
+		expected = dict((i, [tokens.encode('utf-8')]) for i, (_, tokens) in enumerate(table))
+		mismatches += compare('recorded', sentences, expected, python.tokenize(dict((i, [s]) for i, s in enumerate(sentences))))
+		compared += len(sentences)
+	else:
+		print 'no recorded PTBTokenizer output in %s, run with --record where java is available' % EXPECTED_FILE
+	if java is None:
+		if compared == 0:
+			print 'SKIPPED: nothing to compare the python tokenizer with'
+			sys.exit(2)
+		sys.exit(1 if mismatches > 0 else 0)
+
+	corpora = [('synthetic', syntheticSentences(params['num_synthetic']))]
+	if params['data_root']:
+		from refer import REFER
+		refer = REFER(params['data_root'], params['dataset'], params['splitBy'])
+		corpora.append((params['dataset'], [sent['sent'] for sent in refer.Sents.values()]))
+	for name, sentences in corpora:
+		captions = dict((i, [s]) for i, s in enumerate(sentences))
+		mismatches += compare(name, sentences, java.tokenize(captions), python.tokenize(captions))
+	sys.exit(1 if mismatches > 0 else 0)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--data_root', default='', help='folder containing the datasets, to also compare their sentences')
+	parser.add_argument('--dataset', default='refcoco', help='refclef, refcoco, refcoco+ or refcocog')
+	parser.add_argument('--splitBy', default='unc', help='unc, google, umd or berkeley')
+	parser.add_argument('--record', action='store_true', help='record the output of PTBTokenizer into test/ptbtokenizer_expected.json')
+	parser.add_argument('--num_synthetic', default=20000, type=int, help='number of synthetic sentences')
+	args = parser.parse_args()
+	params = vars(args)
+	main(params)
@@ -0,0 +1,208 @@
+"""
+Synthetic REFER dataset: writes DATA_ROOT/dataset/refs(splitBy).p and
+DATA_ROOT/dataset/instances.json with the layout of the real files, for
+benchmarks on machines without the downloads.
+
+The statistics follow the published ones of each dataset:
+- COCO-like image sizes, about 7 annotations per image with Zipf-distributed
+  categories (person the most frequent one) and polygon segmentations (star
+  shaped, sometimes in two parts); --rle_fraction of them have a compressed
+  RLE segmentation instead;
+- refs on distinct annotations of an image (2.5 per image for refcoco, 2 for
+  refcocog, 5 for refclef) with 1 to 3 expressions (2.8 on average for
+  refcoco, 1.9 for refcocog, 1.3 for refclef);
+- expression lengths from a negative binomial around the mean of the
+  dataset (3.6 words for refcoco, 8.4 for refcocog, with a long tail) over a
+  Zipf-distributed vocabulary;
+- split labels of the splitBy: unc splits by image into train / val /
+  testA (refs of people) / testB (other refs), google and umd / berkeley
+  have train / val (/ test).
+
+Images are not written, REFER does not need them except to show refs.
+
+Usage:
+python benchmark/synthetic_refer.py --data_root /tmp/synthetic --dataset refcoco --splitBy unc --num_images 20000
+"""
+import os
+import os.path as osp
+import sys
+import json
+import argparse
+import cPickle as pickle
+import numpy as np
+
+ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+from external import mask
+
+# (refs per image, probabilities of 1, 2 and 3 expressions per ref, mean expression length)
+DATASET_STATS = {
+	'refcoco': (2.5, [0.05, 0.06, 0.89], 3.6),
+	'refcoco+': (2.5, [0.05, 0.06, 0.89], 3.5),
+	'refcocog': (2.05, [0.3, 0.49, 0.21], 8.4),
+	'refclef': (5.0, [0.75, 0.19, 0.06], 3.5),
+}
+# splits of a splitBy and their share of the images, 'test' becomes testA / testB for unc
+SPLITS = {
+	'unc': [('train', 0.848), ('val', 0.076), ('test', 0.076)],
+	'google': [('train', 0.9), ('val', 0.1)],
+	'umd': [('train', 0.86), ('val', 0.05), ('test', 0.09)],
+	'berkeley': [('train', 0.6), ('val', 0.1), ('test', 0.3)],
+}
+IMAGE_SIZES = [(480, 640), (640, 480), (427, 640), (640, 427), (375, 500), (500, 375), (512, 512)]
+NUM_CATEGORIES = 80
+PERSON = 1
+ANNS_PER_IMAGE = 7.3
+
+# most frequent words of referring expressions, rarer synthetic words follow
+WORDS = ('left right man the on in white woman front person guy middle shirt red blue black girl '
+	'top bottom far with of near player green back behind second table chair background to '
+	'yellow side closest dark brown car bus giraffe elephant zebra horse sheep cow dog cat '
+	'bear plate pizza glass cup bowl umbrella bike bench boy kid lady shorts jacket hat '
+	'sitting standing holding wearing big small tall short light striped half partial '
+	'corner center closer furthest next first third two one empty arm head hand').split()
+VOCAB_SIZE = 10000
+
+
+def vocabulary():
+	return WORDS + ['word%d' % i for i in range(VOCAB_SIZE - len(WORDS))]
+
+
+def polygon(rng, x, y, w, h):
+	# star shaped polygon inscribed in the box, as a flat [x1, y1, x2, y2, ...] list
+	n = rng.randint(6, 21)
+	angles = np.sort(rng.uniform(0, 2*np.pi, n))
+	radii = rng.uniform(0.5, 1.0, n)
+	xs = x + w/2. * (1 + radii*np.cos(angles))
+	ys = y + h/2. * (1 + radii*np.sin(angles))
+	return np.round(np.column_stack([xs, ys]).ravel(), 2).tolist()
+
+
+def polygonArea(poly):
+	xs, ys = np.array(poly[0::2]), np.array(poly[1::2])
+	return 0.5 * abs(np.dot(xs, np.roll(ys, 1)) - np.dot(ys, np.roll(xs, 1)))
+
+
+def annotation(rng, ann_id, image_id, cat_id, height, width, rle_fraction):
+	w = rng.uniform(0.05, 0.6) * width
+	h = rng.uniform(0.05, 0.6) * height
+	x = rng.uniform(0, width - w)
+	y = rng.uniform(0, height - h)
+	parts = [(x, y, w, h)]
+	if rng.rand() < 0.1:
+		# a second part, e.g. an occluded object
+		parts = [(x, y, w/2., h), (x + w/2., y, w/2., h)]
+	polys = [polygon(rng, *part) for part in parts]
+	if rng.rand() < rle_fraction:
+		rles = mask.frPyObjects(polys, height, width)
+		segmentation = mask.merge(rles) if len(rles) > 1 else rles[0]
+		area = float(mask.area([segmentation])[0])
+		bbox = mask.toBbox([segmentation])[0].tolist()
+	else:
+		segmentation = polys
+		area = sum(polygonArea(p) for p in polys)
+		xs = np.concatenate([p[0::2] for p in polys])
+		ys = np.concatenate([p[1::2] for p in polys])
+		bbox = [xs.min(), ys.min(), xs.max() - xs.min(), ys.max() - ys.min()]
+	return {'id': ann_id, 'image_id': image_id, 'category_id': cat_id, 'segmentation': segmentation,
+			'area': area, 'bbox': [round(float(v), 2) for v in bbox], 'iscrowd': 0}
+
+
+def sentenceLengths(rng, mean, n):
+	# 1 + negative binomial of mean - 1 words, dispersion 3
+	r = 3.
+	return 1 + rng.negative_binomial(r, r / (r + mean - 1), n)
+
+
+def syntheticDataset(dataset='refcoco', splitBy='unc', num_images=1000, rle_fraction=0.1, seed=0):
+	"""
+	:return: refs list and instances dict, as stored in refs(splitBy).p and instances.json
+	"""
+	rng = np.random.RandomState(seed)
+	refs_per_image, sents_per_ref, sent_length = DATASET_STATS[dataset]
+	split_names = [name for name, _ in SPLITS[splitBy]]
+	split_probs = [p for _, p in SPLITS[splitBy]]
+	words = vocabulary()
+	# cumulative Zipf distributions of the words and categories
+	word_cdf = np.cumsum(1. / np.arange(1, len(words)+1))
+	word_cdf /= word_cdf[-1]
+	cat_cdf = np.cumsum(1. / np.arange(1, NUM_CATEGORIES+1)**1.2)
+	cat_cdf /= cat_cdf[-1]
+
+	images, anns, refs = [], [], []
+	ann_id, ref_id, sent_id = 1, 0, 0
+	for image_id in range(1, num_images+1):
+		height, width = IMAGE_SIZES[rng.randint(len(IMAGE_SIZES))]
+		if dataset == 'refclef':
+			file_name = '%d.jpg' % image_id
+		else:
+			file_name = 'COCO_train2014_%012d.jpg' % image_id
+		images.append({'id': image_id, 'height': height, 'width': width, 'file_name': file_name})
+		split = split_names[rng.choice(len(split_names), p=split_probs)]
+
+		num_anns = 1 + rng.poisson(ANNS_PER_IMAGE - 1)
+		image_anns = []
+		for cat_id in (np.searchsorted(cat_cdf, rng.rand(num_anns)) + 1).tolist():
+			image_anns.append(annotation(rng, ann_id, image_id, cat_id, height, width, rle_fraction))
+			ann_id += 1
+		anns += image_anns
+
+		num_refs = min(num_anns, 1 + rng.poisson(refs_per_image - 1))
+		for i in rng.choice(num_anns, num_refs, replace=False).tolist():
+			ann = image_anns[i]
+			num_sents = 1 + rng.choice(3, p=sents_per_ref)
+			sentences = []
+			for length in sentenceLengths(rng, sent_length, num_sents).tolist():
+				tokens = [words[w] for w in np.searchsorted(word_cdf, rng.rand(length)).tolist()]
+				sent = ' '.join(tokens)
+				sentences.append({'sent_id': sent_id, 'sent': sent, 'raw': sent, 'tokens': tokens})
+				sent_id += 1
+			ref_split = split
+			if splitBy == 'unc' and split == 'test':
+				ref_split = 'testA' if ann['category_id'] == PERSON else 'testB'
+			refs.append({'ref_id': ref_id, 'ann_id': ann['id'], 'image_id': image_id,
+						 'category_id': ann['category_id'], 'split': ref_split,
+						 'sent_ids': [s['sent_id'] for s in sentences], 'sentences': sentences,
+						 'file_name': '%s_%d.jpg' % (osp.splitext(file_name)[0], ann['id'])})
+			ref_id += 1
+
+	categories = [{'id': c, 'name': 'person' if c == PERSON else 'category%d' % c, 'supercategory': 'object'}
+				  for c in range(1, NUM_CATEGORIES+1)]
+	return refs, {'images': images, 'annotations': anns, 'categories': categories}
+
+
+def writeDataset(data_root, dataset='refcoco', splitBy='unc', num_images=1000, rle_fraction=0.1, seed=0):
+	"""
+	Write data_root/dataset/refs(splitBy).p and instances.json.
+	:return: number of images, annotations, refs and sentences
+	"""
+	refs, instances = syntheticDataset(dataset, splitBy, num_images, rle_fraction, seed)
+	data_dir = osp.join(data_root, dataset)
+	if not osp.isdir(data_dir):
+		os.makedirs(data_dir)
+	with open(osp.join(data_dir, 'refs(%s).p' % splitBy), 'wb') as f:
+		pickle.dump(refs, f, pickle.HIGHEST_PROTOCOL)
+	with open(osp.join(data_dir, 'instances.json'), 'w') as f:
+		json.dump(instances, f)
+	return {'images': len(instances['images']), 'annotations': len(instances['annotations']),
+			'refs': len(refs), 'sentences': sum(len(ref['sentences']) for ref in refs)}
+
+
+def main(params):
+	counts = writeDataset(params['data_root'], params['dataset'], params['splitBy'], params['num_images'],
+						  params['rle_fraction'], params['seed'])
+	print 'wrote %s/%s: %d images, %d annotations, %d refs, %d sentences' % (params['data_root'],
+		params['dataset'], counts['images'], counts['annotations'], counts['refs'], counts['sentences'])
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--data_root', required=True, help='folder the dataset is written to')
+	parser.add_argument('--dataset', default='refcoco', help='refclef, refcoco, refcoco+ or refcocog')
+	parser.add_argument('--splitBy', default='unc', help='unc, google, umd or berkeley')
+	parser.add_argument('--num_images', default=1000, type=int, help='number of images')
+	parser.add_argument('--rle_fraction', default=0.1, type=float, help='share of annotations with an RLE segmentation')
+	parser.add_argument('--seed', default=0, type=int, help='random seed')
+	args = parser.parse_args()
+	params = vars(args)
+	main(params)
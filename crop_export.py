@@ -0,0 +1,207 @@
+"""
+Export of fixed-size crops and masks of referred objects to memory-mapped shards.
+
+Training a comprehension model crops the box of every ref out of its image,
+decodes its mask and resizes both, every epoch. exportCrops does this once
+for the refs of a split, in a process pool, and writes shards of
+
+	shard_00000.crops.npy        uint8 n x size x size x 3, the box of each ref resized
+	shard_00000.masks.npy        uint8 n x size x size, the mask of each ref in the same box
+	shard_00000.boxes.npy        float32 n x 4, the [x, y, w, h] box in the image
+	shard_00000.ref_ids.npy      int64 n
+	shard_00000.sent_ids.npy     int64, sentence ids of all refs of the shard
+	shard_00000.sent_offsets.npy int64 n+1, sent_ids of ref i are sent_ids[offsets[i]:offsets[i+1]]
+	shard_00000.json             number of refs, written last: the shard is complete
+
+to out_dir, together with index.json describing the export. Refs are sorted
+by image so that the refs of an image share one decode. Running the export
+again skips the complete shards, so an interrupted export resumes where it
+stopped. ShardReader memory-maps the shards and returns batches as slices
+of them, without decoding anything.
+
+Usage:
+python crop_export.py --data_root data --dataset refcoco --splitBy unc --split train --out_dir crops/refcoco_unc_train
+
+The following API functions are defined:
+exportCrops - export the crops and masks of the refs of a split.
+ShardReader - read the exported shards in batches.
+"""
+
+import os
+import os.path as osp
+import json
+import time
+import random
+import multiprocessing
+import numpy as np
+from PIL import Image
+
+EXPORT_VERSION = 1
+SHARD_FILES = ['crops', 'masks', 'boxes', 'ref_ids', 'sent_ids', 'sent_offsets']
+
+
+def cropBox(bbox, height, width):
+	# integer [x0, y0, x1, y1] of the pixels covered by bbox, at least one pixel
+	x, y, w, h = bbox
+	x0 = min(max(int(np.floor(x)), 0), width-1)
+	y0 = min(max(int(np.floor(y)), 0), height-1)
+	x1 = min(max(int(np.ceil(x+w)), x0+1), width)
+	y1 = min(max(int(np.ceil(y+h)), y0+1), height)
+	return x0, y0, x1, y1
+
+
+def cropRef(refer, ref, size):
+	"""Crop and mask of ref, both resized to size x size."""
+	I = refer.loadImage(ref['image_id'])
+	if I.ndim == 2:
+		I = np.dstack([I, I, I])
+	elif I.shape[2] == 4:
+		I = I[:, :, :3]
+	bbox = refer.getRefBox(ref['ref_id'])
+	x0, y0, x1, y1 = cropBox(bbox, I.shape[0], I.shape[1])
+	m = refer.getMask(ref)['mask']
+	crop = Image.fromarray(np.ascontiguousarray(I[y0:y1, x0:x1])).resize((size, size), Image.BILINEAR)
+	crop_mask = Image.fromarray(m[y0:y1, x0:x1]).resize((size, size), Image.NEAREST)
+	return np.asarray(crop), np.asarray(crop_mask), bbox
+
+
+def shardName(i):
+	return 'shard_%05d' % i
+
+
+def writeShard(refer, out_dir, name, ref_ids, size):
+	n = len(ref_ids)
+	crops = np.zeros((n, size, size, 3), dtype=np.uint8)
+	masks = np.zeros((n, size, size), dtype=np.uint8)
+	boxes = np.zeros((n, 4), dtype=np.float32)
+	sent_ids, sent_offsets = [], [0]
+	for i, ref_id in enumerate(ref_ids):
+		ref = refer.Refs[ref_id]
+		crops[i], masks[i], boxes[i] = cropRef(refer, ref, size)
+		sent_ids += ref['sent_ids']
+		sent_offsets.append(len(sent_ids))
+	arrays = {'crops': crops, 'masks': masks, 'boxes': boxes,
+			  'ref_ids': np.array(ref_ids, dtype=np.int64),
+			  'sent_ids': np.array(sent_ids, dtype=np.int64),
+			  'sent_offsets': np.array(sent_offsets, dtype=np.int64)}
+	for field in SHARD_FILES:
+		tmp = osp.join(out_dir, '%s.%s.tmp%d.npy' % (name, field, os.getpid()))
+		np.save(tmp, arrays[field])
+		os.rename(tmp, osp.join(out_dir, '%s.%s.npy' % (name, field)))
+	with open(osp.join(out_dir, name+'.json'), 'w') as f:
+		json.dump({'count': n}, f)
+
+
+# REFER of the worker processes, a compiled index is pickled as its path
+_worker_refer = None
+
+def _initWorker(refer):
+	global _worker_refer
+	_worker_refer = refer
+
+def _exportShard(args):
+	out_dir, name, ref_ids, size = args
+	writeShard(_worker_refer, out_dir, name, ref_ids, size)
+	return name, len(ref_ids)
+
+
+def exportCrops(refer, out_dir, split='', size=224, shard_size=1024, num_workers=None):
+	"""Export the crops and masks of the refs of split (all refs if empty) to out_dir,
+	resuming a previous export of the same refs into out_dir."""
+	ref_ids = refer.getRefIdArray(split=split)
+	rows = refer.tables.ref_index.positions(ref_ids)
+	ref_ids = ref_ids[np.argsort(refer.tables.refs['image_id'][rows], kind='mergesort')].tolist()
+	shards = [{'name': shardName(i), 'count': len(ref_ids[start:start+shard_size])}
+			  for i, start in enumerate(range(0, len(ref_ids), shard_size))]
+	index = {'version': EXPORT_VERSION, 'dataset': refer.data['dataset'], 'splitBy': refer.splitBy,
+			 'split': split, 'size': size, 'shard_size': shard_size, 'num_refs': len(ref_ids), 'shards': shards}
+
+	if not osp.isdir(out_dir):
+		os.makedirs(out_dir)
+	index_file = osp.join(out_dir, 'index.json')
+	if osp.isfile(index_file):
+		with open(index_file, 'r') as f:
+			previous = json.load(f)
+		if previous != index:
+			raise ValueError('%s holds another export, remove it or choose another out_dir' % out_dir)
+	else:
+		with open(index_file, 'w') as f:
+			json.dump(index, f)
+
+	tasks = []
+	for i, shard in enumerate(shards):
+		if not osp.isfile(osp.join(out_dir, shard['name']+'.json')):
+			tasks.append((out_dir, shard['name'], ref_ids[i*shard_size:(i+1)*shard_size], size))
+	print 'exporting %d refs in %d shards to %s (%d already done)' % (len(ref_ids), len(shards), out_dir, len(shards)-len(tasks))
+
+	tic = time.time()
+	done = 0
+	pool = multiprocessing.Pool(num_workers, _initWorker, (refer,))
+	try:
+		for name, count in pool.imap_unordered(_exportShard, tasks):
+			done += count
+			print '%s done, %d refs/s' % (name, done/(time.time()-tic))
+	finally:
+		pool.terminate()
+		pool.join()
+	return index
+
+
+class ShardReader(object):
+
+	def __init__(self, out_dir):
+		with open(osp.join(out_dir, 'index.json'), 'r') as f:
+			self.index = json.load(f)
+		self.out_dir = out_dir
+		self.shards = []
+		for shard in self.index['shards']:
+			if not osp.isfile(osp.join(out_dir, shard['name']+'.json')):
+				raise IOError('export in %s is not complete, %s is missing' % (out_dir, shard['name']))
+			self.shards.append(dict((field, np.load(osp.join(out_dir, '%s.%s.npy' % (shard['name'], field)), mmap_mode='r'))
+									for field in SHARD_FILES))
+
+	def __len__(self):
+		return self.index['num_refs']
+
+	def batches(self, batch_size, shuffle=False, seed=None):
+		"""Yield {'crops', 'masks', 'boxes', 'ref_ids', 'sent_ids'} batches, sent_ids being a list
+		of lists. Batches do not span shards, shuffle permutes shards and refs within shards."""
+		rand = random.Random(seed)
+		order = range(len(self.shards))
+		if shuffle:
+			rand.shuffle(order)
+		for s in order:
+			shard = self.shards[s]
+			n = len(shard['ref_ids'])
+			if shuffle:
+				rows = np.arange(n)
+				rand.shuffle(rows)
+			for start in range(0, n, batch_size):
+				if shuffle:
+					take = np.sort(rows[start:start+batch_size])
+				else:
+					take = slice(start, start+batch_size)
+				batch = dict((field, shard[field][take]) for field in ['crops', 'masks', 'boxes', 'ref_ids'])
+				offsets = shard['sent_offsets']
+				batch['sent_ids'] = [shard['sent_ids'][offsets[i]:offsets[i+1]].tolist()
+									 for i in np.arange(n)[take]]
+				yield batch
+
+
+if __name__ == '__main__':
+	import argparse
+	from refer import REFER
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--data_root', default=osp.join(osp.dirname(osp.abspath(__file__)), 'data'), help='folder containing the datasets')
+	parser.add_argument('--dataset', default='refcoco', help='refclef, refcoco, refcoco+ or refcocog')
+	parser.add_argument('--splitBy', default='unc', help='unc, google, umd or berkeley')
+	parser.add_argument('--split', default='train', help='split to export, empty for all refs')
+	parser.add_argument('--out_dir', required=True, help='folder of the shards')
+	parser.add_argument('--size', default=224, type=int, help='side of the crops and masks')
+	parser.add_argument('--shard_size', default=1024, type=int, help='refs per shard')
+	parser.add_argument('--num_workers', default=None, type=int, help='processes, default: number of cores')
+	args = parser.parse_args()
+	params = vars(args)
+
+	refer = REFER(params['data_root'], params['dataset'], params['splitBy'])
+	exportCrops(refer, params['out_dir'], params['split'], params['size'], params['shard_size'], params['num_workers'])
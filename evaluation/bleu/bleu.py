@@ -19,7 +19,10 @@ class Bleu:
         self.ref_for_image = {}
 
     def compute_score(self, gts, res):
+        return self.compute(self.cook(gts, res))
 
+    def cook(self, gts, res):
+        # n-gram counts of the hypotheses and references
         assert(gts.keys() == res.keys())
         imgIds = gts.keys()
 
@@ -35,7 +38,9 @@ class Bleu:
             assert(len(ref) >= 1)
 
             bleu_scorer += (hypo[0], ref)
+        return bleu_scorer
 
+    def compute(self, bleu_scorer):
         #score, scores = bleu_scorer.compute_score(option='shortest')
         score, scores = bleu_scorer.compute_score(option='closest', verbose=1)
         #score, scores = bleu_scorer.compute_score(option='average', verbose=1)
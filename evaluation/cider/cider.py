@@ -8,18 +8,25 @@
 # Authors: Ramakrishna Vedantam <vrama91@vt.edu> and Tsung-Yi Lin <tl483@cornell.edu>
 
 from cider_scorer import CiderScorer
+from cider_vectorized import CiderReferences
+import numpy as np
 import pdb
 
 class Cider:
     """
     Main Class to compute the CIDEr metric 
 
+    backend 'vectorized' (cider_vectorized.py) keeps the reference vectors of
+    the last gts between calls, 'python' is the original CiderScorer.
     """
-    def __init__(self, test=None, refs=None, n=4, sigma=6.0):
+    def __init__(self, test=None, refs=None, n=4, sigma=6.0, backend='vectorized'):
         # set cider to sum over 1 to 4-grams
         self._n = n
         # set the standard deviation parameter for gaussian penalty
         self._sigma = sigma
+        self._backend = backend
+        self._refs_key = None
+        self._refs = None
 
     def compute_score(self, gts, res):
         """
@@ -28,12 +35,13 @@ class Cider:
                 ref_for_image (dict)  : dictionary with key <image> and value <tokenized reference sentence>
         :return: cider (float) : computed CIDEr score for the corpus 
         """
+        return self.compute(self.cook(gts, res))
 
+    def cook(self, gts, res):
+        # n-grams of the hypotheses and references, reference vectors of the vectorized backend
         assert(gts.keys() == res.keys())
         imgIds = gts.keys()
 
-        cider_scorer = CiderScorer(n=self._n, sigma=self._sigma)
-
         for id in imgIds:
             hypo = res[id]
             ref = gts[id]
@@ -44,11 +52,25 @@ class Cider:
             assert(type(ref) is list)
             assert(len(ref) > 0)
 
-            cider_scorer += (hypo[0], ref)
+        if self._backend == 'python':
+            cider_scorer = CiderScorer(n=self._n, sigma=self._sigma)
+            for id in imgIds:
+                cider_scorer += (res[id][0], gts[id])
+            return cider_scorer
 
-        (score, scores) = cider_scorer.compute_score()
+        # reference vectors are rebuilt only when the references change
+        key = [(id, gts[id]) for id in imgIds]
+        if key != self._refs_key:
+            self._refs = CiderReferences([gts[id] for id in imgIds], n=self._n, sigma=self._sigma)
+            self._refs_key = key
+        return self._refs, [res[id][0] for id in imgIds]
 
-        return score, scores
+    def compute(self, cooked):
+        if self._backend == 'python':
+            return cooked.compute_score()
+        refs, hypos = cooked
+        scores = refs.score(hypos)
+        return np.mean(scores), scores
 
     def method(self):
         return "CIDEr"
\ No newline at end of file
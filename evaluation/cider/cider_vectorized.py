@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+#
+# Vectorized CIDEr, computing the same scores as cider_scorer.py.
+#
+# n-grams are interned to integer ids and every sentence becomes a sparse
+# vector stored as flat (sentence, ngram id, order, tf-idf) arrays. The
+# reference vectors, their norms and lengths are built once per set of
+# references (CiderReferences) and the scoring of any number of
+# hypotheses is a join of the hypothesis entries with the reference entries
+# of the same image, followed by bincount reductions for the clipped dot
+# products, the norms, the gaussian length penalty and the averages.
+
+import numpy as np
+from cider_scorer import precook
+
+
+class CiderReferences(object):
+    """TF-IDF vectors of the reference sentences of a set of images.
+
+    refs - list (one entry per image) of lists of tokenized reference sentences,
+           the document frequencies are computed over these images.
+    doc_freq, num_images - document frequencies {ngram: number of images} and
+           number of images of a larger set of images refs is a shard of,
+           used instead of those of refs (see doc_freq below).
+    """
+
+    def __init__(self, refs, n=4, sigma=6.0, doc_freq=None, num_images=None):
+        self.n = n
+        self.sigma = sigma
+        self.num_images = len(refs)
+        self.doc_freq = doc_freq
+        self.vocab = {}  # {ngram: id}
+        self.nrefs = np.array([len(r) for r in refs], dtype=np.int64)
+        self.ref_start = np.concatenate([[0], np.cumsum(self.nrefs)])  # first sentence of each image
+        ref_image = np.repeat(np.arange(self.num_images), self.nrefs)
+
+        sent, gram, order, tf = self._entries([s for r in refs for s in r], intern=True)
+        self.vocab_size = len(self.vocab)
+        if doc_freq is not None:
+            df = np.zeros(self.vocab_size)
+            for ngram, i in self.vocab.iteritems():
+                df[i] = doc_freq.get(ngram, 0)
+        else:
+            # document frequency: number of images whose references contain the ngram
+            pairs = np.unique(ref_image[sent] * self.vocab_size + gram) if len(gram) > 0 else np.zeros(0, dtype=np.int64)
+            df = np.bincount(pairs % self.vocab_size, minlength=self.vocab_size) if self.vocab_size > 0 else np.zeros(0)
+        self.ref_len = np.log(float(self.num_images if num_images is None else num_images))
+        self.idf = self.ref_len - np.log(np.maximum(1.0, df))
+
+        # reference entries sorted by (image, ngram), then sentence
+        weight = tf * self.idf[gram]
+        key = ref_image[sent] * self.vocab_size + gram
+        perm = np.lexsort((sent, key))
+        self.ref_key = key[perm]
+        self.ref_sent = sent[perm]
+        self.ref_order = order[perm]
+        self.ref_weight = weight[perm]
+        num_sents = len(ref_image)
+        self.ref_norm = self._norms(sent, order, weight, num_sents)
+        self.ref_length = self._lengths(sent, order, tf, num_sents)
+
+    def _entries(self, sentences, intern, unknown=None):
+        # flat (sentence, ngram id, order, tf) arrays, ngrams unknown to the vocabulary get id -1
+        # and are appended to the list unknown if given
+        sent, gram, order, tf = [], [], [], []
+        vocab = self.vocab
+        for i, s in enumerate(sentences):
+            counts = precook(s, self.n)
+            ngrams = counts.keys()
+            if intern:
+                gram.extend([vocab.setdefault(ngram, len(vocab)) for ngram in ngrams])
+            else:
+                gram.extend([vocab.get(ngram, -1) for ngram in ngrams])
+                if unknown is not None:
+                    unknown.extend([ngram for ngram in ngrams if ngram not in vocab])
+            sent.extend([i] * len(ngrams))
+            order.extend([len(ngram)-1 for ngram in ngrams])
+            tf.extend(counts.values())
+        return (np.array(sent, dtype=np.int64), np.array(gram, dtype=np.int64),
+                np.array(order, dtype=np.int64), np.array(tf, dtype=np.float64))
+
+    def _norms(self, sent, order, weight, num_sents):
+        return np.sqrt(np.bincount(sent * self.n + order, weight**2, minlength=num_sents * self.n)).reshape(num_sents, self.n)
+
+    def _lengths(self, sent, order, tf, num_sents):
+        # as cider_scorer.counts2vec, the length is the number of bigrams
+        bigram = order == 1
+        return np.bincount(sent[bigram], tf[bigram], minlength=num_sents)
+
+    def score(self, hyps, images=None):
+        """
+        CIDEr of each hypothesis against the references of its image.
+        :param hyps: list of tokenized hypotheses
+        :param images: image (index into refs) of each hypothesis, default: hypothesis i is of image i
+        :return: float array of scores
+        """
+        num_hyps = len(hyps)
+        images = np.arange(num_hyps) if images is None else np.asarray(images, dtype=np.int64)
+        unknown = [] if self.doc_freq is not None else None
+        sent, gram, order, tf = self._entries(hyps, intern=False, unknown=unknown)
+        # ngrams unseen in the references have document frequency 0
+        idf = np.where(gram >= 0, self.idf[np.maximum(gram, 0)] if self.vocab_size > 0 else 0., self.ref_len)
+        if unknown:
+            # unless seen in the references of other shards
+            df = np.array([self.doc_freq.get(ngram, 0) for ngram in unknown], dtype=np.float64)
+            idf[gram < 0] = self.ref_len - np.log(np.maximum(1.0, df))
+        weight = tf * idf
+        hyp_norm = self._norms(sent, order, weight, num_hyps)
+        hyp_length = self._lengths(sent, order, tf, num_hyps)
+
+        # (hypothesis, reference) pairs, the references of an image are consecutive
+        nrefs = self.nrefs[images]
+        pair_start = np.concatenate([[0], np.cumsum(nrefs)])
+        num_pairs = int(pair_start[-1])
+        pair_hyp = np.repeat(np.arange(num_hyps), nrefs)
+        pair_sent = self.ref_start[images][pair_hyp] + (np.arange(num_pairs) - pair_start[pair_hyp])
+
+        # join the hypothesis entries with the reference entries of the same image and ngram
+        known = gram >= 0
+        h_sent, h_order, h_weight = sent[known], order[known], weight[known]
+        key = images[h_sent] * self.vocab_size + gram[known]
+        lo = np.searchsorted(self.ref_key, key, 'left')
+        hi = np.searchsorted(self.ref_key, key, 'right')
+        matches = hi - lo
+        h_index = np.repeat(np.arange(len(key)), matches)
+        r_index = np.repeat(lo, matches) + (np.arange(matches.sum()) - np.repeat(np.cumsum(matches) - matches, matches))
+        r_sent = self.ref_sent[r_index]
+        r_weight = self.ref_weight[r_index]
+        # vrama91 : added clipping
+        contrib = np.minimum(h_weight[h_index], r_weight) * r_weight
+        h = h_sent[h_index]
+        pair = pair_start[h] + r_sent - self.ref_start[images[h]]
+        val = np.bincount(pair * self.n + h_order[h_index], contrib, minlength=num_pairs * self.n).reshape(num_pairs, self.n)
+
+        # cosine similarity, gaussian length penalty
+        denom = hyp_norm[pair_hyp] * self.ref_norm[pair_sent]
+        val = np.where(denom != 0, val / np.where(denom != 0, denom, 1.), val)
+        delta = hyp_length[pair_hyp] - self.ref_length[pair_sent]
+        val *= (np.e**(-(delta**2)/(2*self.sigma**2)))[:, None]
+
+        # mean over n-gram orders, average over the references, times 10
+        pair_score = val.mean(axis=1)
+        return np.bincount(pair_hyp, pair_score, minlength=num_hyps) / nrefs * 10.0
@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import resource
+
+"""
+Per-phase profile of RefEvaluation.evaluate.
+
+RefEvaluation(refer, Res, profile=True) records for each phase (ground-truth
+assembly, tokenization of the hypotheses and of the ground truth, setup,
+cook and compute steps of each scorer, result assembly) its wall and CPU
+time, the number of items it processed and the peak memory, available as
+refEval.profile after evaluate:
+
+    print refEval.profile                  # table of the phases
+    json.dumps(refEval.profile.asDict())   # same as a dict
+    refEval.profile.save('profile.json')
+
+CPU time is the one of this process (user + system), the work of the java
+tokenizer and METEOR processes shows up as wall time. Peak memory is the
+maximum resident set size of the process at the end of the phase, and how
+much the phase raised it.
+
+Without profile=True, RefEvaluation uses NULL_PROFILE whose phases do nothing.
+
+Things of interest
+EvalProfile  - phases of an evaluation
+NULL_PROFILE - profile recording nothing
+"""
+
+
+def _peakRSS():
+    # maximum resident set size of the process in bytes (kilobytes on linux, bytes on mac)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname()[0] == 'Darwin' else peak * 1024
+
+
+class _Phase(object):
+    # context manager of one phase of an EvalProfile
+    def __init__(self, profile, name, count):
+        self.profile = profile
+        self.record = {'name': name, 'count': count}
+
+    def __enter__(self):
+        times = os.times()
+        self.cpu = times[0] + times[1]
+        self.peak = _peakRSS()
+        self.tic = time.time()
+        return self.record
+
+    def __exit__(self, *args):
+        wall = time.time() - self.tic
+        times = os.times()
+        peak = _peakRSS()
+        self.record.update({'wall': wall, 'cpu': times[0] + times[1] - self.cpu,
+                            'peak_rss': peak, 'rss_growth': peak - self.peak})
+        self.profile.phases.append(self.record)
+
+
+class EvalProfile(object):
+    """Wall time, CPU time, item counts and peak memory of named phases."""
+
+    def __init__(self):
+        self.phases = []  # [{name, count, wall, cpu, peak_rss, rss_growth}] in order of completion
+
+    def phase(self, name, count=None):
+        """
+        :param name: name of the phase, e.g. 'CIDEr compute'
+        :param count: number of items processed, can also be set on the dict returned by the with statement
+        """
+        return _Phase(self, name, count)
+
+    def seconds(self, name):
+        # total wall time spent in phases called name
+        return sum(p['wall'] for p in self.phases if p['name'] == name)
+
+    def total(self):
+        return sum(p['wall'] for p in self.phases)
+
+    def asDict(self):
+        return {'phases': [dict(p) for p in self.phases], 'total': self.total(),
+                'peak_rss': max([p['peak_rss'] for p in self.phases] or [0])}
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.asDict(), f, indent=2)
+
+    def __str__(self):
+        lines = ['%-24s %9s %9s %9s %10s %10s' % ('phase', 'wall', 'cpu', 'count', 'peak MB', 'growth MB')]
+        for p in self.phases:
+            lines.append('%-24s %8.3fs %8.3fs %9s %10.1f %10.1f' % (p['name'], p['wall'], p['cpu'],
+                         '' if p['count'] is None else p['count'], p['peak_rss'] / 2.**20, p['rss_growth'] / 2.**20))
+        lines.append('%-24s %8.3fs' % ('total', self.total()))
+        return '\n'.join(lines)
+
+
+class _NullPhase(object):
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, *args):
+        pass
+
+
+class NullProfile(object):
+    """Profile recording nothing, the default of RefEvaluation."""
+
+    _phase = _NullPhase()
+
+    def phase(self, name, count=None):
+        return self._phase
+
+
+NULL_PROFILE = NullProfile()
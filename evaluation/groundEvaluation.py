@@ -0,0 +1,154 @@
+import json
+import multiprocessing
+import numpy as np
+
+"""
+Input: refer and Res = [{ref_id, box}] or [{sent_id, box}], box = [x, y, w, h] or {x, y, w, h}
+
+Comprehension (grounding) evaluation: the IoU of every predicted box with the
+box of its ref (refer.getRefBoxes, the float64 boxes of getRefBox) is computed
+in one vectorized pass in float64, and accuracy is the fraction of predictions
+whose IoU reaches a threshold.
+
+Things of interest
+ious      - float array, IoU of each prediction of Res
+eval      - dict of {metric: score}, metrics 'accuracy@<threshold>' and 'mean_iou'
+splitEval - dict of {split: {metric: score}}
+catEval   - dict of {category name: {metric: score}}
+refToEval - dict of {ref_id: {'ref_id', 'iou'}}, for sentence level Res the mean IoU of the ref's sentences
+"""
+
+THRESHOLDS = [0.5]
+# fewest predictions whose IoUs are computed in a process pool: numpy takes
+# about 8ms for 100k boxes while starting a pool and sending it the boxes
+# takes over 100ms, so smaller evaluations always stay in process
+POOL_MIN_PREDICTIONS = 1000000
+
+
+def loadResults(results_file):
+    """Load Res from a json list of {ref_id or sent_id, box}."""
+    return json.load(open(results_file, 'r'))
+
+
+def boxArray(boxes):
+    # n x 4 float array of [x, y, w, h] lists or {x, y, w, h} dicts
+    boxes = [[box['x'], box['y'], box['w'], box['h']] if type(box) == dict else box for box in boxes]
+    return np.array(boxes, dtype=np.float64).reshape(-1, 4)
+
+
+def boxIoU(a, b):
+    """IoU of the rows of two n x 4 arrays of [x, y, w, h] boxes."""
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    iw = np.minimum(a[:, 0]+a[:, 2], b[:, 0]+b[:, 2]) - np.maximum(a[:, 0], b[:, 0])
+    ih = np.minimum(a[:, 1]+a[:, 3], b[:, 1]+b[:, 3]) - np.maximum(a[:, 1], b[:, 1])
+    inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+    union = a[:, 2]*a[:, 3] + b[:, 2]*b[:, 3] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-12), 0.)
+
+
+def _shardIoU(args):
+    return boxIoU(*args)
+
+
+class GroundEvaluation:
+    def __init__ (self, refer, Res, thresholds=THRESHOLDS):
+        """
+        :param refer: refer class of current dataset
+        :param Res: [{'ref_id', 'box'}] or [{'sent_id', 'box'}]
+        :param thresholds: IoU thresholds of the reported accuracies
+        """
+        self.ious = None
+        self.eval = {}
+        self.splitEval = {}
+        self.catEval = {}
+        self.refToEval = {}
+        self.refer = refer
+        self.Res = Res
+        self.thresholds = thresholds
+
+    def refRows(self):
+        # rows of refer.tables.refs of the predictions
+        tables = self.refer.tables
+        if len(self.Res) > 0 and 'ref_id' not in self.Res[0]:
+            sent_rows = tables.sent_index.rows([res['sent_id'] for res in self.Res], 'sent_id')
+            return tables.sents['ref_row'][sent_rows]
+        return tables.ref_index.rows([res['ref_id'] for res in self.Res], 'ref_id')
+
+    def evaluate(self, num_workers=None):
+        """
+        :param num_workers: if > 1, IoUs of at least POOL_MIN_PREDICTIONS predictions are computed
+                            in a process pool, sharded by image
+        """
+        tables = self.refer.tables
+        rows = self.refRows()
+        ref_ids = tables.refs['ref_id'][rows]
+        pred = boxArray([res['box'] for res in self.Res])
+        gt = self.refer.getRefBoxes(ref_ids)
+
+        if num_workers is not None and num_workers > 1 and len(rows) >= POOL_MIN_PREDICTIONS:
+            shards = tables.refs['image_id'][rows] % num_workers
+            shard_rows = [np.nonzero(shards == s)[0] for s in range(num_workers)]
+            pool = multiprocessing.Pool(num_workers)
+            try:
+                shard_ious = pool.map(_shardIoU, [(pred[r], gt[r]) for r in shard_rows])
+            finally:
+                pool.terminate()
+            self.ious = np.zeros(len(rows))
+            for r, ious in zip(shard_rows, shard_ious):
+                self.ious[r] = ious
+        else:
+            self.ious = boxIoU(pred, gt)
+
+        self.eval = self.metrics(self.ious)
+        # break down by split and category
+        splits = tables.refs['split'][rows]
+        for code, name in enumerate(tables.split_names):
+            if (splits == code).any():
+                self.splitEval[name] = self.metrics(self.ious[splits == code])
+        cats = tables.refs['category_id'][rows]
+        for cat_id in np.unique(cats).tolist():
+            self.catEval[self.refer.Cats[cat_id]] = self.metrics(self.ious[cats == cat_id])
+
+        # mean IoU per ref
+        unique_ids, inverse = np.unique(ref_ids, return_inverse=True)
+        ref_ious = np.bincount(inverse, self.ious) / np.bincount(inverse)
+        self.refToEval = {ref_id: {'ref_id': ref_id, 'iou': iou}
+                          for ref_id, iou in zip(unique_ids.tolist(), ref_ious.tolist())}
+
+        for metric, score in sorted(self.eval.items()):
+            print "%s: %0.3f"%(metric, score)
+
+    def metrics(self, ious):
+        scores = {'mean_iou': float(ious.mean()) if len(ious) > 0 else 0.}
+        for threshold in self.thresholds:
+            scores['accuracy@%s' % threshold] = float((ious >= threshold).mean()) if len(ious) > 0 else 0.
+        return scores
+
+
+if __name__ == '__main__':
+
+    import os.path as osp
+    import sys
+    import time
+    import argparse
+    ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), '..'))
+    sys.path.insert(0, ROOT_DIR)
+    from refer import REFER
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_root', default=osp.join(ROOT_DIR, 'data'), help='folder containing the datasets')
+    parser.add_argument('--dataset', default='refcoco', help='refclef, refcoco, refcoco+ or refcocog')
+    parser.add_argument('--splitBy', default='unc', help='unc, google, umd or berkeley')
+    parser.add_argument('--results', required=True, help='json list of {ref_id or sent_id, box}')
+    parser.add_argument('--thresholds', default='0.5', help='comma separated IoU thresholds')
+    parser.add_argument('--num_workers', default=None, type=int, help='processes computing IoUs of large results')
+    args = parser.parse_args()
+
+    refer = REFER(args.data_root, args.dataset, args.splitBy)
+    tic = time.time()
+    groundEval = GroundEvaluation(refer, loadResults(args.results), [float(t) for t in args.thresholds.split(',')])
+    groundEval.evaluate(args.num_workers)
+    for split, scores in sorted(groundEval.splitEval.items()):
+        print '%-8s %s' % (split, ' '.join('%s: %.3f' % (m, s) for m, s in sorted(scores.items())))
+    print 'evaluated %d predictions (t=%.2fs)' % (len(groundEval.ious), time.time()-tic)
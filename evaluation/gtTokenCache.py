@@ -0,0 +1,100 @@
+import os
+import os.path as osp
+import random
+import cPickle as pickle
+import index_cache
+
+"""
+Cache of the tokenized ground-truth sentences of a dataset.
+
+RefEvaluation tokenizes the ground-truth sentences of the evaluated refs on
+every run although they never change. Here each sentence is tokenized once
+per (dataset, splitBy, tokenizer), the results are kept in
+refer.CACHE_DIR/gt_tokens_<dataset>_<splitBy>_<tokenizer>.p keyed by sent_id,
+and every evaluation only tokenizes its hypotheses.
+
+The cache is rebuilt when refs(splitBy).p changes, or when the current
+tokenizer no longer reproduces it: the first use in a process tokenizes a
+few probe sentences and a sample of the cached ones again and compares.
+The cache then stays in memory for the next evaluations of the process.
+
+Things of interest
+loadGTTokens - {sent_id: tokenized sentence} of all sentences of a refer
+"""
+
+CACHE_VERSION = 2
+# sentences tokenized again to verify a cache
+PROBES = ["The man's shirt (left).", "don't pick the grey one...", '"big" dog -- right, 2nd']
+NUM_VERIFIED = 50
+
+# {path: cache} loaded and verified in this process
+_caches = {}
+
+
+def gtSentence(sent):
+    # ground-truth sentence as RefEvaluation feeds it to the tokenizer
+    return sent['sent'].encode('ascii', 'ignore').decode('ascii')
+
+
+def cachePath(refer, tokenizer_name):
+    return osp.join(refer.CACHE_DIR, 'gt_tokens_%s_%s_%s.p' % (refer.data['dataset'], refer.splitBy, tokenizer_name))
+
+
+def sourceStamp(refer):
+    # size and float mtime of refs(splitBy).p, stamped like the sources of the compiled index
+    return index_cache.sourceStamp([osp.join(refer.DATA_DIR, 'refs(%s).p' % refer.splitBy)])
+
+
+def tokenizeSentences(tokenizer, sentences):
+    # {key: tokenized sentence} of {key: sentence}
+    tokens = tokenizer.tokenize(dict((key, [sent]) for key, sent in sentences.items()))
+    return dict((key, value[0]) for key, value in tokens.items())
+
+
+def loadGTTokens(refer, tokenizer_name, tokenizer):
+    """
+    :param refer: refer class of current dataset
+    :param tokenizer_name: name of the tokenizer backend, part of the cache key
+    :param tokenizer: tokenizer instance, used to fill and verify the cache
+    :return: {sent_id: tokenized sentence}, for all sentences of refer
+    """
+    path = cachePath(refer, tokenizer_name)
+    cache = _caches.get(path)
+    verified = cache is not None
+    if cache is None and osp.isfile(path):
+        with open(path, 'rb') as f:
+            cache = pickle.load(f)
+    if cache is not None and (cache.get('version') != CACHE_VERSION or cache['sources'] != sourceStamp(refer)):
+        cache = None
+    if cache is not None and not verified:
+        sample = random.Random(0).sample(sorted(cache['tokens']), min(NUM_VERIFIED, len(cache['tokens'])))
+        sentences = dict(('probe%d' % i, probe) for i, probe in enumerate(PROBES))
+        sentences.update((sent_id, gtSentence(refer.Sents[sent_id])) for sent_id in sample if sent_id in refer.Sents)
+        expected = dict(('probe%d' % i, tokens) for i, tokens in enumerate(cache['probes']))
+        expected.update((sent_id, cache['tokens'][sent_id]) for sent_id in sentences if sent_id in cache['tokens'])
+        if tokenizeSentences(tokenizer, sentences) != expected:
+            print 'ground-truth tokens in %s differ from the current tokenizer, rebuilding' % path
+            cache = None
+    if cache is None:
+        probes = tokenizeSentences(tokenizer, dict(enumerate(PROBES)))
+        cache = {'version': CACHE_VERSION, 'sources': sourceStamp(refer),
+                 'probes': [probes[i] for i in range(len(PROBES))], 'tokens': {}}
+
+    # tokenize the sentences that are not cached yet, all of them the first time
+    tokens = cache['tokens']
+    missing = dict((sent_id, gtSentence(refer.Sents[sent_id])) for sent_id in refer.tables.sents['sent_id'].tolist()
+                   if sent_id not in tokens)
+    if len(missing) > 0:
+        print 'tokenizing %d ground-truth sentences into %s...' % (len(missing), path)
+        cache['tokens'].update(tokenizeSentences(tokenizer, missing))
+        try:
+            if not osp.isdir(osp.dirname(path)):
+                os.makedirs(osp.dirname(path))
+            tmp = '%s.tmp%d' % (path, os.getpid())
+            with open(tmp, 'wb') as f:
+                pickle.dump(cache, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, path)
+        except (IOError, OSError) as e:
+            print 'could not write ground-truth tokens to %s: %s' % (path, e)
+    _caches[path] = cache
+    return cache['tokens']
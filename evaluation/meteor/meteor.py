@@ -1,76 +1,201 @@
 #!/usr/bin/env python
 
 # Python wrapper for METEOR implementation, by Xinlei Chen
-# Acknowledge Michael Denkowski for the generous discussion and help 
+# Acknowledge Michael Denkowski for the generous discussion and help
 
 import os
 import sys
+import time
 import subprocess
 import threading
+import atexit
+import weakref
 
 # Assumes meteor-1.5.jar is in the same directory as meteor.py.  Change as needed.
 METEOR_JAR = 'meteor-1.5.jar'
 # print METEOR_JAR
 
+# seconds a worker is given to exit at close() before it is killed
+CLOSE_TIMEOUT = 10
+
+# Meteor instances not closed yet, their JVMs are stopped at exit
+_instances = weakref.WeakSet()
+
+def _closeAll():
+    for meteor in list(_instances):
+        meteor.close()
+
+atexit.register(_closeAll)
+
+def _waitOrKill(p, timeout):
+    # wait for the process to exit, kill it after timeout seconds
+    deadline = time.time() + timeout
+    while p.poll() is None and time.time() < deadline:
+        time.sleep(0.05)
+    if p.poll() is None:
+        p.kill()
+        p.wait()
+
 class Meteor:
+    """METEOR scorer backed by num_workers METEOR processes.
+
+    compute_score sends the SCORE lines of the segments to all workers at
+    once, each worker getting a contiguous shard and all its lines without
+    waiting for the answers, then sends the statistics of all segments in
+    one EVAL line to the first worker, so the corpus score is the one of a
+    single process. Use as a context manager or call close() to stop the
+    JVMs.
+    """
 
-    def __init__(self):
+    def __init__(self, num_workers=1):
         self.meteor_cmd = ['java', '-jar', '-Xmx2G', METEOR_JAR, \
                 '-', '-', '-stdio', '-l', 'en', '-norm']
-        self.meteor_p = subprocess.Popen(self.meteor_cmd, \
-                cwd=os.path.dirname(os.path.abspath(__file__)), \
-                stdin=subprocess.PIPE, \
-                stdout=subprocess.PIPE, \
-                stderr=subprocess.PIPE)
-        # Used to guarantee thread safety
-        self.lock = threading.Lock()
+        self.workers = []
+        # Used to guarantee thread safety, one lock per worker
+        self.locks = []
+        # stderr of the workers, closed with them
+        self.devnull = open(os.devnull, 'w')
+        _instances.add(self)
+        for _ in range(max(1, num_workers)):
+            self.workers.append(subprocess.Popen(self.meteor_cmd, \
+                    cwd=os.path.dirname(os.path.abspath(__file__)), \
+                    stdin=subprocess.PIPE, \
+                    stdout=subprocess.PIPE, \
+                    stderr=self.devnull))
+            self.locks.append(threading.Lock())
+        self.meteor_p = self.workers[0]
+        self.lock = self.locks[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
 
     def compute_score(self, gts, res):
+        return self.compute(self.cook(gts, res))
+
+    def cook(self, gts, res):
+        # statistics of the segments, computed by the METEOR processes
         assert(gts.keys() == res.keys())
         imgIds = gts.keys()
-        scores = []
 
-        eval_line = 'EVAL'
-        self.lock.acquire()
         for i in imgIds:
             assert(len(res[i]) == 1)
-            stat = self._stat(res[i][0], gts[i])
-            eval_line += ' ||| {}'.format(stat)
+        return self.compute_stats([gts[i] for i in imgIds], [res[i][0] for i in imgIds])
 
-        self.meteor_p.stdin.write('{}\n'.format(eval_line))
-        for i in range(0,len(imgIds)):
-            scores.append(float(self.meteor_p.stdout.readline().strip()))
-        score = float(self.meteor_p.stdout.readline().strip())
-        self.lock.release()
+    def compute(self, stats):
+        return self.eval_stats(stats)
+
+    def compute_stats(self, gts, res):
+        """
+        METEOR statistics of each segment.
+        :param gts: list of lists of reference sentences
+        :param res: list of hypotheses, one per entry of gts
+        :return: list of statistics lines
+        """
+        score_lines = [self._scoreLine(hypo, refs) for hypo, refs in zip(res, gts)]
+
+        # SCORE lines of a contiguous shard per worker, scored concurrently
+        n = len(self.workers)
+        bounds = [len(score_lines)*k//n for k in range(n+1)]
+        shard_stats = [None] * n
+        threads = [threading.Thread(target=self._stats, args=(k, score_lines[bounds[k]:bounds[k+1]], shard_stats)) \
+                for k in range(n) if bounds[k] < bounds[k+1]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = []
+        for k in range(n):
+            if bounds[k] < bounds[k+1]:
+                if shard_stats[k] is None:
+                    raise IOError('METEOR worker %d failed' % k)
+                stats += shard_stats[k]
+        return stats
+
+    def eval_stats(self, stats):
+        """
+        :param stats: list of statistics lines of compute_stats
+        :return: corpus score of the segments and list of segment scores
+        """
+        # EVAL ||| stats 1 ||| ... ||| stats n, answered by the segment scores then the corpus score
+        eval_line = 'EVAL'
+        for stat in stats:
+            eval_line += ' ||| {}'.format(stat)
+        with self.lock:
+            self.meteor_p.stdin.write('{}\n'.format(eval_line))
+            self.meteor_p.stdin.flush()
+            scores = []
+            for i in range(0,len(stats)):
+                scores.append(float(self.meteor_p.stdout.readline().strip()))
+            score = float(self.meteor_p.stdout.readline().strip())
 
         return score, scores
 
     def method(self):
         return "METEOR"
 
-    def _stat(self, hypothesis_str, reference_list):
+    def _scoreLine(self, hypothesis_str, reference_list):
         # SCORE ||| reference 1 words ||| reference n words ||| hypothesis words
         hypothesis_str = hypothesis_str.replace('|||','').replace('  ',' ')
-        score_line = ' ||| '.join(('SCORE', ' ||| '.join(reference_list), hypothesis_str))
-        self.meteor_p.stdin.write('{}\n'.format(score_line))
+        return ' ||| '.join(('SCORE', ' ||| '.join(reference_list), hypothesis_str))
+
+    def _stats(self, k, score_lines, out):
+        # statistics of score_lines from worker k, all lines are written by another
+        # thread while the answers are read, so that neither pipe can fill up
+        p = self.workers[k]
+        with self.locks[k]:
+            writer = threading.Thread(target=self._write, args=(p, ''.join('{}\n'.format(line) for line in score_lines)))
+            writer.start()
+            stats = []
+            for _ in score_lines:
+                line = p.stdout.readline()
+                if line == '':
+                    break  # the worker exited
+                stats.append(line.strip())
+            writer.join()
+        if len(stats) == len(score_lines):
+            out[k] = stats
+
+    def _write(self, p, data):
+        try:
+            p.stdin.write(data)
+            p.stdin.flush()
+        except IOError:
+            pass  # the reader sees the worker exit
+
+    def _stat(self, hypothesis_str, reference_list):
+        self.meteor_p.stdin.write('{}\n'.format(self._scoreLine(hypothesis_str, reference_list)))
+        self.meteor_p.stdin.flush()
         return self.meteor_p.stdout.readline().strip()
 
     def _score(self, hypothesis_str, reference_list):
         self.lock.acquire()
-        # SCORE ||| reference 1 words ||| reference n words ||| hypothesis words
-        hypothesis_str = hypothesis_str.replace('|||','').replace('  ',' ')
-        score_line = ' ||| '.join(('SCORE', ' ||| '.join(reference_list), hypothesis_str))
-        self.meteor_p.stdin.write('{}\n'.format(score_line))
-        stats = self.meteor_p.stdout.readline().strip()
+        stats = self._stat(hypothesis_str, reference_list)
         eval_line = 'EVAL ||| {}'.format(stats)
-        # EVAL ||| stats 
+        # EVAL ||| stats
         self.meteor_p.stdin.write('{}\n'.format(eval_line))
+        self.meteor_p.stdin.flush()
         score = float(self.meteor_p.stdout.readline().strip())
         self.lock.release()
         return score
- 
-    def __exit__(self):
-        self.lock.acquire()
-        self.meteor_p.stdin.close()
-        self.meteor_p.wait()
-        self.lock.release()
+
+    def close(self):
+        # stop the workers, each exits at the end of its input
+        for p, lock in zip(getattr(self, 'workers', []), getattr(self, 'locks', [])):
+            with lock:
+                if p.poll() is None:
+                    try:
+                        p.stdin.close()
+                    except IOError:
+                        pass
+                    _waitOrKill(p, CLOSE_TIMEOUT)
+                if p.stdout is not None:
+                    p.stdout.close()
+        if getattr(self, 'devnull', None) is not None:
+            self.devnull.close()
+            self.devnull = None
@@ -1,8 +1,12 @@
 from tokenizer.ptbtokenizer import PTBTokenizer
+from tokenizer.pytokenizer import PyPTBTokenizer
+from gtTokenCache import loadGTTokens
 from bleu.bleu import Bleu
 from meteor.meteor import Meteor
 from rouge.rouge import Rouge
 from cider.cider import Cider
+from shardedScoring import computeScores
+from evalProfile import EvalProfile, NULL_PROFILE
 
 """
 Input: refer and Res = [{ref_id, sent}]
@@ -11,63 +15,122 @@ Things of interest
 evalRefs  - list of ['ref_id', 'CIDEr', 'Bleu_1', 'Bleu_2', 'Bleu_3', 'Bleu_4', 'ROUGE_L', 'METEOR']
 eval      - dict of {metric: score}
 refToEval - dict of {ref_id: ['ref_id', 'CIDEr', 'Bleu_1', 'Bleu_2', 'Bleu_3', 'Bleu_4', 'ROUGE_L', 'METEOR']}
+profile   - EvalProfile of the phases of evaluate if profile=True (see evalProfile.py)
 """
 
+# tokenizer backends: Stanford PTBTokenizer (needs java) or its in-process port
+TOKENIZERS = {'java': PTBTokenizer, 'python': PyPTBTokenizer}
+
 class RefEvaluation:
-    def __init__ (self, refer, Res):
+    def __init__ (self, refer, Res, tokenizer='java', gt_cache=True, meteor_workers=1, num_workers=1, profile=False):
         """
         :param refer: refer class of current dataset
         :param Res: [{'ref_id', 'sent'}]
+        :param tokenizer: 'java' or 'python', see TOKENIZERS
+        :param gt_cache: take the tokenized ground truth from the cache of gtTokenCache.py
+        :param meteor_workers: number of METEOR processes scoring in parallel
+        :param num_workers: if > 1, the scorers run concurrently and the refs are sharded
+                            across num_workers processes, see shardedScoring.py
+        :param profile: record the time, CPU time and memory of each phase of evaluate in self.profile
         """
         self.evalRefs = []
         self.eval = {}
         self.refToEval = {}
         self.refer = refer
         self.Res = Res
+        self.tokenizer = tokenizer
+        self.gt_cache = gt_cache
+        self.meteor_workers = meteor_workers
+        self.num_workers = num_workers
+        self.profile = EvalProfile() if profile else NULL_PROFILE
 
     def evaluate(self):
+        profile = self.profile
 
         evalRefIds = [ann['ref_id'] for ann in self.Res]
 
-        refToGts = {}
-        for ref_id in evalRefIds:
-            ref = self.refer.Refs[ref_id]
-            gt_sents = [sent['sent'].encode('ascii', 'ignore').decode('ascii') for sent in ref['sentences']]  # up to 3 expressions
-            refToGts[ref_id] = gt_sents
         refToRes = {ann['ref_id']: [ann['sent']] for ann in self.Res}
 
         print 'tokenization...'
-        tokenizer = PTBTokenizer()
-        self.refToRes = tokenizer.tokenize(refToRes)
-        self.refToGts = tokenizer.tokenize(refToGts)
+        tokenizer = TOKENIZERS[self.tokenizer]()
+        with profile.phase('tokenize res', len(refToRes)):
+            self.refToRes = tokenizer.tokenize(refToRes)
+        if self.gt_cache:
+            # the ground truth is tokenized once per dataset and tokenizer
+            with profile.phase('tokenize gts') as phase:
+                gtTokens = loadGTTokens(self.refer, self.tokenizer, tokenizer)
+                phase['count'] = len(gtTokens)
+            # inserted in the order the tokenizer inserted the hypotheses, the scorers
+            # expect refToGts.keys() == refToRes.keys()
+            with profile.phase('gt assembly', len(refToRes)):
+                self.refToGts = {}
+                for ref_id in refToRes:
+                    ref = self.refer.Refs[ref_id]
+                    self.refToGts[ref_id] = [gtTokens[sent['sent_id']] for sent in ref['sentences']]
+        else:
+            with profile.phase('gt assembly', len(evalRefIds)):
+                refToGts = {}
+                for ref_id in evalRefIds:
+                    ref = self.refer.Refs[ref_id]
+                    gt_sents = [sent['sent'].encode('ascii', 'ignore').decode('ascii') for sent in ref['sentences']]  # up to 3 expressions
+                    refToGts[ref_id] = gt_sents
+            with profile.phase('tokenize gts', sum(len(sents) for sents in refToGts.values())):
+                self.refToGts = tokenizer.tokenize(refToGts)
+        numRefs = len(self.refToGts)
+
+        if self.num_workers > 1:
+            print 'computing scores with %d processes...'%(self.num_workers)
+            with profile.phase('sharded scoring', numRefs):
+                results = computeScores(self.refToGts, self.refToRes, self.num_workers, self.meteor_workers)
+            with profile.phase('result assembly', numRefs):
+                for score, scores, method in results:
+                    self.setScores(score, scores, method)
+                self.setEvalRefs()
+            return
 
         # =================================================
         # Set up scorers
         # =================================================
         print 'setting up scorers...'
-        scorers = [
-            (Bleu(4), ["Bleu_1", "Bleu_2", "Bleu_3", "Bleu_4"]),
-            (Meteor(),"METEOR"),
-            (Rouge(), "ROUGE_L"),
-            (Cider(), "CIDEr")
-        ]
+        scorers = []
+        for scorer_class, args, method in [
+            (Bleu, (4,), ["Bleu_1", "Bleu_2", "Bleu_3", "Bleu_4"]),
+            (Meteor, (self.meteor_workers,), "METEOR"),
+            (Rouge, (), "ROUGE_L"),
+            (Cider, (), "CIDEr")
+        ]:
+            with profile.phase('setup') as phase:
+                scorer = scorer_class(*args)
+                phase['name'] = '%s setup' % scorer.method()
+            scorers.append((scorer, method))
 
         # =================================================
         # Compute scores
         # =================================================
         for scorer, method in scorers:
             print 'computing %s score...'%(scorer.method())
-            score, scores = scorer.compute_score(self.refToGts, self.refToRes)
-            if type(method) == list:
-                for sc, scs, m in zip(score, scores, method):
-                    self.setEval(sc, m)
-                    self.setRefToEvalRefs(scs, self.refToGts.keys(), m)
-                    print "%s: %0.3f"%(m, sc)
-            else:
-                self.setEval(score, method)
-                self.setRefToEvalRefs(scores, self.refToGts.keys(), method)
-                print "%s: %0.3f"%(method, score)
-        self.setEvalRefs()
+            with profile.phase('%s cook' % scorer.method(), numRefs):
+                cooked = scorer.cook(self.refToGts, self.refToRes)
+            with profile.phase('%s compute' % scorer.method(), numRefs):
+                score, scores = scorer.compute(cooked)
+            with profile.phase('%s results' % scorer.method(), numRefs):
+                self.setScores(score, scores, method)
+            if hasattr(scorer, 'close'):
+                with profile.phase('%s close' % scorer.method()):
+                    scorer.close()  # stop the METEOR processes
+        with profile.phase('result assembly', numRefs):
+            self.setEvalRefs()
+
+    def setScores(self, score, scores, method):
+        if type(method) == list:
+            for sc, scs, m in zip(score, scores, method):
+                self.setEval(sc, m)
+                self.setRefToEvalRefs(scs, self.refToGts.keys(), m)
+                print "%s: %0.3f"%(m, sc)
+        else:
+            self.setEval(score, method)
+            self.setRefToEvalRefs(scores, self.refToGts.keys(), method)
+            print "%s: %0.3f"%(method, score)
 
     def setEval(self, score, method):
         self.eval[method] = score
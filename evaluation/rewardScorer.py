@@ -0,0 +1,104 @@
+import numpy as np
+from cider.cider_vectorized import CiderReferences
+from bleu.bleu_scorer import cook_refs
+from bleu.bleu_scorer import precook as bleu_precook
+from refEvaluation import TOKENIZERS
+from gtTokenCache import loadGTTokens
+
+"""
+Input: refer, split and {metric: weight}, then batches of (ref_ids, candidates)
+
+Reward scorer for self-critical training: K candidate expressions (sampled
+and greedy) of each ref are scored against the ground truth of the ref. The
+scorer is primed once with the tokenized ground truth of a split: the CIDEr
+reference vectors and document frequencies of the whole split (see
+cider/cider_vectorized.py) and the BLEU reference n-gram counts. A batch
+then only processes its candidates.
+
+Scores are those of Cider and Bleu for one candidate per ref against the
+refs of the split (BLEU per sentence, 'closest' reference length).
+
+Things of interest
+score     - (N, K) matrix of the weighted sum of the metrics
+scoreAll  - dict of {metric: (N, K) matrix}
+"""
+
+BLEU_METRICS = ['Bleu_1', 'Bleu_2', 'Bleu_3', 'Bleu_4']
+
+class RewardScorer:
+    def __init__ (self, refer, split='train', metrics={'CIDEr': 1.0}, tokenizer='java', ref_ids=None):
+        """
+        :param refer: refer class of current dataset
+        :param split: split whose ground truth is loaded (ignored if ref_ids is given)
+        :param metrics: {metric: weight} of the reward, metrics 'CIDEr', 'Bleu_1', ..., 'Bleu_4'
+        :param tokenizer: tokenizer of the ground truth, 'java' or 'python' (see TOKENIZERS),
+                          the default of RefEvaluation so that rewards match its scores
+        :param ref_ids: refs whose ground truth is loaded
+        """
+        for metric in metrics:
+            if metric != 'CIDEr' and metric not in BLEU_METRICS:
+                raise KeyError('unknown metric %s, expected CIDEr or one of %s' % (metric, BLEU_METRICS))
+        self.metrics = metrics
+        self.tokenizer = TOKENIZERS[tokenizer]()
+        ref_ids = refer.getRefIds(split=split) if ref_ids is None else ref_ids
+        gtTokens = loadGTTokens(refer, tokenizer, self.tokenizer)
+        gts = [[gtTokens[sent['sent_id']] for sent in refer.Refs[ref_id]['sentences']] for ref_id in ref_ids]
+        self.refToRow = dict((ref_id, i) for i, ref_id in enumerate(ref_ids))
+        self.cider = CiderReferences(gts) if 'CIDEr' in metrics else None
+        self.bleuRefs = [cook_refs(refs) for refs in gts] if any(m in BLEU_METRICS for m in metrics) else None
+
+    def score(self, ref_ids, candidates, tokenize=False):
+        """
+        :param ref_ids: N ref ids of the batch
+        :param candidates: N lists of K candidate expressions
+        :param tokenize: tokenize the candidates first, they are used as is by default
+        :return: (N, K) float array, sum of the weighted metrics
+        """
+        scores = self.scoreAll(ref_ids, candidates, tokenize)
+        return sum(weight * scores[metric] for metric, weight in self.metrics.items())
+
+    def scoreAll(self, ref_ids, candidates, tokenize=False):
+        N = len(ref_ids)
+        K = len(candidates[0]) if N > 0 else 0
+        if len(candidates) != N:
+            raise ValueError('expected %d lists of candidates, one per ref, got %d' % (N, len(candidates)))
+        for ref_id, cands in zip(ref_ids, candidates):
+            if len(cands) != K:
+                raise ValueError('expected %d candidates per ref, got %d for ref %s' % (K, len(cands), ref_id))
+        rows = np.repeat([self.refToRow[ref_id] for ref_id in ref_ids], K).astype(np.int64)
+        flat = [c for cands in candidates for c in cands]
+        if tokenize:
+            tokens = self.tokenizer.tokenize(dict((i, [c]) for i, c in enumerate(flat)))
+            flat = [tokens[i][0] for i in range(len(flat))]
+
+        scores = {}
+        if self.cider is not None:
+            scores['CIDEr'] = self.cider.score(flat, rows).reshape(N, K)
+        if self.bleuRefs is not None:
+            bleus = self.bleu(flat, rows)
+            for k, metric in enumerate(BLEU_METRICS):
+                scores[metric] = bleus[:, k].reshape(N, K)
+        return scores
+
+    def bleu(self, hyps, rows, n=4):
+        # per sentence BLEU-1..n of hyps against the references of rows, as BleuScorer
+        small = 1e-9
+        tiny = 1e-15 ## so that if guess is 0 still return 0
+        correct = np.zeros((len(hyps), n))
+        testlen = np.zeros(len(hyps))
+        reflen = np.zeros(len(hyps))
+        for i, (hyp, row) in enumerate(zip(hyps, rows)):
+            reflens, maxcounts = self.bleuRefs[row]
+            length, counts = bleu_precook(hyp, n)
+            testlen[i] = length
+            reflen[i] = min((abs(l-length), l) for l in reflens)[1]
+            for ngram, count in counts.iteritems():
+                correct[i, len(ngram)-1] += min(maxcounts.get(ngram, 0), count)
+        guess = np.maximum(0, testlen[:, None] - np.arange(n))
+        bleu = np.cumprod((correct + tiny) / (guess + small), axis=1) ** (1. / np.arange(1, n+1))
+        ratio = (testlen + tiny) / (reflen + small) ## N.B.: avoid zero division
+        penalty = np.where(ratio < 1, np.exp(1 - 1 / np.minimum(ratio, 1)), 1.)
+        return bleu * penalty[:, None]
+
+    def close(self):
+        self.tokenizer.close()
@@ -8,6 +8,7 @@
 # Author : Ramakrishna Vedantam <vrama91@vt.edu>
 
 import numpy as np
+from rouge_vectorized import rouge_l
 import pdb
 
 def my_lcs(string, sub):
@@ -37,10 +38,13 @@ class Rouge():
     '''
     Class for computing ROUGE-L score for a set of candidate sentences for the MS COCO test set
 
+    backend 'vectorized' (rouge_vectorized.py) scores all the pairs at once,
+    'python' calls calc_score for each image.
     '''
-    def __init__(self):
+    def __init__(self, backend='vectorized'):
         # vrama91: updated the value below based on discussion with Hovey
         self.beta = 1.2
+        self._backend = backend
 
     def calc_score(self, candidate, refs):
         """
@@ -82,22 +86,32 @@ class Rouge():
         :param ref_for_image: dict : reference MS-COCO sentences with "image name" key and "tokenized sentences" as values
         :returns: average_score: float (mean ROUGE-L score computed by averaging scores for all the images)
         """
+        return self.compute(self.cook(gts, res))
+
+    def cook(self, gts, res):
+        # candidates and references in the order of the images
         assert(gts.keys() == res.keys())
         imgIds = gts.keys()
 
-        score = []
         for id in imgIds:
             hypo = res[id]
             ref  = gts[id]
 
-            score.append(self.calc_score(hypo, ref))
-
             # Sanity check.
             assert(type(hypo) is list)
             assert(len(hypo) == 1)
             assert(type(ref) is list)
             assert(len(ref) > 0)
 
+        return [res[id] for id in imgIds], [gts[id] for id in imgIds]
+
+    def compute(self, cooked):
+        hypos, refs = cooked
+        if self._backend == 'python':
+            score = [self.calc_score(hypo, ref) for hypo, ref in zip(hypos, refs)]
+        else:
+            score = rouge_l([hypo[0] for hypo in hypos], refs, self.beta)
+
         average_score = np.mean(np.array(score))
         return average_score, np.array(score)
 
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+#
+# Batched ROUGE-L, computing the same scores as rouge.py.
+#
+# Tokens are interned to integers and the longest common subsequence of all
+# (candidate, reference) pairs of an evaluation is computed at once with the
+# bit-parallel algorithm of Hyyro (2004): the shorter sequence of a pair is a
+# bit vector V (one 64 bit word per pair, O(min(m, n)) memory), updated for
+# each token y of the longer one by U = V & match(y), V = (V + U) | (V - U);
+# the LCS length is the number of zero bits of V. Pairs whose shorter
+# sequence has more than 64 tokens use python integers as bit vectors.
+
+import itertools
+import numpy as np
+
+WORD_BITS = 64
+ALL_ONES = np.uint64(np.iinfo(np.uint64).max)
+# pairs processed at once, bounds the memory of the match masks
+BATCH_PAIRS = 8192
+# number of set bits of each byte
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+
+def intern_tokens(sentences, vocab):
+    # token ids of sentences split as rouge.py does, new tokens are added to vocab
+    return [[vocab.setdefault(token, len(vocab)) for token in sentence.split(" ")] for sentence in sentences]
+
+
+def _lcs_bits(a, b):
+    # LCS length of one pair, a bit vector of len(a) bits as a python integer
+    masks = {}
+    for i, token in enumerate(a):
+        masks[token] = masks.get(token, 0) | (1 << i)
+    full = (1 << len(a)) - 1
+    v = full
+    for token in b:
+        u = v & masks.get(token, 0)
+        v = ((v + u) | (v - u)) & full
+    return len(a) - bin(v).count('1')
+
+
+def lcs_lengths(seqs_a, seqs_b):
+    """
+    Length of the longest common subsequence of each pair of token id sequences.
+    :param seqs_a: list of lists of int
+    :param seqs_b: list of lists of int, same length as seqs_a
+    :return: int array of LCS lengths
+    """
+    num_pairs = len(seqs_a)
+    lcs = np.zeros(num_pairs, dtype=np.int64)
+    # the shorter sequence of each pair is the bit vector
+    shorter, longer = [], []
+    for a, b in zip(seqs_a, seqs_b):
+        if len(a) > len(b):
+            a, b = b, a
+        shorter.append(a)
+        longer.append(b)
+    len_short = np.array([len(a) for a in shorter], dtype=np.int64)
+    len_long = np.array([len(b) for b in longer], dtype=np.int64)
+    for p in np.flatnonzero(len_short > WORD_BITS):
+        lcs[p] = _lcs_bits(shorter[p], longer[p])
+
+    # pairs of similar lengths together, BATCH_PAIRS at a time
+    words = np.flatnonzero((len_short > 0) & (len_short <= WORD_BITS))
+    words = words[np.argsort(len_long[words], kind='mergesort')]
+    for start in range(0, len(words), BATCH_PAIRS):
+        batch = words[start:start+BATCH_PAIRS]
+        lcs[batch] = _lcs_words([shorter[p] for p in batch], [longer[p] for p in batch],
+                                len_short[batch], len_long[batch])
+    return lcs
+
+
+def _lcs_words(shorter, longer, len_short, len_long):
+    # LCS lengths of pairs whose shorter sequence fits in a 64 bit word
+    num_pairs = len(shorter)
+    # padded token ids, -1 and -2 never match
+    pad_a = _padded(shorter, len_short, -1)
+    pad_b = _padded(longer, len_long, -2)
+
+    # match[row, j]: bits of the positions of the shorter sequence equal to token j of the longer one
+    match = np.zeros(pad_b.shape, dtype=np.uint64)
+    for i in range(pad_a.shape[1]):
+        match |= (pad_a[:, i:i+1] == pad_b).astype(np.uint64) << np.uint64(i)
+
+    v = np.full(num_pairs, ALL_ONES, dtype=np.uint64)
+    for j in range(pad_b.shape[1]):
+        u = v & match[:, j]
+        v = (v + u) | (v - u)
+    # zero bits among the len_short low bits
+    v &= ALL_ONES >> (WORD_BITS - len_short).astype(np.uint64)
+    ones = POPCOUNT[v.view(np.uint8)].reshape(num_pairs, 8).sum(axis=1)
+    return len_short - ones
+
+
+def _padded(seqs, lengths, fill):
+    # (len(seqs), max length) array of the sequences, padded with fill
+    pad = np.full((len(seqs), lengths.max()), fill, dtype=np.int64)
+    rows = np.repeat(np.arange(len(seqs)), lengths)
+    cols = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    pad[rows, cols] = list(itertools.chain.from_iterable(seqs))
+    return pad
+
+
+def rouge_l(candidates, refs, beta=1.2):
+    """
+    ROUGE-L of each candidate against its references, as Rouge.calc_score.
+    :param candidates: list of candidate sentences
+    :param refs: list (one entry per candidate) of lists of reference sentences
+    :param beta: recall weight
+    :return: float array of scores
+    """
+    vocab = {}
+    cand_tokens = intern_tokens(candidates, vocab)
+    nrefs = np.array([len(r) for r in refs], dtype=np.int64)
+    pair_cand = np.repeat(np.arange(len(candidates)), nrefs)
+    ref_tokens = intern_tokens([s for r in refs for s in r], vocab)
+    lcs = lcs_lengths(ref_tokens, [cand_tokens[c] for c in pair_cand])
+
+    len_c = np.array([len(t) for t in cand_tokens], dtype=np.float64)
+    len_r = np.array([len(t) for t in ref_tokens], dtype=np.float64)
+    prec = lcs / len_c[pair_cand]
+    rec = lcs / len_r
+    # maximum over the references of each candidate
+    starts = np.concatenate([[0], np.cumsum(nrefs)[:-1]])
+    prec_max = np.maximum.reduceat(prec, starts) if len(prec) > 0 else prec
+    rec_max = np.maximum.reduceat(rec, starts) if len(rec) > 0 else rec
+
+    nonzero = (prec_max != 0) & (rec_max != 0)
+    denom = np.where(nonzero, rec_max + beta**2*prec_max, 1.)
+    return np.where(nonzero, ((1 + beta**2)*prec_max*rec_max)/denom, 0.0)
@@ -0,0 +1,151 @@
+import math
+import threading
+import multiprocessing
+import numpy as np
+from bleu.bleu_scorer import BleuScorer
+from cider.cider_scorer import precook as cider_precook
+from cider.cider_vectorized import CiderReferences
+from rouge.rouge_vectorized import rouge_l
+from meteor.meteor import Meteor
+
+"""
+Input: refToGts and refToRes of RefEvaluation, number of processes
+
+Parallel version of the scorer loop of RefEvaluation. The refs are split in
+contiguous shards scored in a process pool while METEOR runs in a thread
+(its own processes, see meteor/meteor.py), and per-shard statistics are
+merged exactly:
+BLEU   - integer testlen, reflen, guess and correct counts summed over the
+         shards, the corpus BLEU of BleuScorer is computed from the sums
+CIDEr  - document frequencies of the shards summed first, each shard is then
+         scored with the document frequencies of all refs
+ROUGE  - scores of the shards concatenated
+METEOR - SCORE statistics of the worker processes merged in one EVAL
+Corpus scores are the same as those of the serial loop.
+
+Things of interest
+computeScores - [(score, scores, method)] as computed by the scorers of RefEvaluation
+"""
+
+BLEU_N = 4
+CIDER_N = 4
+CIDER_SIGMA = 6.0
+
+
+def shardBounds(num_items, num_shards):
+    # contiguous shards [bounds[k], bounds[k+1]) of equal sizes
+    return [num_items*k//num_shards for k in range(num_shards+1)]
+
+
+def bleuStats(gts, res):
+    # summable statistics and per sentence scores of BleuScorer
+    bleu_scorer = BleuScorer(n=BLEU_N)
+    for hypo, refs in zip(res, gts):
+        bleu_scorer += (hypo, refs)
+    score, scores = bleu_scorer.compute_score(option='closest')
+    stats = {'testlen': bleu_scorer._testlen, 'reflen': bleu_scorer._reflen,
+             'guess': [0]*BLEU_N, 'correct': [0]*BLEU_N, 'scores': scores}
+    for comps in bleu_scorer.ctest:
+        for k in range(BLEU_N):
+            stats['guess'][k] += comps['guess'][k]
+            stats['correct'][k] += comps['correct'][k]
+    return stats
+
+
+def _bleuStats(args):
+    return bleuStats(*args)
+
+
+def bleuFromStats(testlen, reflen, guess, correct):
+    # corpus BLEU-1..n of summed statistics, as BleuScorer.compute_score
+    small = 1e-9
+    tiny = 1e-15 ## so that if guess is 0 still return 0
+    bleus = []
+    bleu = 1.
+    for k in xrange(len(guess)):
+        bleu *= float(correct[k] + tiny) \
+                / (guess[k] + small)
+        bleus.append(bleu ** (1./(k+1)))
+    ratio = (testlen + tiny) / (reflen + small) ## N.B.: avoid zero division
+    if ratio < 1:
+        for k in xrange(len(guess)):
+            bleus[k] *= math.exp(1 - 1/ratio)
+    return bleus
+
+
+def _ciderDocFreq(gts):
+    # {ngram: number of images of the shard whose references contain it}
+    doc_freq = {}
+    for refs in gts:
+        for ngram in set(ngram for ref in refs for ngram in cider_precook(ref, CIDER_N)):
+            doc_freq[ngram] = doc_freq.get(ngram, 0) + 1
+    return doc_freq
+
+
+def _ciderScores(args):
+    gts, res, doc_freq, num_images = args
+    return CiderReferences(gts, CIDER_N, CIDER_SIGMA, doc_freq, num_images).score(res)
+
+
+def _rougeScores(args):
+    gts, res = args
+    return rouge_l(res, gts)
+
+
+def _meteorScores(refToGts, refToRes, num_workers, out):
+    try:
+        with Meteor(num_workers) as meteor:
+            out['result'] = meteor.compute_score(refToGts, refToRes)
+    except Exception as e:
+        out['error'] = e
+
+
+def computeScores(refToGts, refToRes, num_workers, meteor_workers=1):
+    """
+    :param refToGts: {ref_id: [tokenized ground-truth sentences]}
+    :param refToRes: {ref_id: [tokenized sentence]}
+    :param num_workers: number of processes, and of shards of the refs
+    :param meteor_workers: number of METEOR processes
+    :return: [(score, scores, method)] of BLEU, METEOR, ROUGE_L and CIDEr, scores ordered as refToGts.keys()
+    """
+    assert(refToGts.keys() == refToRes.keys())
+    imgIds = refToGts.keys()
+    gts = [refToGts[id] for id in imgIds]
+    res = [refToRes[id][0] for id in imgIds]
+    bounds = shardBounds(len(imgIds), num_workers)
+    shards = [(bounds[k], bounds[k+1]) for k in range(num_workers) if bounds[k] < bounds[k+1]]
+
+    # the pool is forked before the METEOR thread starts
+    pool = multiprocessing.Pool(num_workers)
+    meteor_out = {}
+    meteor_thread = threading.Thread(target=_meteorScores, args=(refToGts, refToRes, meteor_workers, meteor_out))
+    meteor_thread.start()
+    try:
+        bleu_async = pool.map_async(_bleuStats, [(gts[a:b], res[a:b]) for a, b in shards])
+        rouge_async = pool.map_async(_rougeScores, [(gts[a:b], res[a:b]) for a, b in shards])
+        doc_freq = {}
+        for shard_freq in pool.map(_ciderDocFreq, [gts[a:b] for a, b in shards]):
+            for ngram, freq in shard_freq.iteritems():
+                doc_freq[ngram] = doc_freq.get(ngram, 0) + freq
+        cider_async = pool.map_async(_ciderScores, [(gts[a:b], res[a:b], doc_freq, len(imgIds)) for a, b in shards])
+        bleu_stats = bleu_async.get()
+        rouge_scores = rouge_async.get()
+        cider_scores = cider_async.get()
+    finally:
+        pool.terminate()
+        meteor_thread.join()
+    if 'error' in meteor_out:
+        raise meteor_out['error']
+
+    results = []
+    bleus = bleuFromStats(sum(s['testlen'] for s in bleu_stats), sum(s['reflen'] for s in bleu_stats),
+                          [sum(s['guess'][k] for s in bleu_stats) for k in range(BLEU_N)],
+                          [sum(s['correct'][k] for s in bleu_stats) for k in range(BLEU_N)])
+    results.append((bleus, [sum((s['scores'][k] for s in bleu_stats), []) for k in range(BLEU_N)],
+                    ["Bleu_1", "Bleu_2", "Bleu_3", "Bleu_4"]))
+    results.append(meteor_out['result'] + ("METEOR",))
+    rouge = np.concatenate(rouge_scores) if len(shards) > 0 else np.zeros(0)
+    results.append((np.mean(rouge), rouge, "ROUGE_L"))
+    cider = np.concatenate(cider_scores) if len(shards) > 0 else np.zeros(0)
+    results.append((np.mean(cider), cider, "CIDEr"))
+    return results
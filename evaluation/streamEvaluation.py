@@ -0,0 +1,168 @@
+import json
+import itertools
+from refEvaluation import TOKENIZERS
+from gtTokenCache import loadGTTokens
+from shardedScoring import bleuStats, bleuFromStats, BLEU_N
+from cider.cider_vectorized import CiderReferences
+from rouge.rouge_vectorized import rouge_l
+from meteor.meteor import Meteor
+
+"""
+Input: refer, split of the predicted refs, then predictions [{ref_id, sent}]
+from an iterator or a file, in chunks
+
+Incremental version of RefEvaluation, whose memory does not grow with the
+number of predictions. Each chunk is tokenized and scored, and only the
+summable statistics of the metrics are kept:
+BLEU   - testlen, reflen, guess and correct counts (see shardedScoring.py)
+METEOR - statistics of the segments, summed field by field as METEOR
+         aggregates them
+ROUGE  - sum of the scores
+CIDEr  - sum of the scores, the reference vectors and document frequencies
+         are those of the refs of split (RefEvaluation uses those of the
+         evaluated refs, the same when the predictions cover the split)
+Per-ref scores are kept in refToEval, or appended to refs_file (JSONL) to
+keep memory bounded. Predictions of the same ref are each scored.
+
+Things of interest
+add          - score a chunk of predictions
+evaluate     - score all predictions of an iterator or a file, chunk by chunk
+corpusScores - dict of {metric: score} of the predictions added so far
+eval         - dict of {metric: score}, set by evaluate
+refToEval    - dict of {ref_id: {metric: score}}, empty if refs_file is given
+"""
+
+CHUNK_SIZE = 5000
+
+
+def iterPredictions(path):
+    """
+    Predictions of a JSONL file, one {'ref_id', 'sent'} per line, read line by line,
+    or of a JSON file, {'predictions': [...]} as test/sample_expressions_*.json or a list,
+    which is loaded at once.
+    """
+    if path.endswith('.jsonl'):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path) as f:
+            data = json.load(f)
+        for pred in (data['predictions'] if isinstance(data, dict) else data):
+            yield pred
+
+
+class StreamEvaluation:
+    def __init__ (self, refer, split, tokenizer='java', refs_file=None, meteor_workers=1):
+        """
+        :param refer: refer class of current dataset
+        :param split: split of the predicted refs, e.g. 'testA'
+        :param tokenizer: 'java' or 'python', see TOKENIZERS of refEvaluation.py
+        :param refs_file: JSONL file the per-ref scores are written to, kept in refToEval if None
+        :param meteor_workers: number of METEOR processes scoring in parallel
+        """
+        self.eval = {}
+        self.refToEval = {}
+        self.refer = refer
+        self.tokenizer = TOKENIZERS[tokenizer]()
+        gtTokens = loadGTTokens(refer, tokenizer, self.tokenizer)
+        ref_ids = refer.getRefIds(split=split)
+        self.refToRow = dict((ref_id, i) for i, ref_id in enumerate(ref_ids))
+        self.gts = [[gtTokens[sent['sent_id']] for sent in refer.Refs[ref_id]['sentences']] for ref_id in ref_ids]
+        self.cider = CiderReferences(self.gts)
+        self.meteor = Meteor(meteor_workers)
+        self.refs_file = open(refs_file, 'w') if refs_file is not None else None
+
+        # running statistics
+        self.count = 0
+        self.bleu = {'testlen': 0, 'reflen': 0, 'guess': [0]*BLEU_N, 'correct': [0]*BLEU_N}
+        self.meteor_stats = None
+        self.rouge_sum = 0.
+        self.cider_sum = 0.
+
+    def add(self, predictions):
+        """
+        :param predictions: [{'ref_id', 'sent'}]
+        """
+        if len(predictions) == 0:
+            return
+        ref_ids = [pred['ref_id'] for pred in predictions]
+        missing = [ref_id for ref_id in ref_ids if ref_id not in self.refToRow]
+        if len(missing) > 0:
+            raise KeyError('unknown ref_id %s%s, not in the split' % (missing[:10], ' (%d missing)' % len(missing)
+                                                                     if len(missing) > 10 else ''))
+        rows = [self.refToRow[ref_id] for ref_id in ref_ids]
+        tokens = self.tokenizer.tokenize(dict((i, [pred['sent']]) for i, pred in enumerate(predictions)))
+        res = [tokens[i][0] for i in range(len(predictions))]
+        gts = [self.gts[row] for row in rows]
+
+        bleu = bleuStats(gts, res)
+        for key in ['testlen', 'reflen']:
+            self.bleu[key] += bleu[key]
+        for key in ['guess', 'correct']:
+            for k in range(BLEU_N):
+                self.bleu[key][k] += bleu[key][k]
+        stats = self.meteor.compute_stats(gts, res)
+        _, meteor = self.meteor.eval_stats(stats)
+        for stat in stats:
+            values = [float(v) for v in stat.split()]
+            self.meteor_stats = values if self.meteor_stats is None else [a+b for a, b in zip(self.meteor_stats, values)]
+        rouge = rouge_l(res, gts)
+        cider = self.cider.score(res, rows)
+        self.rouge_sum += rouge.sum()
+        self.cider_sum += cider.sum()
+        self.count += len(predictions)
+
+        for i, ref_id in enumerate(ref_ids):
+            refEval = {'ref_id': ref_id, 'METEOR': meteor[i], 'ROUGE_L': float(rouge[i]), 'CIDEr': float(cider[i])}
+            for k in range(BLEU_N):
+                refEval['Bleu_%d' % (k+1)] = bleu['scores'][k][i]
+            if self.refs_file is not None:
+                self.refs_file.write(json.dumps(refEval) + '\n')
+            else:
+                self.refToEval[ref_id] = refEval
+
+    def corpusScores(self):
+        """
+        :return: {metric: score} of the predictions added so far
+        """
+        if self.count == 0:
+            return {}
+        scores = {}
+        bleus = bleuFromStats(self.bleu['testlen'], self.bleu['reflen'], self.bleu['guess'], self.bleu['correct'])
+        for k, bleu in enumerate(bleus):
+            scores['Bleu_%d' % (k+1)] = bleu
+        stat = ' '.join('%d' % v if v == int(v) else repr(v) for v in self.meteor_stats)
+        scores['METEOR'], _ = self.meteor.eval_stats([stat])
+        scores['ROUGE_L'] = self.rouge_sum / self.count
+        scores['CIDEr'] = self.cider_sum / self.count
+        return scores
+
+    def evaluate(self, predictions, chunk_size=CHUNK_SIZE):
+        """
+        :param predictions: iterator of {'ref_id', 'sent'}, or path of a JSONL / JSON file (see iterPredictions)
+        :param chunk_size: number of predictions scored at once
+        """
+        if isinstance(predictions, basestring):
+            predictions = iterPredictions(predictions)
+        predictions = iter(predictions)
+        while True:
+            chunk = list(itertools.islice(predictions, chunk_size))
+            if len(chunk) == 0:
+                break
+            self.add(chunk)
+            print '%d predictions, CIDEr: %0.3f' % (self.count, self.cider_sum / self.count)
+        if self.refs_file is not None:
+            self.refs_file.flush()
+
+        self.eval = self.corpusScores()
+        for metric, score in sorted(self.eval.items()):
+            print "%s: %0.3f"%(metric, score)
+
+    def close(self):
+        # stop the METEOR and tokenizer processes, close refs_file
+        self.meteor.close()
+        self.tokenizer.close()
+        if self.refs_file is not None:
+            self.refs_file.close()
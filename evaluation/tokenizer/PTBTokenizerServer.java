@@ -0,0 +1,51 @@
+// File Name : PTBTokenizerServer.java
+//
+// Description : Long-lived tokenizer of ptbtokenizer.py, compiled on first
+//               use against stanford-corenlp-3.4.1.jar.
+//
+// Tokenizes batches of lines read from stdin as
+// `PTBTokenizer -preserveLines -lowerCase` does: a batch is a line with its
+// number of lines followed by these lines, and its tokenized lines are
+// written and flushed as soon as the batch is done, whatever the sizes of
+// the stream buffers.
+
+import java.io.BufferedReader;
+import java.io.InputStreamReader;
+import java.io.OutputStreamWriter;
+import java.io.PrintWriter;
+import java.io.StringReader;
+import java.util.Locale;
+
+import edu.stanford.nlp.ling.CoreLabel;
+import edu.stanford.nlp.process.CoreLabelTokenFactory;
+import edu.stanford.nlp.process.PTBTokenizer;
+
+public class PTBTokenizerServer {
+
+  public static void main(String[] args) throws Exception {
+    BufferedReader in = new BufferedReader(new InputStreamReader(System.in, "utf-8"));
+    PrintWriter out = new PrintWriter(new OutputStreamWriter(System.out, "utf-8"));
+    CoreLabelTokenFactory factory = new CoreLabelTokenFactory();
+    String header;
+    while ((header = in.readLine()) != null) {
+      int lines = Integer.parseInt(header.trim());
+      for (int i = 0; i < lines; i++) {
+        String line = in.readLine();
+        if (line == null) {
+          line = "";
+        }
+        PTBTokenizer<CoreLabel> tokenizer = new PTBTokenizer<CoreLabel>(new StringReader(line), factory, "");
+        StringBuilder tokens = new StringBuilder();
+        while (tokenizer.hasNext()) {
+          if (tokens.length() > 0) {
+            tokens.append(' ');
+          }
+          tokens.append(tokenizer.next().word().toLowerCase(Locale.ENGLISH));
+        }
+        out.print(tokens);
+        out.print('\n');
+      }
+      out.flush();
+    }
+  }
+}
@@ -10,31 +10,258 @@
 
 import os
 import sys
+import select
 import subprocess
 import tempfile
 import itertools
+import threading
+import collections
+import atexit
 
 # path to the stanford corenlp jar
 STANFORD_CORENLP_3_4_1_JAR = 'stanford-corenlp-3.4.1.jar'
 
+# tokenizer kept running by TokenizerProcess, compiled with javac on first use
+SERVER_SOURCE = 'PTBTokenizerServer.java'
+
 # punctuations to be removed from the sentences
 PUNCTUATIONS = ["''", "'", "``", "`", "-LRB-", "-RRB-", "-LCB-", "-RCB-", \
         ".", "?", "!", ",", ":", "-", "--", "...", ";"] 
 
+# without javac the PTBTokenizer main class is kept running instead. It only
+# flushes its output when its buffers are full, empty lines sent after a
+# batch push the tokens of the batch out (each one is echoed as an empty
+# line, 32768 of them fill the writer and encoder buffers of 8192)
+FLUSH_LINES = 32768
+
+# seconds without output after which a TokenizerProcess is stopped, the
+# sentences are then tokenized by one JVM per call
+READ_TIMEOUT = 60
+
+class TokenizerTimeout(IOError):
+    pass
+
+# directory of the compiled PTBTokenizerServer, None without javac
+_server_dir = None
+_server_compiled = False
+_server_lock = threading.Lock()
+
+def serverClassDir():
+    global _server_dir, _server_compiled
+    with _server_lock:
+        if not _server_compiled:
+            _server_compiled = True
+            _server_dir = compileServer()
+        return _server_dir
+
+def compileServer():
+    tokenizer_dir = os.path.dirname(os.path.abspath(__file__))
+    source = os.path.join(tokenizer_dir, SERVER_SOURCE)
+    compiled = os.path.join(tokenizer_dir, 'PTBTokenizerServer.class')
+    if os.path.isfile(compiled) and os.path.getmtime(compiled) >= os.path.getmtime(source):
+        return tokenizer_dir
+    out_dir = tokenizer_dir if os.access(tokenizer_dir, os.W_OK) else tempfile.mkdtemp()
+    cmd = ['javac', '-cp', STANFORD_CORENLP_3_4_1_JAR, '-d', out_dir, SERVER_SOURCE]
+    try:
+        p = subprocess.Popen(cmd, cwd=tokenizer_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = p.communicate()[0]
+    except OSError:
+        return None
+    if p.returncode != 0:
+        print 'could not compile %s, PTBTokenizer flushed by padding:\n%s' % (SERVER_SOURCE, output)
+        return None
+    return out_dir
+
+class TokenizerProcess:
+    """Long-lived JVM tokenizing batches of lines over stdin/stdout.
+
+    It runs PTBTokenizerServer, which writes each batch as soon as it is
+    tokenized. Without javac it runs PTBTokenizer, each batch is then sent
+    between two marker lines followed by FLUSH_LINES empty lines and the
+    output between the markers is the batch. A read waiting READ_TIMEOUT
+    seconds stops the process and raises TokenizerTimeout. Batches are
+    serialized by a lock, so a process can be shared by threads.
+    """
+
+    def __init__(self):
+        server_dir = serverClassDir()
+        self.server = server_dir is not None
+        if self.server:
+            cmd = ['java', '-cp', os.pathsep.join([STANFORD_CORENLP_3_4_1_JAR, server_dir]), \
+                    'PTBTokenizerServer']
+        else:
+            cmd = ['java', '-cp', STANFORD_CORENLP_3_4_1_JAR, \
+                    'edu.stanford.nlp.process.PTBTokenizer', \
+                    '-preserveLines', '-lowerCase']
+        self.p_tokenizer = subprocess.Popen(cmd, \
+                cwd=os.path.dirname(os.path.abspath(__file__)), \
+                stdin=subprocess.PIPE, \
+                stdout=subprocess.PIPE)
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.pending = collections.deque()  # lines read but not returned yet
+        self.partial = ''                   # incomplete last line read
+
+    def alive(self):
+        return self.p_tokenizer.poll() is None
+
+    def tokenize(self, sentences):
+        """Tokenized lines of a list of sentences (str, without newlines)."""
+        with self.lock:
+            self.batches += 1
+            if self.server:
+                # a carriage return would end a line of the batch for the JVM
+                data = '%d\n' % len(sentences) + ''.join([s.replace('\r', ' ') + '\n' for s in sentences])
+            else:
+                begin, end = 'ptbbatchbegin%d' % self.batches, 'ptbbatchend%d' % self.batches
+                data = '\n'.join([begin] + sentences + [end]) + '\n' * (FLUSH_LINES+1)
+            # write from another thread, the output pipe could fill up while we write
+            writer = threading.Thread(target=self._write, args=(data,))
+            writer.start()
+            try:
+                if self.server:
+                    lines = [self._readLine() for _ in sentences]
+                else:
+                    lines, started = [], False
+                    while True:
+                        line = self._readLine()
+                        if not started:
+                            # skip the flush lines of the previous batch
+                            started = line.strip() == begin
+                        elif line.strip() == end:
+                            break
+                        else:
+                            lines.append(line)
+            except TokenizerTimeout:
+                self.p_tokenizer.kill()
+                raise
+            finally:
+                writer.join()
+        if len(lines) != len(sentences):
+            raise IOError('PTBTokenizer returned %d lines for %d sentences' % (len(lines), len(sentences)))
+        return lines
+
+    def _readLine(self):
+        # next output line, reading the pipe with a timeout
+        fd = self.p_tokenizer.stdout.fileno()
+        while len(self.pending) == 0:
+            if len(select.select([fd], [], [], READ_TIMEOUT)[0]) == 0:
+                raise TokenizerTimeout('PTBTokenizer gave no output for %ds' % READ_TIMEOUT)
+            chunk = os.read(fd, 65536)
+            if chunk == '':
+                raise IOError('PTBTokenizer process exited')
+            lines = (self.partial + chunk).split('\n')
+            self.partial = lines.pop()
+            self.pending.extend(lines)
+        return self.pending.popleft()
+
+    def _write(self, data):
+        try:
+            self.p_tokenizer.stdin.write(data)
+            self.p_tokenizer.stdin.flush()
+        except IOError:
+            pass  # the reader sees the process exit
+
+    def close(self):
+        with self.lock:
+            if self.alive():
+                self.p_tokenizer.stdin.close()
+                self.p_tokenizer.wait()
+
+# process shared by all PTBTokenizer(), started on first use and closed at exit
+_shared_process = None
+_shared_lock = threading.Lock()
+
+def sharedProcess():
+    global _shared_process
+    with _shared_lock:
+        if _shared_process is None or not _shared_process.alive():
+            _shared_process = TokenizerProcess()
+        return _shared_process
+
+def closeSharedProcess():
+    with _shared_lock:
+        if _shared_process is not None:
+            _shared_process.close()
+
+atexit.register(closeSharedProcess)
+
+# a TokenizerProcess timed out in this process, PTBTokenizer no longer uses them
+_timed_out = False
+
+def timedOut():
+    global _timed_out
+    _timed_out = True
+
 class PTBTokenizer:
-    """Python wrapper of Stanford PTBTokenizer"""
+    """Python wrapper of Stanford PTBTokenizer
 
-    def tokenize(self, captions_for_image):
-        cmd = ['java', '-cp', STANFORD_CORENLP_3_4_1_JAR, \
-                'edu.stanford.nlp.process.PTBTokenizer', \
-                '-preserveLines', '-lowerCase']
+    shared=True tokenizes in a JVM kept for all PTBTokenizer (see
+    TokenizerProcess), shared=False in a JVM of this tokenizer, stopped by
+    close(), and persistent=False in a new JVM per tokenize call, which is
+    also the fallback once a kept JVM timed out.
+    """
+
+    def __init__(self, persistent=True, shared=True):
+        self.persistent = persistent
+        self.shared = shared
+        self.process = None
+
+    def __enter__(self):
+        return self
 
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.process is not None:
+            self.process.close()
+            self.process = None
+
+    def tokenize(self, captions_for_image):
         # ======================================================
         # prepare data for PTB Tokenizer
         # ======================================================
         final_tokenized_captions_for_image = {}
         image_id = [k for k, v in captions_for_image.items() for _ in range(len(v))]
-        sentences = '\n'.join([c.replace('\n', ' ') for k, v in captions_for_image.items() for c in v])
+        sentences = [c.replace('\n', ' ') for k, v in captions_for_image.items() for c in v]
+        sentences = [c.encode('utf-8') if isinstance(c, unicode) else c for c in sentences]
+
+        # ======================================================
+        # tokenize sentence
+        # ======================================================
+        lines = None
+        if self.persistent and not _timed_out:
+            try:
+                if self.shared:
+                    lines = sharedProcess().tokenize(sentences)
+                else:
+                    if self.process is None or not self.process.alive():
+                        self.process = TokenizerProcess()
+                    lines = self.process.tokenize(sentences)
+            except TokenizerTimeout as e:
+                print '%s, tokenizing with one JVM per call from now on' % e
+                timedOut()
+        if lines is None:
+            lines = self._tokenizeOnce(sentences)
+
+        # ======================================================
+        # create dictionary for tokenized captions
+        # ======================================================
+        for k, line in zip(image_id, lines):
+            if not k in final_tokenized_captions_for_image:
+                final_tokenized_captions_for_image[k] = []
+            tokenized_caption = ' '.join([w for w in line.rstrip().split(' ') \
+                    if w not in PUNCTUATIONS])
+            final_tokenized_captions_for_image[k].append(tokenized_caption)
+
+        return final_tokenized_captions_for_image
+
+    def _tokenizeOnce(self, sentences):
+        cmd = ['java', '-cp', STANFORD_CORENLP_3_4_1_JAR, \
+                'edu.stanford.nlp.process.PTBTokenizer', \
+                '-preserveLines', '-lowerCase']
+        sentences = '\n'.join(sentences)
 
         # ======================================================
         # save sentences to temporary file
@@ -54,15 +281,4 @@ class PTBTokenizer:
         lines = token_lines.split('\n')
         # remove temp file
         os.remove(tmp_file.name)
-
-        # ======================================================
-        # create dictionary for tokenized captions
-        # ======================================================
-        for k, line in zip(image_id, lines):
-            if not k in final_tokenized_captions_for_image:
-                final_tokenized_captions_for_image[k] = []
-            tokenized_caption = ' '.join([w for w in line.rstrip().split(' ') \
-                    if w not in PUNCTUATIONS])
-            final_tokenized_captions_for_image[k].append(tokenized_caption)
-
-        return final_tokenized_captions_for_image
+        return lines
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+#
+# File Name : pytokenizer.py
+#
+# Description : In-process replacement of the Stanford PTBTokenizer call of
+#               ptbtokenizer.py, for hosts without a JVM.
+#
+# It reproduces `PTBTokenizer -preserveLines -lowerCase` (CoreNLP 3.4.1
+# command line defaults: PTB3 escaping, no americanization) followed by the
+# removal of PUNCTUATIONS on the text of referring expressions: words,
+# numbers, hyphenated words, words joined by [.!?] (corner.the),
+# contractions and possessives, quotes, brackets, ellipses, dashes,
+# abbreviations and sentence punctuation. Rare constructs of the full lexer
+# (urls, emails, emoticons, SGML, ...) are not handled;
+# benchmark/check_tokenizer.py compares both tokenizers with the output of
+# PTBTokenizer recorded in test/ptbtokenizer_expected.json.
+
+import re
+from ptbtokenizer import PUNCTUATIONS
+
+PUNCTUATION_SET = set(PUNCTUATIONS)
+
+# abbreviations keeping their period
+ABBREVIATIONS = set(['mr', 'mrs', 'ms', 'dr', 'st', 'jr', 'sr', 'vs', 'etc', 'inc', 'co', 'corp', 'ltd',
+        'mt', 'ft', 'ave', 'prof', 'gen', 'sgt', 'capt', 'lt', 'col', 'rev', 'jan', 'feb', 'mar',
+        'apr', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec'])
+
+# words split in two by the lexer
+SPLIT_WORDS = {'cannot': ['can', 'not'], 'gonna': ['gon', 'na'], 'gotta': ['got', 'ta'],
+        'wanna': ['wan', 'na'], 'gimme': ['gim', 'me'], 'lemme': ['lem', 'me']}
+
+# -lowerCase also lowercases the escaped brackets, so they are not in
+# PUNCTUATIONS (-LRB-, ...) and stay in the tokenized sentences
+BRACKETS = {'(': '-lrb-', ')': '-rrb-', '[': '-lsb-', ']': '-rsb-', '{': '-lcb-', '}': '-rcb-'}
+
+TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<ellipsis>\.\.\.+|\.(?:\ \.)+)
+  | (?P<dash>--+)
+  | (?P<amp>&amp;)
+  | (?P<quotes>``|'')
+  | (?P<fraction>\d{1,4}[ -]\d{1,4}/\d{1,4}(?!\d))
+  | (?P<number>[+-]?\d+(?:[.,:/]\d+)+)
+  | (?P<decimal>\.\d+)
+  | (?P<acronym>[a-z](?:\.[a-z])+\.(?![a-z0-9]))
+  | (?P<joined>[a-z\x80-\xff][a-z0-9\x80-\xff]*(?:[.!?][a-z\x80-\xff][a-z0-9\x80-\xff]*)+)
+  | (?P<abbrev>(?:[a-z]\.){2,}|[a-z]+\.(?=\s+\S))
+  | (?P<word>[a-z0-9\x80-\xff]+(?:['&_/-]+[a-z0-9\x80-\xff]+)*(?:'(?!'))?)
+  | (?P<contraction>'(?:s|m|d|re|ve|ll)\b|n't\b)
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+
+def splitWord(word):
+    # contractions and possessives: don't -> do n't, man's -> man 's, players' -> players '
+    if word in SPLIT_WORDS:
+        return SPLIT_WORDS[word]
+    if word.endswith("'"):
+        return splitWord(word[:-1]) + ["'"]
+    if len(word) > 3 and word.endswith("n't"):
+        return [word[:-3], "n't"]
+    m = re.match(r"^(.+?)('(?:s|m|d|re|ve|ll))$", word)
+    if m is not None:
+        return [m.group(1), m.group(2)]
+    return [word]
+
+
+def tokenizeLine(line):
+    """PTB tokens of a line, lowercased like -lowerCase (brackets too: -lrb-)."""
+    line = line.lower()
+    tokens = []
+    for m in TOKEN.finditer(line):
+        kind, text = m.lastgroup, m.group()
+        if kind == 'space':
+            continue
+        elif kind == 'ellipsis':
+            tokens.append('...')
+        elif kind == 'dash':
+            tokens.append('--')
+        elif kind == 'fraction':
+            # 3 1/2 is one token, its space escaped as a no-break space
+            tokens.append(text.replace(' ', '\xc2\xa0'))
+        elif kind == 'amp':
+            tokens.append('&')
+        elif kind in ('acronym', 'joined'):
+            # u.s. and corner.the are single tokens, as the longest match of the lexer
+            tokens.append(text)
+        elif kind == 'abbrev':
+            if text[:-1] in ABBREVIATIONS or '.' in text[:-1]:
+                tokens.append(text)
+            else:
+                tokens += splitWord(text[:-1]) + ['.']
+        elif kind in ('number', 'decimal'):
+            tokens.append(text)
+        elif kind == 'word':
+            tokens += splitWord(text)
+        elif text in BRACKETS:
+            tokens.append(BRACKETS[text])
+        elif text == '"':
+            # opening quote at the start or after a space or bracket, closing otherwise
+            start = m.start()
+            opening = start == 0 or line[start-1].isspace() or line[start-1] in '([{'
+            tokens.append('``' if opening else "''")
+        elif text == "'":
+            start = m.start()
+            opening = start == 0 or line[start-1].isspace() or line[start-1] in '([{'
+            tokens.append('`' if opening else "'")
+        else:
+            tokens.append(text)
+    return tokens
+
+
+class PyPTBTokenizer:
+    """In-process PTB tokenizer, same interface and output as PTBTokenizer"""
+
+    def tokenize(self, captions_for_image):
+        final_tokenized_captions_for_image = {}
+        for k, v in captions_for_image.items():
+            final_tokenized_captions_for_image[k] = []
+            for c in v:
+                if isinstance(c, unicode):
+                    c = c.encode('utf-8')
+                tokens = tokenizeLine(c.replace('\n', ' '))
+                tokenized_caption = ' '.join([w for w in tokens if w not in PUNCTUATION_SET])
+                final_tokenized_captions_for_image[k].append(tokenized_caption)
+        return final_tokenized_captions_for_image
+
+    def close(self):
+        pass
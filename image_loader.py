@@ -0,0 +1,135 @@
+"""
+Image loader with read-ahead and a cache of decoded images.
+
+Walking refs (visualization, crop extraction, ...) reads and decodes one
+image at a time, and decodes an image again for every ref on it. The loader
+keeps decoded images in a byte-bounded LRU cache keyed by image_id, and
+iterate() reads ahead along the given order in a pool of threads (reading
+and JPEG decoding release the GIL), so the consumer mostly finds its next
+image already decoded.
+
+With a scale < 1, JPEGs are downscaled while decoding (PIL draft mode,
+which skips most of the IDCT work), then resized to the exact size.
+
+The following API functions are defined:
+decodeImage - read and decode an image, optionally downscaled.
+ImageLoader - cached, prefetching loader, see load, iterate and stats.
+"""
+
+import os.path as osp
+import time
+import threading
+from collections import deque
+from multiprocessing.pool import ThreadPool
+import numpy as np
+import skimage.io as io
+from PIL import Image
+from lru import LRUCache
+
+# default bound of the decoded images kept by an ImageLoader
+IMAGE_CACHE_BYTES = 512 << 20
+NUM_THREADS = 4
+PREFETCH = 16
+
+
+def imageSize(I):
+	return I.nbytes
+
+
+def decodeImage(path, scale=None):
+	"""Image at path as a numpy array, downscaled by scale (0 < scale < 1) if given."""
+	if scale is None or scale >= 1:
+		return io.imread(path)
+	im = Image.open(path)
+	w, h = im.size
+	size = (max(1, int(round(w*scale))), max(1, int(round(h*scale))))
+	im.draft(im.mode, size)  # JPEG only, decodes at the smallest 1/2^k scale larger than size
+	if im.size != size:
+		im = im.resize(size, Image.BILINEAR)
+	return np.asarray(im)
+
+
+class ImageLoader(object):
+
+	def __init__(self, image_dir, cache_bytes=IMAGE_CACHE_BYTES, num_threads=NUM_THREADS):
+		self.image_dir = image_dir
+		self.cache_bytes = cache_bytes
+		self.num_threads = num_threads
+		self.cache = LRUCache(max_bytes=cache_bytes, sizeof=imageSize)  # {(image_id, scale): image}
+		self._pool = None
+		self._lock = threading.Lock()
+		self.resetStats()
+
+	def resetStats(self):
+		self.loaded = 0          # images returned
+		self.decoded = 0         # images read and decoded
+		self.bytes_read = 0      # bytes of the decoded image files
+		self.decode_seconds = 0. # time spent decoding, summed over threads
+		self.wait_seconds = 0.   # time iterate() waited for the next image
+
+	def load(self, image_id, file_name, scale=None):
+		"""Decoded image image_id (stored in file_name), from the cache if possible."""
+		I = self._load(image_id, file_name, scale)
+		self.loaded += 1
+		return I
+
+	def _load(self, image_id, file_name, scale):
+		key = (image_id, scale)
+		I = self.cache.get(key)
+		if I is None:
+			path = osp.join(self.image_dir, file_name)
+			tic = time.time()
+			I = decodeImage(path, scale)
+			seconds = time.time() - tic
+			with self._lock:
+				self.decoded += 1
+				self.bytes_read += osp.getsize(path)
+				self.decode_seconds += seconds
+			self.cache.put(key, I)
+		return I
+
+	def iterate(self, images, scale=None, prefetch=PREFETCH):
+		"""Yield (image_id, image) along images, a sequence of (image_id, file_name),
+		decoding up to prefetch images ahead in the thread pool."""
+		if self._pool is None:
+			self._pool = ThreadPool(self.num_threads)
+		images = iter(images)
+		window = deque()  # [(image_id, result)] in order
+		inflight = {}     # {image_id: result} of the window, repeated images are decoded once
+		while True:
+			while len(window) < prefetch:
+				item = next(images, None)
+				if item is None:
+					break
+				image_id, file_name = item
+				if image_id not in inflight:
+					inflight[image_id] = self._pool.apply_async(self._load, (image_id, file_name, scale))
+				window.append((image_id, inflight[image_id]))
+			if len(window) == 0:
+				return
+			image_id, result = window.popleft()
+			tic = time.time()
+			I = result.get()
+			self.wait_seconds += time.time() - tic
+			if inflight.get(image_id) is result and all(r is not result for _, r in window):
+				del inflight[image_id]
+			self.loaded += 1
+			yield image_id, I
+
+	def stats(self):
+		return {'loaded': self.loaded, 'decoded': self.decoded, 'bytes_read': self.bytes_read,
+				'decode_seconds': self.decode_seconds, 'wait_seconds': self.wait_seconds,
+				'decode_rate': self.decoded / self.decode_seconds if self.decode_seconds > 0 else 0.,
+				'cache': self.cache.stats()}
+
+	def close(self):
+		if self._pool is not None:
+			self._pool.terminate()
+			self._pool = None
+
+	# pickled as its settings, the thread pool and the cached images stay behind
+	def __getstate__(self):
+		return {'image_dir': self.image_dir, 'cache_bytes': self.cache_bytes, 'num_threads': self.num_threads}
+
+	def __setstate__(self, state):
+		self.__init__(**state)
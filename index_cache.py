@@ -0,0 +1,359 @@
+"""
+On-disk compiled index for REFER.
+
+Parsing refs(splitBy).p and instances.json and rebuilding every map in
+REFER.createIndex takes tens of seconds on the larger datasets. A compiled
+index stores the same maps once per (dataset, splitBy) under
+
+	<cache_dir>/<dataset>_<splitBy>/
+
+as record files (a flat binary file of serialized records plus numpy arrays
+of record offsets and keys) next to the columnar tables of refer_tables.py. Both
+are memory-mapped on load, records are only deserialized when accessed and
+the relations (imgToRefs, refToAnn, ...) are resolved through the tables,
+so opening a warm index costs a handful of system calls regardless of the
+dataset size.
+
+The index records the size and mtime of the source files it was built from
+and is ignored (and rebuilt by REFER) as soon as one of them changes.
+
+The following API functions are defined:
+RecordFile    - memory-mapped file of byte records keyed by id.
+writeRecords  - write (key, bytes) records into a record file.
+RecordMap     - read-only dict view decoding the records of a record file.
+RecordList    - read-only list view over the records of a record file.
+GroupMap      - read-only dict view of the grouped rows of a table.
+ColumnMap     - read-only dict view resolving an id column into another map.
+FieldMap      - read-only dict view returning one field of another map.
+indexPath     - directory of the compiled index of a dataset/splitBy.
+sourceStamp   - size and mtime of the source files.
+saveIndex     - compile the index of a REFER instance to disk.
+loadIndex     - open a compiled index, None if missing or stale.
+"""
+
+import os
+import os.path as osp
+import json
+import mmap
+import shutil
+import collections
+import cPickle as pickle
+import numpy as np
+from refer_tables import Tables, KeyIndex, idColumn, pyValue, saveArray, loadArray
+
+# bump whenever the on-disk layout changes, older indexes are then rebuilt
+INDEX_VERSION = 4
+MANIFEST = 'manifest.json'
+
+
+class RecordFile(object):
+	"""Memory-mapped file of variable length byte records keyed by id.
+
+	A record file with prefix `path` consists of
+		path.bin          - concatenated records
+		path.offsets.npy  - int64 array, record i is bin[offsets[i]:offsets[i+1]]
+		path.keys.npy     - keys in record order
+		path.sorted.npy,
+		path.order.npy    - KeyIndex of the keys
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		self.offsets = np.load(path+'.offsets.npy', mmap_mode='r')
+		self._keys = loadArray(path+'.keys.npy')
+		self.index = KeyIndex(loadArray(path+'.sorted.npy'), loadArray(path+'.order.npy'))
+		with open(path+'.bin', 'rb') as f:
+			if os.fstat(f.fileno()).st_size > 0:
+				self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			else:
+				self._buf = ''
+
+	def __len__(self):
+		return len(self.offsets) - 1
+
+	def position(self, key):
+		# return record position of key, -1 if there is no such key
+		return self.index.position(key)
+
+	def record(self, i):
+		return self._buf[int(self.offsets[i]):int(self.offsets[i+1])]
+
+	def key(self, i):
+		return pyValue(self._keys[i])
+
+	def keys(self):
+		return self._keys.tolist()
+
+
+def writeRecords(path, items):
+	"""Write an iterable of (key, bytes) into the record file `path`."""
+	keys = []
+	offsets = [0]
+	with open(path+'.bin', 'wb') as f:
+		for key, data in items:
+			f.write(data)
+			keys.append(key)
+			offsets.append(offsets[-1] + len(data))
+	np.save(path+'.offsets.npy', np.array(offsets, dtype=np.int64))
+	keys = idColumn(keys)
+	index = KeyIndex.build(keys)
+	saveArray(path+'.keys.npy', keys)
+	saveArray(path+'.sorted.npy', index.sorted)
+	saveArray(path+'.order.npy', index.order)
+
+
+def _dumps(obj):
+	return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+
+class RecordMap(collections.Mapping):
+	"""Read-only {key: record} view of a record file.
+
+	Records are decoded on every access and never kept, so nothing is written
+	into the pages shared with other processes.
+	"""
+
+	def __init__(self, records, decode=pickle.loads):
+		self.records = records
+		self.decode = decode
+
+	def __getitem__(self, key):
+		i = self.records.position(key)
+		if i < 0:
+			raise KeyError(key)
+		return self.decode(self.records.record(i))
+
+	def __contains__(self, key):
+		return self.records.position(key) >= 0
+
+	def __iter__(self):
+		return iter(self.records.keys())
+
+	def __len__(self):
+		return len(self.records)
+
+	def keys(self):
+		return self.records.keys()
+
+
+class RecordList(collections.Sequence):
+	"""Read-only list view of the records of a record file, in file order,
+	or of the records at the positions `rows` in that order."""
+
+	def __init__(self, records, decode=pickle.loads, rows=None):
+		self.records = records
+		self.decode = decode
+		self.rows = rows
+
+	def _record(self, i):
+		return self.records.record(i if self.rows is None else int(self.rows[i]))
+
+	def __getitem__(self, i):
+		if isinstance(i, slice):
+			return [self[j] for j in xrange(*i.indices(len(self)))]
+		if i < 0:
+			i += len(self)
+		if not 0 <= i < len(self):
+			raise IndexError('record index out of range')
+		return self.decode(self._record(i))
+
+	def __iter__(self):
+		for i in xrange(len(self)):
+			yield self.decode(self._record(i))
+
+	def __len__(self):
+		return len(self.records) if self.rows is None else len(self.rows)
+
+
+class GroupMap(collections.Mapping):
+	"""Read-only {key: [target[id], ...]} view of a refer_tables.Groups.
+
+	The members of a group are given by the rows of the grouped table,
+	ids[row] is looked up in target.
+	"""
+
+	def __init__(self, groups, ids, target):
+		self.groups = groups
+		self.ids = ids
+		self.target = target
+
+	def __getitem__(self, key):
+		i = self.groups.group(key)
+		if i < 0:
+			raise KeyError(key)
+		rows = self.groups.rows[self.groups.offsets[i]:self.groups.offsets[i+1]]
+		return [self.target[id] for id in self.ids[rows].tolist()]
+
+	def __contains__(self, key):
+		return self.groups.group(key) >= 0
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __len__(self):
+		return len(self.groups)
+
+	def keys(self):
+		return self.groups.keys.tolist()
+
+
+class ColumnMap(collections.Mapping):
+	"""Read-only {key: target[ids[row]]} view, row being found by a refer_tables.KeyIndex."""
+
+	def __init__(self, index, ids, target):
+		self.index = index
+		self.ids = ids
+		self.target = target
+
+	def __getitem__(self, key):
+		row = self.index.position(key)
+		if row < 0:
+			raise KeyError(key)
+		return self.target[pyValue(self.ids[row])]
+
+	def __contains__(self, key):
+		return self.index.position(key) >= 0
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __len__(self):
+		return len(self.index)
+
+	def keys(self):
+		return self.index.sorted.tolist()
+
+
+class FieldMap(collections.Mapping):
+	"""Read-only {key: source[key][field]} view."""
+
+	def __init__(self, source, field):
+		self.source = source
+		self.field = field
+
+	def __getitem__(self, key):
+		return self.source[key][self.field]
+
+	def __contains__(self, key):
+		return key in self.source
+
+	def __iter__(self):
+		return iter(self.source)
+
+	def __len__(self):
+		return len(self.source)
+
+	def keys(self):
+		return self.source.keys()
+
+
+def indexPath(cache_dir, dataset, splitBy):
+	return osp.join(cache_dir, '%s_%s' % (dataset, splitBy))
+
+
+def sourceStamp(files):
+	# {file_name: [size, mtime]} of the source files an index depends on
+	stamp = {}
+	for f in files:
+		st = os.stat(f)
+		stamp[osp.basename(f)] = [st.st_size, st.st_mtime]
+	return stamp
+
+
+def saveIndex(refer, path, sources, shared=False):
+	"""Compile the maps of a REFER instance into the directory `path`.
+
+	The index is written to a temporary directory first and moved into place
+	at the end, so readers never see a partially written index. A shared index
+	leaves out the images and annotations, which are read from the
+	AnnotationStore of the REFER (see annotation_store.py).
+	"""
+	tmp = '%s.tmp%d' % (path, os.getpid())
+	if osp.isdir(tmp):
+		shutil.rmtree(tmp)
+	os.makedirs(tmp)
+	refs = refer.data['refs']
+	join = lambda name: osp.join(tmp, name)
+
+	# tables
+	writeRecords(join('refs'), ((ref['ref_id'], _dumps(ref)) for ref in refs))
+	if not shared:
+		writeRecords(join('anns'), ((ann['id'], _dumps(ann)) for ann in refer.data['annotations']))
+		writeRecords(join('imgs'), ((img['id'], _dumps(img)) for img in refer.data['images']))
+	writeRecords(join('sents'), ((sent['sent_id'], _dumps(sent)) for ref in refs for sent in ref['sentences']))
+
+	refer.tables.save(tmp)
+
+	with open(join('categories.p'), 'wb') as f:
+		pickle.dump(refer.data['categories'], f, pickle.HIGHEST_PROTOCOL)
+	manifest = {'version': INDEX_VERSION, 'dataset': refer.data['dataset'],
+				'splitBy': refer.splitBy, 'sources': sourceStamp(sources), 'shared': shared}
+	with open(join(MANIFEST), 'w') as f:
+		json.dump(manifest, f)
+
+	if osp.isdir(path):
+		shutil.rmtree(path)
+	os.rename(tmp, path)
+
+
+class CompiledIndex(object):
+	"""Maps of a compiled index, named as the members set by REFER.createIndex."""
+
+	def __init__(self, path, manifest, store=None):
+		self.path = path
+		self.dataset = manifest['dataset']
+		self.splitBy = manifest['splitBy']
+		join = lambda name: osp.join(path, name)
+		self.refs = RecordFile(join('refs'))
+		with open(join('categories.p'), 'rb') as f:
+			self.categories = pickle.load(f)
+
+		self.tables = tables = Tables.load(path)
+
+		self.Refs = RecordMap(self.refs)
+		if manifest.get('shared'):
+			# records of the store, restricted to the images and annotations of the tables
+			ann_ids, image_ids = tables.anns['ann_id'], tables.imgs['image_id']
+			self.annotations = RecordList(store.anns, rows=store.anns.index.positions(ann_ids))
+			self.images = RecordList(store.imgs, rows=store.imgs.index.positions(image_ids))
+			self.Anns = ColumnMap(tables.ann_index, ann_ids, store.Anns)
+			self.Imgs = ColumnMap(tables.img_index, image_ids, store.Imgs)
+		else:
+			anns, imgs = RecordFile(join('anns')), RecordFile(join('imgs'))
+			self.annotations = RecordList(anns)
+			self.images = RecordList(imgs)
+			self.Anns = RecordMap(anns)
+			self.Imgs = RecordMap(imgs)
+		self.Cats = {cat['id']: cat['name'] for cat in self.categories}
+		self.Sents = RecordMap(RecordFile(join('sents')))
+		ref_ids = tables.refs['ref_id']
+		self.imgToRefs = GroupMap(tables.img_refs, ref_ids, self.Refs)
+		self.imgToAnns = GroupMap(tables.img_anns, tables.anns['ann_id'], self.Anns)
+		self.refToAnn = ColumnMap(tables.ref_index, tables.refs['ann_id'], self.Anns)
+		self.annToRef = ColumnMap(tables.ann_ref_index, ref_ids, self.Refs)
+		self.catToRefs = GroupMap(tables.cat_refs, ref_ids, self.Refs)
+		self.sentToRef = ColumnMap(tables.sent_index, tables.sents['ref_id'], self.Refs)
+		self.sentToTokens = FieldMap(self.Sents, 'tokens')
+
+
+def loadIndex(path, sources=None, store=None):
+	"""Open the compiled index in `path`.
+
+	Returns None if there is no index, if it was written by another version,
+	or if `sources` (list of source files) changed since it was built. A
+	shared index needs the AnnotationStore it was built on.
+	"""
+	manifest_file = osp.join(path, MANIFEST)
+	if not osp.isfile(manifest_file):
+		return None
+	with open(manifest_file, 'r') as f:
+		manifest = json.load(f)
+	if manifest.get('version') != INDEX_VERSION:
+		return None
+	if sources is not None:
+		stamp = sourceStamp(sources)
+		if stamp != manifest['sources']:
+			return None
+	if manifest.get('shared') and store is None:
+		return None
+	return CompiledIndex(path, manifest, store)
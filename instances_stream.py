@@ -0,0 +1,156 @@
+"""
+Streaming, selective loader of instances.json.
+
+json.load keeps the whole file, then the whole parsed document in memory,
+although an evaluation job on one split needs a small part of it. Here the
+file is read in chunks and the elements of its "images", "annotations" and
+"categories" arrays are decoded one at a time, so only the images and
+annotations that are asked for are ever kept.
+
+Segmentations are the bulk of the annotations. With defer_segmentation the
+loader drops them and records the byte range of every kept annotation
+instead; a SegmentationReader reads one of them back from the file when it
+is needed (getMask, showRef).
+
+The following API functions are defined:
+JSONStream        - incremental reader of the top-level arrays of a json object.
+loadInstances     - load the selected images/annotations of instances.json.
+SegmentationReader - {ann_id: segmentation} read on demand from instances.json.
+"""
+
+import json
+import collections
+
+CHUNK_SIZE = 1 << 20
+WHITESPACE = ' \t\n\r'
+
+
+class JSONStream(object):
+	"""Incremental reader of a json file holding a top-level object.
+
+	items(sections) yields (key, value, start, end) for every element of the
+	array values of the keys in sections, start and end being the byte range
+	of the element in the file. Values of all other keys are skipped.
+	"""
+
+	def __init__(self, f, chunk_size=CHUNK_SIZE):
+		self.f = f
+		self.chunk_size = chunk_size
+		self.decoder = json.JSONDecoder()
+		self.buf = ''
+		self.pos = 0   # position in buf
+		self.base = 0  # file offset of buf[0]
+		self.eof = False
+
+	def _fill(self, size):
+		# drop what was consumed, then append size more bytes of the file
+		self.base += self.pos
+		data = self.f.read(size)
+		self.buf = self.buf[self.pos:] + data
+		self.pos = 0
+		self.eof = len(data) < size
+
+	def _peek(self):
+		# next non-whitespace character, '' at the end of the file
+		while True:
+			while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+				self.pos += 1
+			if self.pos < len(self.buf) or self.eof:
+				return self.buf[self.pos:self.pos+1]
+			self._fill(self.chunk_size)
+
+	def _expect(self, chars):
+		c = self._peek()
+		if c == '' or c not in chars:
+			raise ValueError('expected one of %r at byte %d, got %r' % (chars, self.base+self.pos, c))
+		self.pos += 1
+		return c
+
+	def _value(self):
+		# decode one complete json value, reading more of the file until it is complete
+		self._peek()
+		size = self.chunk_size
+		while True:
+			try:
+				obj, end = self.decoder.raw_decode(self.buf, self.pos)
+				# a value ending with the buffer (e.g. a number) might continue in the file
+				if end < len(self.buf) or self.eof:
+					break
+			except ValueError:
+				if self.eof:
+					raise
+			self._fill(size)
+			size *= 2
+		start = self.base + self.pos
+		self.pos = end
+		return obj, start, self.base + end
+
+	def items(self, sections):
+		self._expect('{')
+		if self._peek() == '}':
+			return
+		while True:
+			key, _, _ = self._value()
+			self._expect(':')
+			if key in sections and self._peek() == '[':
+				self._expect('[')
+				if self._peek() == ']':
+					self.pos += 1
+				else:
+					while True:
+						value, start, end = self._value()
+						yield key, value, start, end
+						if self._expect(',]') == ']':
+							break
+			else:
+				self._value()
+			if self._expect(',}') == '}':
+				break
+
+
+def loadInstances(instances_file, image_ids=None, ann_ids=None, defer_segmentation=False):
+	"""Load instances.json keeping the given images and annotations only.
+
+	image_ids, ann_ids - sets of ids to keep, None keeps all of them
+	defer_segmentation - drop the segmentation of the annotations, the
+	                     returned 'segments' map ann_id -> byte range in
+	                     the file for SegmentationReader
+	"""
+	instances = {'images': [], 'annotations': [], 'categories': [], 'segments': {}}
+	with open(instances_file, 'rb') as f:
+		for key, obj, start, end in JSONStream(f).items(['images', 'annotations', 'categories']):
+			if key == 'images':
+				if image_ids is None or obj['id'] in image_ids:
+					instances['images'].append(obj)
+			elif key == 'annotations':
+				if ann_ids is None or obj['id'] in ann_ids:
+					if defer_segmentation:
+						del obj['segmentation']
+						instances['segments'][obj['id']] = (start, end)
+					instances['annotations'].append(obj)
+			else:
+				instances['categories'].append(obj)
+	return instances
+
+
+class SegmentationReader(collections.Mapping):
+	"""Read-only {ann_id: segmentation} map reading instances.json on access."""
+
+	def __init__(self, instances_file, segments):
+		self.instances_file = instances_file
+		self.segments = segments
+
+	def __getitem__(self, ann_id):
+		start, end = self.segments[ann_id]
+		with open(self.instances_file, 'rb') as f:
+			f.seek(start)
+			return json.loads(f.read(end-start))['segmentation']
+
+	def __contains__(self, ann_id):
+		return ann_id in self.segments
+
+	def __iter__(self):
+		return iter(self.segments)
+
+	def __len__(self):
+		return len(self.segments)
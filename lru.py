@@ -0,0 +1,72 @@
+"""
+Bounded LRU cache with hit/miss and memory accounting.
+
+Used by REFER to keep compressed RLEs of annotations and decoded images.
+The cache can be bounded by number of items, by bytes (as measured by the
+sizeof function given to it) or both; the least recently used items are
+evicted first. It is thread-safe, and pickling it only keeps its settings.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+
+	def __init__(self, max_items=None, max_bytes=None, sizeof=None):
+		self.max_items = max_items
+		self.max_bytes = max_bytes
+		self.sizeof = sizeof  # module-level function, so that the cache stays picklable
+		self._lock = threading.Lock()
+		self.clear()
+
+	def clear(self):
+		self._items = OrderedDict()  # {key: (value, size)}, oldest first
+		self.nbytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def __len__(self):
+		return len(self._items)
+
+	def __contains__(self, key):
+		return key in self._items
+
+	def get(self, key, default=None):
+		with self._lock:
+			item = self._items.pop(key, None)
+			if item is None:
+				self.misses += 1
+				return default
+			self._items[key] = item  # most recently used
+			self.hits += 1
+			return item[0]
+
+	def put(self, key, value):
+		size = self.sizeof(value) if self.sizeof is not None else 0
+		if self.max_bytes is not None and size > self.max_bytes:
+			return  # would evict everything else
+		with self._lock:
+			old = self._items.pop(key, None)
+			if old is not None:
+				self.nbytes -= old[1]
+			self._items[key] = (value, size)
+			self.nbytes += size
+			while (self.max_items is not None and len(self._items) > self.max_items) or \
+				  (self.max_bytes is not None and self.nbytes > self.max_bytes):
+				_, (_, evicted) = self._items.popitem(last=False)
+				self.nbytes -= evicted
+				self.evictions += 1
+
+	def stats(self):
+		lookups = self.hits + self.misses
+		return {'items': len(self._items), 'bytes': self.nbytes,
+				'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+				'hit_rate': float(self.hits) / lookups if lookups > 0 else 0.}
+
+	def __getstate__(self):
+		return {'max_items': self.max_items, 'max_bytes': self.max_bytes, 'sizeof': self.sizeof}
+
+	def __setstate__(self, state):
+		self.__init__(**state)
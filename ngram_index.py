@@ -0,0 +1,338 @@
+"""
+N-gram inverted index of the referring expressions.
+
+Finding the refs whose expressions contain a phrase used to be a scan of
+every sentence. An NgramIndex maps every n-gram (n = 1 .. max_n, default 3)
+of the word ids of a TokenCorpus (see token_corpus.py) to the rows of the
+sentences containing it, the rows of the sents table of refer_tables.py:
+
+	keys.npy      - int64 sorted n-gram keys, the word ids packed WORD_BITS bits each
+	counts.npy    - int32 number of sentences of each n-gram
+	offsets.npy   - int64, the postings of keys[i] are postings[offsets[i]:offsets[i+1]]
+	postings.npy  - uint8, sorted sentence rows of each n-gram, delta and
+	                variable-byte coded (7 bits per byte, high bit set on all
+	                bytes of a number but the last)
+	ngrams.json   - version and max_n
+
+kept next to the corpus in the compiled index of the REFER (ngrams/ in its
+directory, rebuilt with it) and memory-mapped on load. Postings are decoded
+with numpy, a few microseconds per thousand rows.
+
+Queries are phrases combined with AND / OR, as a string
+
+	'"second from left"'                 phrase
+	'man AND (red OR blue)'             words, AND binding tighter than OR
+	'"to the left" woman'               juxtaposed terms are AND-ed
+
+or as a tree ('phrase', [words]), ('and', [queries]), ('or', [queries]).
+A phrase of at most max_n words is one posting list, a longer one is the
+intersection of its n-grams checked against the token array.
+REFER.findRefIds and findSentIds combine queries with the split, category
+and image filters of getRefIds.
+
+The following API functions are defined:
+MAX_N           - default longest indexed n-gram.
+ngramKeys       - keys and sentence rows of the n-grams of a token array.
+encodePostings  - delta and variable-byte code grouped sorted rows.
+decodePostings  - decode one posting list.
+parseQuery      - parse a query string into a query tree.
+buildNgramIndex - build the index of a TokenCorpus.
+saveNgramIndex  - write an index to a directory.
+loadNgramIndex  - open a saved index, None if missing or built otherwise.
+NgramIndex      - postings of the n-grams, sentence rows matching a query.
+"""
+
+import os
+import os.path as osp
+import re
+import json
+import shutil
+import numpy as np
+from refer_tables import loadArray
+
+NGRAM_VERSION = 1
+MAX_N = 3
+WORD_BITS = 21  # at most 2M words, keys of 3-grams fit in an int64
+ARRAYS = ['keys', 'counts', 'offsets', 'postings']
+
+
+def ngramKeys(tokens, rows, n):
+	"""Keys and sentence rows of the n-grams starting at each token, n-grams
+	across two sentences left out. rows[i] is the sentence of tokens[i]."""
+	m = len(tokens) - n + 1
+	if m <= 0:
+		return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+	keys = np.asarray(tokens[:m], dtype=np.int64)
+	for k in range(1, n):
+		keys = (keys << WORD_BITS) | np.asarray(tokens[k:k+m], dtype=np.int64)
+	within = rows[:m] == rows[n-1:]
+	return keys[within], rows[:m][within]
+
+
+def phraseKey(ids):
+	key = 0
+	for i in ids:
+		key = (key << WORD_BITS) | i
+	return key
+
+
+def encodePostings(rows, starts):
+	"""
+	Variable-byte coded deltas of rows, made of sorted lists beginning at starts.
+	:return: uint8 bytes, int64 byte offset of each list (with the end)
+	"""
+	rows = np.asarray(rows, dtype=np.int64)
+	deltas = rows.copy()
+	deltas[1:] -= rows[:-1]
+	deltas[starts] = rows[starts]
+	nbytes = np.ones(len(deltas), dtype=np.int64)
+	rest = deltas >> 7
+	while rest.any():
+		nbytes += rest > 0
+		rest >>= 7
+	# k-th 7 bits of every value, lowest first
+	ends = np.cumsum(nbytes)
+	k = np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - nbytes, nbytes)
+	data = (np.repeat(deltas, nbytes) >> (7*k)) & 0x7f
+	data |= (k < np.repeat(nbytes, nbytes) - 1) << 7
+	offsets = np.append(np.concatenate([[0], ends])[starts], ends[-1] if len(ends) else 0)
+	return data.astype(np.uint8), offsets.astype(np.int64)
+
+
+def decodePostings(data):
+	"""Sorted rows of one variable-byte coded posting list."""
+	data = np.asarray(data, dtype=np.int64)
+	if len(data) == 0:
+		return np.zeros(0, dtype=np.int64)
+	last = data < 0x80
+	starts = np.concatenate([[0], np.flatnonzero(last)[:-1] + 1])
+	number = np.concatenate([[0], np.cumsum(last[:-1])])
+	k = np.arange(len(data)) - starts[number]
+	return np.cumsum(np.add.reduceat((data & 0x7f) << (7*k), starts))
+
+
+QUERY_TOKENS = re.compile(r'"([^"]*)"|(\()|(\))|([^\s()"]+)')
+
+
+def parseQuery(text):
+	"""
+	Query tree of a query string: quoted phrases and words, AND, OR and
+	parentheses, juxtaposed terms being AND-ed, words lowercased.
+	"""
+	tokens = []
+	for phrase, left, right, word in QUERY_TOKENS.findall(text):
+		if left or right:
+			tokens.append(left or right)
+		elif word in ['AND', 'OR']:
+			tokens.append(word)
+		else:
+			tokens.append(('phrase', (phrase or word).lower().split()))
+	pos = [0]
+
+	def peek():
+		return tokens[pos[0]] if pos[0] < len(tokens) else None
+
+	def orQuery():
+		terms = [andQuery()]
+		while peek() == 'OR':
+			pos[0] += 1
+			terms.append(andQuery())
+		return terms[0] if len(terms) == 1 else ('or', terms)
+
+	def andQuery():
+		terms = [term()]
+		while peek() not in [None, 'OR', ')']:
+			if peek() == 'AND':
+				pos[0] += 1
+			terms.append(term())
+		return terms[0] if len(terms) == 1 else ('and', terms)
+
+	def term():
+		token = peek()
+		pos[0] += 1
+		if token == '(':
+			query = orQuery()
+			if peek() != ')':
+				raise ValueError('missing ) in query [%s]' % text)
+			pos[0] += 1
+			return query
+		if isinstance(token, tuple):
+			return token
+		raise ValueError('unexpected %s in query [%s]' % (token or 'end', text))
+
+	query = orQuery()
+	if peek() is not None:
+		raise ValueError('unexpected %s in query [%s]' % (peek(), text))
+	return query
+
+
+def buildNgramIndex(corpus, max_n=MAX_N):
+	"""Arrays of the index of the n-grams of a TokenCorpus, up to max_n words."""
+	assert len(corpus.vocab) < 2**WORD_BITS or len(corpus.tokens) == 0, 'vocabulary too large'
+	tokens = np.asarray(corpus.tokens)
+	lengths = np.diff(np.asarray(corpus.offsets))
+	rows = np.repeat(np.arange(len(lengths)), lengths)
+	keys, key_rows = [], []
+	for n in range(1, max_n+1):
+		k, r = ngramKeys(tokens, rows, n)
+		keys.append(k)
+		key_rows.append(r)
+	keys, key_rows = np.concatenate(keys), np.concatenate(key_rows)
+	# unique (key, row) pairs, sorted by key then row
+	order = np.lexsort((key_rows, keys))
+	keys, key_rows = keys[order], key_rows[order]
+	distinct = np.ones(len(keys), dtype=bool)
+	distinct[1:] = (keys[1:] != keys[:-1]) | (key_rows[1:] != key_rows[:-1])
+	keys, key_rows = keys[distinct], key_rows[distinct]
+	unique_keys, starts = np.unique(keys, return_index=True)
+	postings, offsets = encodePostings(key_rows, starts)
+	counts = np.diff(np.append(starts, len(keys))).astype(np.int32)
+	return {'keys': unique_keys.astype(np.int64), 'counts': counts, 'offsets': offsets, 'postings': postings}
+
+
+def saveNgramIndex(path, arrays, max_n):
+	# written to a temporary directory moved into place, as saveIndex
+	tmp = '%s.tmp%d' % (path, os.getpid())
+	if osp.isdir(tmp):
+		shutil.rmtree(tmp)
+	os.makedirs(tmp)
+	for name in ARRAYS:
+		np.save(osp.join(tmp, name+'.npy'), arrays[name])
+	with open(osp.join(tmp, 'ngrams.json'), 'w') as f:
+		json.dump({'version': NGRAM_VERSION, 'max_n': max_n}, f)
+	if osp.isdir(path):
+		shutil.rmtree(path)
+	os.rename(tmp, path)
+
+
+def loadNgramIndex(path, corpus, max_n=MAX_N):
+	"""Open the index saved in `path`, None if there is none or it has another version or max_n."""
+	info_file = osp.join(path, 'ngrams.json')
+	if not osp.isfile(info_file):
+		return None
+	with open(info_file, 'r') as f:
+		info = json.load(f)
+	if info.get('version') != NGRAM_VERSION or info.get('max_n') != max_n:
+		return None
+	arrays = dict((name, loadArray(osp.join(path, name+'.npy'))) for name in ARRAYS)
+	return NgramIndex(corpus, arrays, max_n, path)
+
+
+class NgramIndex(object):
+	"""Sentence rows of the n-grams of a TokenCorpus (built with its whole vocabulary)."""
+
+	def __init__(self, corpus, arrays, max_n=MAX_N, path=None):
+		self.corpus = corpus
+		self.max_n = max_n
+		self.path = path
+		for name in ARRAYS:
+			setattr(self, name, arrays[name])
+
+	def __len__(self):
+		return len(self.keys)
+
+	def __getstate__(self):
+		# a saved index is pickled as its path, as its TokenCorpus
+		if self.path is None:
+			return self.__dict__
+		return {'corpus': self.corpus, 'max_n': self.max_n, 'path': self.path}
+
+	def __setstate__(self, state):
+		if 'keys' in state:
+			self.__dict__.update(state)
+		else:
+			self.__dict__.update(loadNgramIndex(state['path'], state['corpus'], state['max_n']).__dict__)
+
+	def nbytes(self):
+		return sum(getattr(self, name).nbytes for name in ARRAYS)
+
+	def _find(self, key):
+		# position of key in keys, -1 if the n-gram does not occur
+		i = int(np.searchsorted(self.keys, key))
+		if i < len(self.keys) and self.keys[i] == key:
+			return i
+		return -1
+
+	def _wordIds(self, words):
+		# word ids of a phrase, None if a word never occurs
+		ids = [self.corpus.wordToIx.get(w) for w in words]
+		return None if None in ids else ids
+
+	def ngramRows(self, ids):
+		"""Sorted rows of the sentences containing the n-gram of word ids (n <= max_n)."""
+		i = self._find(phraseKey(ids))
+		if i < 0:
+			return np.zeros(0, dtype=np.int64)
+		return decodePostings(self.postings[self.offsets[i]:self.offsets[i+1]])
+
+	def count(self, words):
+		"""Number of sentences containing the phrase, an upper bound for phrases longer than max_n."""
+		ids = self._wordIds(words)
+		if ids is None or len(ids) == 0:
+			return 0
+		counts = []
+		for start in range(max(len(ids) - self.max_n, 0) + 1):
+			i = self._find(phraseKey(ids[start:start+self.max_n]))
+			counts.append(self.counts[i] if i >= 0 else 0)
+		return int(min(counts))
+
+	def phraseRows(self, words):
+		"""Sorted rows of the sentences containing the words in this order, next to each other."""
+		ids = self._wordIds(words)
+		if ids is None or len(ids) == 0:
+			return np.zeros(0, dtype=np.int64)
+		if len(ids) <= self.max_n:
+			return self.ngramRows(ids)
+		# candidates holding all max_n-grams of the phrase, rarest first
+		grams = [ids[start:start+self.max_n] for start in range(len(ids) - self.max_n + 1)]
+		grams.sort(key=lambda gram: self.count(gram))
+		rows = self.ngramRows(grams[0])
+		for gram in grams[1:]:
+			if len(rows) == 0:
+				break
+			rows = np.intersect1d(rows, self.ngramRows(gram), assume_unique=True)
+		return self._verify(rows, ids)
+
+	def _verify(self, rows, ids):
+		# rows whose tokens contain ids contiguously
+		tokens, offsets = self.corpus.tokens, self.corpus.offsets
+		starts = np.asarray(offsets[rows], dtype=np.int64)
+		lens = np.asarray(offsets[rows+1], dtype=np.int64) - starts
+		positions = np.arange(lens.sum()) + np.repeat(starts - np.cumsum(lens) + lens, lens)
+		ends = np.repeat(starts + lens, lens)
+		match = np.ones(len(positions), dtype=bool)
+		for k, i in enumerate(ids):
+			inside = positions + k < ends
+			match &= inside
+			match[inside] &= tokens[positions[inside] + k] == i
+		owners = np.repeat(np.arange(len(rows)), lens)
+		return rows[np.unique(owners[match])]
+
+	def _estimate(self, query):
+		# upper bound of the number of rows of a query tree
+		op, args = query
+		if op == 'phrase':
+			return self.count(args)
+		sizes = [self._estimate(q) for q in args]
+		return min(sizes) if op == 'and' else sum(sizes)
+
+	def rows(self, query):
+		"""
+		Sorted rows of the sentences matching a query string or tree (see above).
+		"""
+		if isinstance(query, basestring):
+			query = parseQuery(query)
+		op, args = query
+		if op == 'phrase':
+			return self.phraseRows(args)
+		if op == 'or':
+			rows = [self.rows(q) for q in args]
+			return np.unique(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.int64)
+		if op == 'and':
+			rows = None
+			for q in sorted(args, key=self._estimate):
+				rows = self.rows(q) if rows is None else np.intersect1d(rows, self.rows(q), assume_unique=True)
+				if len(rows) == 0:
+					break
+			return rows if rows is not None else np.zeros(0, dtype=np.int64)
+		raise ValueError('unknown query operator [%s]' % op)
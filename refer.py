@@ -12,6 +12,7 @@ The following API functions are defined:
 REFER      - REFER api class
 getRefIds  - get ref ids that satisfy given filter conditions.
 getAnnIds  - get ann ids that satisfy given filter conditions.
+getRefIdArray, getAnnIdArray - same as getRefIds and getAnnIds, returning numpy arrays.
 getImgIds  - get image ids that satisfy given filter conditions.
 getCatIds  - get category ids that satisfy given filter conditions.
 loadRefs   - load refs with the specified ref ids.
@@ -19,17 +20,27 @@ loadAnns   - load anns with the specified ann ids.
 loadImgs   - load images with the specified image ids.
 loadCats   - load category names with the specified category ids.
 getRefBox  - get ref's bounding box [x, y, w, h] given the ref_id
+getRefBoxes - get float64 array of bounding boxes given a list of ref_ids
+loadImage  - load (cached) image given image_id, optionally downscaled
+iterImages - iterate over images along given image or ref order, reading ahead
 showRef    - show image, segmentation or box of the referred object with the ref
 getMask    - get mask and area of the referred object given ref
+getMasks   - get masks and areas of many refs, stacked or merged per image
+getRLE     - get (stored or cached) compressed RLE of an annotation
 showMask   - show mask of the referred object given ref
+getCorpus  - get integer-encoded sentences with a vocabulary, in padded or packed batches
+findRefIds - get ref ids whose sentences match a phrase / AND / OR query, with getRefIds filters
+findSentIds - get sent ids matching a phrase / AND / OR query, with getRefIds filters
+MultiREFER - REFER views of several datasets on one shared image and annotation store
 """
 
 import sys
+import gc
+import collections
 import os.path as osp
 import json
 import cPickle as pickle
 import time
-import itertools
 import skimage.io as io
 import matplotlib.pyplot as plt
 from matplotlib.collections import PatchCollection
@@ -37,15 +48,48 @@ from matplotlib.patches import Polygon, Rectangle
 from pprint import pprint
 import numpy as np
 from external import mask
+import index_cache
+import refer_tables
+import refer_query
+import instances_stream
+import rle_store
+import token_corpus
+import ngram_index
+from annotation_store import AnnotationStore
+from refer_stats import IndexStats
+from lru import LRUCache
+from image_loader import ImageLoader, PREFETCH
 # import cv2
 # from skimage.measure import label, regionprops
 
+# number of annotation RLEs kept by REFER.getRLE
+RLE_CACHE_SIZE = 10000
+
+def rleSize(rle):
+	return len(rle['counts'])
+
 class REFER:
 
-	def __init__(self, data_root, dataset='refcoco', splitBy='unc'):
+	def __init__(self, data_root, dataset='refcoco', splitBy='unc', cache_dir=None, use_cache=True,
+				 stream=False, split=None, store=None):
 		# provide data_root folder which contains refclef, refcoco, refcoco+ and refcocog
 		# also provide dataset name and splitBy information
 		# e.g., dataset = 'refcoco', splitBy = 'unc'
+		# the compiled index is kept in cache_dir (default: data_root/dataset/cache)
+		# and reused as long as refs(splitBy).p and instances.json are unchanged.
+		# The load building it keeps the python dicts and lists it built, later loads
+		# use the read-only maps of the compiled index (see loadIndex): their records
+		# are new copies on every access and data['refs'], ... are read-only sequences.
+		# use_cache=False always builds the python dicts and lists.
+		# split (e.g., 'val' or 'testA') only loads the refs of that split and their
+		# images and annotations. stream parses instances.json incrementally, keeping
+		# only these images and annotations and leaving the segmentations in the file
+		# until getMask/showRef need them (see instances_stream.py).
+		# Both load from the source files, without the compiled index.
+		# Masks are read from the RLE store built by rle_store.py, when there is one.
+		# With store (an AnnotationStore, see annotation_store.py), the images and
+		# annotations are read from the store and only the refs are indexed, in a
+		# compiled index kept in the store directory.
 		print 'loading dataset %s into memory...' % dataset
 		self.ROOT_DIR = osp.abspath(osp.dirname(__file__))
 		self.DATA_DIR = osp.join(data_root, dataset)
@@ -56,25 +100,145 @@ class REFER:
 		else:
 			print 'No refer dataset is called [%s]' % dataset
 			sys.exit()
+		self.CACHE_DIR = cache_dir if cache_dir is not None else osp.join(self.DATA_DIR, 'cache')
+		self.splitBy = splitBy
+		self.stats = IndexStats()  # timings and counts, see refer_stats.py
+		self.segmentations = {}   # {ann_id: segmentation} of annotations loaded without one
+		self.INDEX_DIR = None     # compiled index whose read-only maps are in use, if any
+		self.indexPath = None     # up-to-date compiled index on disk (opened or just written), if any
+		self.rleCache = LRUCache(max_items=RLE_CACHE_SIZE, sizeof=rleSize)  # see getRLE, rleCache.stats()
+		self.imageLoader = ImageLoader(self.IMAGE_DIR)  # see loadImage, imageLoader.stats()
+		self.store = store
+		if store is not None:
+			if stream or split is not None or not use_cache:
+				print 'A REFER on a store only loads from its compiled index'
+				sys.exit()
+			if dataset not in store.datasets:
+				print 'No dataset [%s] in the store %s' % (dataset, store.path)
+				sys.exit()
+		if stream or split is not None:
+			use_cache = False
 
-		# load refs from data/dataset/refs(dataset).json
 		tic = time.time()
 		ref_file = osp.join(self.DATA_DIR, 'refs('+splitBy+').p')
+		instances_file = osp.join(self.DATA_DIR, 'instances.json')
+		if store is not None:
+			index_path = store.viewPath(dataset, splitBy)
+		else:
+			index_path = index_cache.indexPath(self.CACHE_DIR, dataset, splitBy)
+		self.rleStore = rle_store.loadRLEStore(rle_store.storePath(self.DATA_DIR, splitBy), [instances_file, ref_file])
+
+		# try the compiled index first
+		if use_cache:
+			with self.stats.phase('open index'):
+				index = index_cache.loadIndex(index_path, [ref_file, instances_file], store)
+				if index is not None:
+					self.loadIndex(index)
+			if index is not None:
+				print 'DONE (t=%.2fs, compiled index %s)' % (time.time()-tic, index_path)
+				return
+
+		# load refs from data/dataset/refs(dataset).json
 		self.data = {}
 		self.data['dataset'] = dataset
-		self.data['refs'] = pickle.load(open(ref_file, 'r'))
+		with self.stats.phase('load refs'):
+			self.data['refs'] = pickle.load(open(ref_file, 'r'))
+		if split is not None:
+			match = refer_query.splitFilter(split)
+			if match is None:
+				print 'No such split [%s]' % split
+				sys.exit()
+			self.data['refs'] = [ref for ref in self.data['refs'] if match(ref['split'])]
 
 		# load annotations from data/dataset/instances.json
-		instances_file = osp.join(self.DATA_DIR, 'instances.json')
-		instances = json.load(open(instances_file, 'r'))
+		with self.stats.phase('load instances'):
+			if store is not None:
+				instances = {'images': list(store.loadImages(dataset)),
+							 'annotations': list(store.loadAnnotations(dataset)),
+							 'categories': store.categories}
+			elif stream:
+				image_ids = set(ref['image_id'] for ref in self.data['refs'])
+				ann_ids = set(ref['ann_id'] for ref in self.data['refs'])
+				instances = instances_stream.loadInstances(instances_file, image_ids, ann_ids, defer_segmentation=True)
+				self.segmentations = instances_stream.SegmentationReader(instances_file, instances['segments'])
+			else:
+				instances = json.load(open(instances_file, 'r'))
+				if split is not None:
+					image_ids = set(ref['image_id'] for ref in self.data['refs'])
+					ann_ids = set(ref['ann_id'] for ref in self.data['refs'])
+					instances['images'] = [img for img in instances['images'] if img['id'] in image_ids]
+					instances['annotations'] = [ann for ann in instances['annotations'] if ann['id'] in ann_ids]
 		self.data['images'] = instances['images']
 		self.data['annotations'] = instances['annotations']
 		self.data['categories'] = instances['categories']
 
 		# create index
 		self.createIndex()
+		if use_cache:
+			try:
+				with self.stats.phase('save index'):
+					index_cache.saveIndex(self, index_path, [ref_file, instances_file], shared=store is not None)
+			except (IOError, OSError) as e:
+				print 'could not write compiled index to %s: %s' % (index_path, e)
+			else:
+				# the maps just built stay in use, the compiled index serves the next loads
+				self.indexPath = index_path
 		print 'DONE (t=%.2fs)' % (time.time()-tic)
 
+	def loadIndex(self, index):
+		# use the read-only maps of a compiled index (see index_cache.py),
+		# records are only deserialized when they are accessed, and every access
+		# returns a new copy: changing a returned ref, ann or image changes nothing.
+		self.INDEX_DIR = index.path
+		self.indexPath = index.path
+		self.data = {}
+		self.data['dataset'] = index.dataset
+		self.data['refs'] = index_cache.RecordList(index.refs)
+		self.data['images'] = index.images
+		self.data['annotations'] = index.annotations
+		self.data['categories'] = index.categories
+		self.tables = index.tables
+		self.query = refer_query.RefQuery(self.tables)
+		self.Refs = index.Refs
+		self.Anns = index.Anns
+		self.Imgs = index.Imgs
+		self.Cats = index.Cats
+		self.Sents = index.Sents
+		self.imgToRefs = index.imgToRefs
+		self.imgToAnns = index.imgToAnns
+		self.refToAnn = index.refToAnn
+		self.annToRef = index.annToRef
+		self.catToRefs = index.catToRefs
+		self.sentToRef = index.sentToRef
+		self.sentToTokens = index.sentToTokens
+		self.countIndex()
+
+	# members holding the index, rebuilt from INDEX_DIR when unpickled
+	INDEX_MEMBERS = ['data', 'tables', 'query', 'Refs', 'Anns', 'Imgs', 'Cats', 'Sents', 'imgToRefs',
+					 'imgToAnns', 'refToAnn', 'annToRef', 'catToRefs', 'sentToRef', 'sentToTokens']
+
+	def __getstate__(self):
+		# a REFER on a compiled index is pickled as the path of the index, so that
+		# worker processes attach to the same memory-mapped files (the page cache
+		# is shared between processes) instead of receiving a copy of the index.
+		state = dict(self.__dict__)
+		if self.INDEX_DIR is not None:
+			for name in self.INDEX_MEMBERS:
+				state.pop(name, None)
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		if self.INDEX_DIR is not None:
+			self.loadIndex(index_cache.loadIndex(self.INDEX_DIR, store=self.store))
+
+	def countIndex(self):
+		self.stats.count('refs', len(self.Refs))
+		self.stats.count('annotations', len(self.Anns))
+		self.stats.count('images', len(self.Imgs))
+		self.stats.count('categories', len(self.Cats))
+		self.stats.count('sentences', len(self.Sents))
+
 	def createIndex(self):
 		# create sets of mapping
 		# 1)  Refs: 	 	{ref_id: ref}
@@ -89,39 +253,55 @@ class REFER:
 		# 10) catToRefs: 	{category_id: refs}
 		# 11) sentToRef: 	{sent_id: ref}
 		# 12) sentToTokens: {sent_id: tokens}
-		print 'creating index...'
+		# together with the columnar tables (see refer_tables.py).
+		# every list is appended in place, so the build is linear in the number of objects.
+		# the cyclic garbage collector is paused meanwhile, as its full collections
+		# would otherwise rescan all previously loaded objects again and again.
+		gc_enabled = gc.isenabled()
+		gc.disable()
+		try:
+			self._createIndex()
+		finally:
+			if gc_enabled:
+				gc.enable()
+		self.countIndex()
+
+	def _createIndex(self):
 		# fetch info from instances
 		Anns, Imgs, Cats, imgToAnns = {}, {}, {}, {}
-		for ann in self.data['annotations']:
-			Anns[ann['id']] = ann
-			imgToAnns[ann['image_id']] = imgToAnns.get(ann['image_id'], []) + [ann]
-		for img in self.data['images']:
-			Imgs[img['id']] = img
-		for cat in self.data['categories']:
-			Cats[cat['id']] = cat['name']
+		with self.stats.phase('index annotations'):
+			for ann in self.data['annotations']:
+				Anns[ann['id']] = ann
+				imgToAnns.setdefault(ann['image_id'], []).append(ann)
+		with self.stats.phase('index images'):
+			for img in self.data['images']:
+				Imgs[img['id']] = img
+			for cat in self.data['categories']:
+				Cats[cat['id']] = cat['name']
 
 		# fetch info from refs
 		Refs, imgToRefs, refToAnn, annToRef, catToRefs = {}, {}, {}, {}, {}
 		Sents, sentToRef, sentToTokens = {}, {}, {}
-		for ref in self.data['refs']:
-			# ids
-			ref_id = ref['ref_id']
-			ann_id = ref['ann_id']
-			category_id = ref['category_id']
-			image_id = ref['image_id']
-
-			# add mapping related to ref
-			Refs[ref_id] = ref
-			imgToRefs[image_id] = imgToRefs.get(image_id, []) + [ref]
-			catToRefs[category_id] = catToRefs.get(category_id, []) + [ref]
-			refToAnn[ref_id] = Anns[ann_id]
-			annToRef[ann_id] = ref
-
-			# add mapping of sent
-			for sent in ref['sentences']:
-				Sents[sent['sent_id']] = sent
-				sentToRef[sent['sent_id']] = ref
-				sentToTokens[sent['sent_id']] = sent['tokens']
+		with self.stats.phase('index refs'):
+			for ref in self.data['refs']:
+				# ids
+				ref_id = ref['ref_id']
+				ann_id = ref['ann_id']
+				category_id = ref['category_id']
+				image_id = ref['image_id']
+
+				# add mapping related to ref
+				Refs[ref_id] = ref
+				imgToRefs.setdefault(image_id, []).append(ref)
+				catToRefs.setdefault(category_id, []).append(ref)
+				refToAnn[ref_id] = Anns[ann_id]
+				annToRef[ann_id] = ref
+
+				# add mapping of sent
+				for sent in ref['sentences']:
+					Sents[sent['sent_id']] = sent
+					sentToRef[sent['sent_id']] = ref
+					sentToTokens[sent['sent_id']] = sent['tokens']
 
 		# create class members
 		self.Refs = Refs
@@ -136,64 +316,42 @@ class REFER:
 		self.catToRefs = catToRefs
 		self.sentToRef = sentToRef
 		self.sentToTokens = sentToTokens
-		print 'index created.'
+		with self.stats.phase('build tables'):
+			self.tables = refer_tables.buildTables(self.data['refs'], self.data['annotations'], self.data['images'])
+		self.query = refer_query.RefQuery(self.tables)
 
 	def getRefIds(self, image_ids=[], cat_ids=[], ref_ids=[], split=''):
-		image_ids = image_ids if type(image_ids) == list else [image_ids]
-		cat_ids = cat_ids if type(cat_ids) == list else [cat_ids]
-		ref_ids = ref_ids if type(ref_ids) == list else [ref_ids]
-
-		if len(image_ids)==len(cat_ids)==len(ref_ids)==len(split)==0:
-			refs = self.data['refs']
-		else:
-			if not len(image_ids) == 0:
-				refs = [self.imgToRefs[image_id] for image_id in image_ids]
-			else:
-				refs = self.data['refs']
-			if not len(cat_ids) == 0:
-				refs = [ref for ref in refs if ref['category_id'] in cat_ids]
-			if not len(ref_ids) == 0:
-				refs = [ref for ref in refs if ref['ref_id'] in ref_ids]
-			if not len(split) == 0:
-				if split in ['testA', 'testB', 'testC']:
-					refs = [ref for ref in refs if split[-1] in ref['split']] # we also consider testAB, testBC, ...
-				elif split in ['testAB', 'testBC', 'testAC']:
-					refs = [ref for ref in refs if ref['split'] == split]  # rarely used I guess...
-				elif split == 'test':
-					refs = [ref for ref in refs if 'test' in ref['split']]
-				elif split == 'train' or split == 'val':
-					refs = [ref for ref in refs if ref['split'] == split]
-				else:
-					print 'No such split [%s]' % split
-					sys.exit()
-		ref_ids = [ref['ref_id'] for ref in refs]
-		return ref_ids
+		return self.getRefIdArray(image_ids, cat_ids, ref_ids, split).tolist()
+
+	def getRefIdArray(self, image_ids=[], cat_ids=[], ref_ids=[], split=''):
+		# same as getRefIds, but returns a numpy array of ref ids (see refer_query.py)
+		image_ids = image_ids if type(image_ids) in [list, np.ndarray] else [image_ids]
+		cat_ids = cat_ids if type(cat_ids) in [list, np.ndarray] else [cat_ids]
+		ref_ids = ref_ids if type(ref_ids) in [list, np.ndarray] else [ref_ids]
+		try:
+			rows = self.query.refRows(image_ids, cat_ids, ref_ids, split)
+		except ValueError:
+			print 'No such split [%s]' % split
+			sys.exit()
+		return self.tables.refs['ref_id'][rows]
 
 	def getAnnIds(self, image_ids=[], cat_ids=[], ref_ids=[]):
-		image_ids = image_ids if type(image_ids) == list else [image_ids]
-		cat_ids = cat_ids if type(cat_ids) == list else [cat_ids]
-		ref_ids = ref_ids if type(ref_ids) == list else [ref_ids]
+		return self.getAnnIdArray(image_ids, cat_ids, ref_ids).tolist()
 
-		if len(image_ids) == len(cat_ids) == len(ref_ids) == 0:
-			ann_ids = [ann['id'] for ann in self.data['annotations']]
-		else:
-			if not len(image_ids) == 0:
-				lists = [self.imgToAnns[image_id] for image_id in image_ids if image_id in self.imgToAnns]  # list of [anns]
-				anns = list(itertools.chain.from_iterable(lists))
-			else:
-				anns = self.data['annotations']
-			if not len(cat_ids) == 0:
-				anns = [ann for ann in anns if ann['category_id'] in cat_ids]
-			ann_ids = [ann['id'] for ann in anns]
-			if not len(ref_ids) == 0:
-				ids = set(ann_ids).intersection(set([self.Refs[ref_id]['ann_id'] for ref_id in ref_ids]))
-		return ann_ids
+	def getAnnIdArray(self, image_ids=[], cat_ids=[], ref_ids=[]):
+		# same as getAnnIds, but returns a numpy array of ann ids
+		image_ids = image_ids if type(image_ids) in [list, np.ndarray] else [image_ids]
+		cat_ids = cat_ids if type(cat_ids) in [list, np.ndarray] else [cat_ids]
+		ref_ids = ref_ids if type(ref_ids) in [list, np.ndarray] else [ref_ids]
+		rows = self.query.annRows(image_ids, cat_ids, ref_ids)
+		return self.tables.anns['ann_id'][rows]
 
 	def getImgIds(self, ref_ids=[]):
-		ref_ids = ref_ids if type(ref_ids) == list else [ref_ids]
+		ref_ids = ref_ids if type(ref_ids) in [list, np.ndarray] else [ref_ids]
 
 		if not len(ref_ids) == 0:
-			image_ids = list(set([self.Refs[ref_id]['image_id'] for ref_id in ref_ids]))
+			rows = self.tables.ref_index.rows(ref_ids, 'ref_id')
+			image_ids = np.unique(self.tables.refs['image_id'][rows]).tolist()
 		else:
 			image_ids = self.Imgs.keys()
 		return image_ids
@@ -230,11 +388,29 @@ class REFER:
 		ann = self.refToAnn[ref_id]
 		return ann['bbox']  # [x, y, w, h]
 
+	def getRefBoxes(self, ref_ids):
+		# return float64 array of [x, y, w, h] boxes, one row per ref_id, equal to getRefBox
+		rows = self.tables.ref_index.rows(ref_ids, 'ref_id')
+		ann_rows = self.tables.ann_index.positions(self.tables.refs['ann_id'][rows])
+		return self.tables.anns['bbox'][ann_rows]
+
+	def loadImage(self, image_id, scale=None):
+		# return the image as a numpy array, downscaled by scale (0 < scale < 1) if given,
+		# recently used images are kept in self.imageLoader.cache
+		return self.imageLoader.load(image_id, self.Imgs[image_id]['file_name'], scale)
+
+	def iterImages(self, image_ids=[], ref_ids=[], scale=None, prefetch=PREFETCH):
+		# yield (image_id, image) along image_ids, or along the images of ref_ids,
+		# the next prefetch images being read and decoded in background threads
+		if len(ref_ids) > 0:
+			image_ids = [self.Refs[ref_id]['image_id'] for ref_id in ref_ids]
+		images = ((image_id, self.Imgs[image_id]['file_name']) for image_id in image_ids)
+		return self.imageLoader.iterate(images, scale, prefetch)
+
 	def showRef(self, ref, seg_box='seg'):
 		ax = plt.gca()
 		# show image
-		image = self.Imgs[ref['image_id']]
-		I = io.imread(osp.join(self.IMAGE_DIR, image['file_name']))
+		I = self.loadImage(ref['image_id'])
 		ax.imshow(I)
 		# show refer expression
 		for sid, sent in enumerate(ref['sentences']):
@@ -246,9 +422,10 @@ class REFER:
 			polygons = []
 			color = []
 			c = 'none'
-			if type(ann['segmentation'][0]) == list:
+			segmentation = self.getSegmentation(ann)
+			if type(segmentation[0]) == list:
 				# polygon used for refcoco*
-				for seg in ann['segmentation']:
+				for seg in segmentation:
 					poly = np.array(seg).reshape((len(seg)/2, 2))
 					polygons.append(Polygon(poly, True, alpha=0.4))
 					color.append(c)
@@ -258,8 +435,7 @@ class REFER:
 				ax.add_collection(p)  # thin red polygon
 			else:
 				# mask used for refclef
-				rle = ann['segmentation']
-				m = mask.decode(rle)
+				m = mask.decode([self.getRLE(ann_id)])[:, :, 0]
 				img = np.ones( (m.shape[0], m.shape[1], 3) )
 				color_mask = np.array([2.0,166.0,101.0])/255
 				for i in range(3):
@@ -273,20 +449,37 @@ class REFER:
 			box_plot = Rectangle((bbox[0], bbox[1]), bbox[2], bbox[3], fill=False, edgecolor='green', linewidth=3)
 			ax.add_patch(box_plot)
 
+	def getSegmentation(self, ann):
+		# the streaming loader leaves segmentations in instances.json
+		if 'segmentation' in ann:
+			return ann['segmentation']
+		return self.segmentations[ann['id']]
+
+	def getRLE(self, ann_id):
+		# return the compressed RLE of an annotation (all its segments merged),
+		# read from the RLE store (see rle_store.py) or computed, recently
+		# computed RLEs are kept in self.rleCache
+		if self.rleStore is not None:
+			rle = self.rleStore.get(ann_id)
+			if rle is not None:
+				return rle
+		rle = self.rleCache.get(ann_id)
+		if rle is None:
+			ann = self.Anns[ann_id]
+			image = self.Imgs[ann['image_id']]
+			rle = rle_store.segmentationToRLE(self.getSegmentation(ann), image['height'], image['width'])
+			self.rleCache.put(ann_id, rle)
+		return rle
+
 	def getMask(self, ref):
-		# return mask, area and mask-center
-		ann = self.refToAnn[ref['ref_id']]
-		image = self.Imgs[ref['image_id']]
-		if type(ann['segmentation'][0]) == list: # polygon
-			rle = mask.frPyObjects(ann['segmentation'], image['height'], image['width'])
-		else:
-			rle = ann['segmentation']
-		m = mask.decode(rle)
-		m = np.sum(m, axis=2)  # sometimes there are multiple binary map (corresponding to multiple segs)
-		m = m.astype(np.uint8) # convert to np.uint8
+		# return mask and area
+		rle = self.getRLE(ref['ann_id'])
+		m = mask.decode([rle])[:, :, 0]  # multiple segs are merged into one binary map
+		m = np.ascontiguousarray(m, dtype=np.uint8)
 		# compute area
-		area = sum(mask.area(rle))  # should be close to ann['area']
+		area = mask.area([rle])[0]  # should be close to ann['area']
 		return {'mask': m, 'area': area}
+
 		# # position
 		# position_x = np.mean(np.where(m==1)[1]) # [1] means columns (matlab style) -> x (c style)
 		# position_y = np.mean(np.where(m==1)[0]) # [0] means rows (matlab style)    -> y (c style)
@@ -323,12 +516,133 @@ class REFER:
 		# ax.imshow(np.dstack( (img, m*0.5) ))
 		# plt.show()
 
+	def getMasks(self, refs, merge=False):
+		# return masks of many refs, grouped by image:
+		# {image_id: {'ref_ids': [ref_id], 'mask': h x w x k uint8 (one channel per ref), 'area': [k]}}
+		# with merge=True 'mask' is the h x w union of the masks of the image and 'area' its area.
+		image_ids, groups = [], {}
+		for ref in refs:
+			if ref['image_id'] not in groups:
+				image_ids.append(ref['image_id'])
+				groups[ref['image_id']] = []
+			groups[ref['image_id']].append(ref)
+		masks = {}
+		for image_id in image_ids:
+			rles = [self.getRLE(ref['ann_id']) for ref in groups[image_id]]
+			if merge:
+				rles = [mask.merge(rles) if len(rles) > 1 else rles[0]]
+			m = mask.decode(rles)
+			masks[image_id] = {'ref_ids': [ref['ref_id'] for ref in groups[image_id]],
+							   'mask': m[:, :, 0] if merge else m,
+							   'area': mask.area(rles)[0] if merge else mask.area(rles)}
+		return masks
+
 	def showMask(self, ref):
 		M = self.getMask(ref)
 		msk = M['mask']
 		ax = plt.gca()
 		ax.imshow(msk)
 
+	def getCorpus(self, min_count=1, max_vocab=None):
+		# return the sentences encoded as int32 word ids (see token_corpus.py) with the
+		# vocabulary of the words seen at least min_count times, at most max_vocab words.
+		# the encoding is compiled once into the index directory and memory-mapped,
+		# it is built in memory when there is no compiled index.
+		if self.indexPath is not None:
+			path = osp.join(self.indexPath, 'corpus')
+			corpus = token_corpus.loadCorpus(path, min_count, max_vocab)
+			if corpus is not None:
+				return corpus
+		with self.stats.phase('build corpus'):
+			vocab, arrays = token_corpus.buildCorpus(self.data['refs'])
+		if self.indexPath is not None:
+			try:
+				token_corpus.saveCorpus(path, vocab, arrays)
+			except (IOError, OSError) as e:
+				print 'could not write corpus to %s: %s' % (path, e)
+			else:
+				return token_corpus.loadCorpus(path, min_count, max_vocab)
+		return token_corpus.TokenCorpus(vocab, arrays, min_count, max_vocab)
+
+	def getNgramIndex(self, max_n=ngram_index.MAX_N):
+		# return the inverted index of the n-grams of the sentences (see ngram_index.py),
+		# compiled once next to the corpus in the index directory and kept in
+		# self.ngramIndex, built in memory when there is no compiled index.
+		if getattr(self, 'ngramIndex', None) is not None and self.ngramIndex.max_n == max_n:
+			return self.ngramIndex
+		corpus = self.getCorpus()
+		index = None
+		if self.indexPath is not None:
+			path = osp.join(self.indexPath, 'ngrams')
+			index = ngram_index.loadNgramIndex(path, corpus, max_n)
+		if index is None:
+			with self.stats.phase('build ngram index'):
+				arrays = ngram_index.buildNgramIndex(corpus, max_n)
+			if self.indexPath is not None:
+				try:
+					ngram_index.saveNgramIndex(path, arrays, max_n)
+				except (IOError, OSError) as e:
+					print 'could not write n-gram index to %s: %s' % (path, e)
+				else:
+					index = ngram_index.loadNgramIndex(path, corpus, max_n)
+			if index is None:
+				index = ngram_index.NgramIndex(corpus, arrays, max_n)
+		self.ngramIndex = index
+		return index
+
+	def findSentIds(self, query, image_ids=[], cat_ids=[], split=''):
+		# sent ids of the sentences matching query (e.g. '"second from left" AND (red OR blue)',
+		# see ngram_index.py) whose refs satisfy the filters of getRefIds, in file order
+		index = self.getNgramIndex()
+		rows = index.rows(query)
+		ref_ids = index.corpus.ref_ids[rows]
+		if len(image_ids) > 0 or len(cat_ids) > 0 or len(split) > 0:
+			rows = rows[np.in1d(ref_ids, self.getRefIdArray(image_ids, cat_ids, split=split))]
+		return index.corpus.sent_ids[rows].tolist()
+
+	def findRefIds(self, query, image_ids=[], cat_ids=[], split=''):
+		# ref ids of the refs having a sentence matching query and satisfying the filters
+		# of getRefIds, in the order of getRefIds. their images are getImgIds(ref_ids)
+		index = self.getNgramIndex()
+		matched = index.corpus.ref_ids[index.rows(query)]
+		ref_ids = self.getRefIdArray(image_ids, cat_ids, split=split)
+		return ref_ids[np.in1d(ref_ids, matched)].tolist()
+
+
+class MultiREFER:
+
+	def __init__(self, data_root, views=[('refcoco', 'unc'), ('refcoco+', 'unc'), ('refcocog', 'umd')],
+				 cache_dir=None):
+		# REFER views of several (dataset, splitBy) of the COCO based datasets,
+		# e.g., multi = MultiREFER(data_root); refer = multi['refcocog', 'umd']
+		# the images and annotations of the datasets are compiled once into a
+		# shared AnnotationStore (see annotation_store.py) kept in cache_dir
+		# (default: data_root/cache), each view only indexes its refs. The views
+		# also share their image and RLE caches, as ids are COCO ids in all of them.
+		datasets = []
+		for dataset, _ in views:
+			if dataset not in datasets:
+				datasets.append(dataset)
+		self.store = AnnotationStore(data_root, datasets, cache_dir)
+		self.views = collections.OrderedDict()
+		for dataset, splitBy in views:
+			refer = REFER(data_root, dataset, splitBy, store=self.store)
+			if len(self.views) > 0:
+				first = self.views.values()[0]
+				refer.imageLoader = first.imageLoader
+				refer.rleCache = first.rleCache
+			self.views[(dataset, splitBy)] = refer
+
+	def __getitem__(self, view):
+		# view is (dataset, splitBy)
+		return self.views[view]
+
+	def __iter__(self):
+		return iter(self.views)
+
+	def __len__(self):
+		return len(self.views)
+
 
 if __name__ == '__main__':
 	refer = REFER(dataset='refcocog', splitBy='google')
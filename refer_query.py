@@ -0,0 +1,119 @@
+"""
+Query engine behind REFER.getRefIds and REFER.getAnnIds.
+
+Queries are answered on the columnar tables of refer_tables.py. Each
+criterion has a precomputed inverted index (split->refs, category->refs,
+category->anns, image->refs, image->anns as CSR groups), the smallest of
+the candidate sets is taken from its index and the remaining criteria are
+checked on the columns of these candidates only, so the cost of a query is
+roughly proportional to the size of its smallest candidate set rather than
+to the size of the dataset.
+
+All functions return rows of the tables, in the order REFER.getRefIds and
+REFER.getAnnIds always returned them: the order of image_ids when images
+are given, file order otherwise.
+
+The following API functions are defined:
+splitFilter - predicate on split names selecting a split.
+splitCodes - split codes selected by a split name (testA also selects testAB, ...).
+RefQuery   - row queries on a refer_tables.Tables.
+"""
+
+import numpy as np
+
+
+def splitFilter(split):
+	"""Predicate on split names selecting `split`, None for an unknown split."""
+	if split in ['testA', 'testB', 'testC']:
+		return lambda name: split[-1] in name  # we also consider testAB, testBC, ...
+	elif split in ['testAB', 'testBC', 'testAC']:
+		return lambda name: name == split  # rarely used I guess...
+	elif split == 'test':
+		return lambda name: 'test' in name
+	elif split == 'train' or split == 'val':
+		return lambda name: name == split
+	return None
+
+
+def splitCodes(split_names, split):
+	"""Codes of the split names selected by `split`, None for an unknown split."""
+	match = splitFilter(split)
+	if match is None:
+		return None
+	return [code for code, name in enumerate(split_names) if match(name)]
+
+
+class RefQuery(object):
+
+	def __init__(self, tables):
+		self.tables = tables
+		self._split_rows = {}
+
+	def splitRows(self, split):
+		# sorted ref rows of a split, the union over its split codes is kept per split name
+		if split not in self._split_rows:
+			codes = splitCodes(self.tables.split_names, split)
+			if codes is None:
+				raise ValueError('No such split [%s]' % split)
+			self._split_rows[split] = np.sort(self.tables.split_refs.rowsOfMany(codes))
+		return self._split_rows[split]
+
+	def refRows(self, image_ids=[], cat_ids=[], ref_ids=[], split=''):
+		t = self.tables
+		# candidate sets as {name: (size, rows function)}, only the smallest one is built
+		candidates = {}
+		if len(ref_ids) > 0:
+			candidates['ref'] = (len(ref_ids), lambda: self._rows(t.ref_index, ref_ids))
+		if len(cat_ids) > 0:
+			cat_ids = np.unique(cat_ids)
+			candidates['cat'] = (t.cat_refs.sizeOfMany(cat_ids), lambda: np.sort(t.cat_refs.rowsOfMany(cat_ids)))
+		if len(split) > 0:
+			split_rows = self.splitRows(split)
+			candidates['split'] = (len(split_rows), lambda: split_rows)
+
+		if len(image_ids) > 0:
+			base, rows = 'image', t.img_refs.rowsOfMany(image_ids)
+		elif len(candidates) > 0:
+			# start from the smallest candidate set, all sorted in file order
+			base = min(candidates, key=lambda name: candidates[name][0])
+			rows = candidates[base][1]()
+		else:
+			return np.arange(len(t.refs['ref_id']))
+
+		# check the remaining criteria on the candidates
+		if 'cat' in candidates and base != 'cat':
+			rows = rows[np.in1d(t.refs['category_id'][rows], cat_ids)]
+		if 'ref' in candidates and base != 'ref':
+			rows = rows[np.in1d(rows, candidates['ref'][1]())]
+		if 'split' in candidates and base != 'split':
+			rows = rows[np.in1d(t.refs['split'][rows], splitCodes(t.split_names, split))]
+		return rows
+
+	def annRows(self, image_ids=[], cat_ids=[], ref_ids=[]):
+		t = self.tables
+		candidates = {}
+		if len(ref_ids) > 0:
+			ann_ids = lambda: t.refs['ann_id'][self._rows(t.ref_index, ref_ids)]
+			candidates['ref'] = (len(ref_ids), lambda: self._rows(t.ann_index, ann_ids()))
+		if len(cat_ids) > 0:
+			cat_ids = np.unique(cat_ids)
+			candidates['cat'] = (t.cat_anns.sizeOfMany(cat_ids), lambda: np.sort(t.cat_anns.rowsOfMany(cat_ids)))
+
+		if len(image_ids) > 0:
+			base, rows = 'image', t.img_anns.rowsOfMany(image_ids)
+		elif len(candidates) > 0:
+			base = min(candidates, key=lambda name: candidates[name][0])
+			rows = candidates[base][1]()
+		else:
+			return np.arange(len(t.anns['ann_id']))
+
+		if 'cat' in candidates and base != 'cat':
+			rows = rows[np.in1d(t.anns['category_id'][rows], cat_ids)]
+		if 'ref' in candidates and base != 'ref':
+			rows = rows[np.in1d(rows, candidates['ref'][1]())]
+		return rows
+
+	def _rows(self, index, ids):
+		# sorted unique rows of the known ids
+		rows = index.positions(ids)
+		return np.unique(rows[rows >= 0])
@@ -0,0 +1,50 @@
+"""
+Build statistics of the REFER index.
+
+REFER records how long each phase of loading, building, compiling or
+opening its index took and how many objects it holds in an IndexStats,
+available as refer.stats after loading:
+
+	print refer.stats                  # table of phases and counts
+	json.dumps(refer.stats.asDict())   # same as a dict
+"""
+
+import time
+from contextlib import contextmanager
+
+
+class IndexStats(object):
+	"""Wall time of named phases and object counts of a REFER index."""
+
+	def __init__(self):
+		self.phases = []  # [(phase name, seconds)] in execution order
+		self.counts = {}  # {object name: count}
+
+	@contextmanager
+	def phase(self, name):
+		tic = time.time()
+		try:
+			yield self
+		finally:
+			self.phases.append((name, time.time()-tic))
+
+	def count(self, name, n):
+		self.counts[name] = n
+
+	def seconds(self, name):
+		# total time spent in phases called name
+		return sum(t for phase, t in self.phases if phase == name)
+
+	def total(self):
+		return sum(t for _, t in self.phases)
+
+	def asDict(self):
+		return {'phases': [{'name': name, 'seconds': t} for name, t in self.phases],
+				'counts': dict(self.counts),
+				'total': self.total()}
+
+	def __str__(self):
+		lines = ['%-20s %8.3fs' % (name, t) for name, t in self.phases]
+		lines.append('%-20s %8.3fs' % ('total', self.total()))
+		lines += ['%-20s %9d' % (name, n) for name, n in sorted(self.counts.items())]
+		return '\n'.join(lines)
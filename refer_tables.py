@@ -0,0 +1,272 @@
+"""
+Columnar tables of the REFER index.
+
+Refs, annotations, sentences and images are kept as struct-of-arrays: one
+numpy array per field, row i of every column describing the same record.
+Grouped relations (image->refs, image->anns, category->refs/anns,
+split->refs, ref->sents)
+are stored CSR-style, i.e. as the sorted unique group keys, an offset array
+and the member rows, so the whole index is a few flat arrays that can be
+saved and memory-mapped.
+
+refs   - ref_id, image_id, ann_id, category_id, split (position in split_names)
+anns   - ann_id, image_id, category_id, bbox (float64 [x, y, w, h], as in instances.json)
+sents  - sent_id, ref_id, ref_row (row of the ref in refs)
+imgs   - image_id, height, width
+
+The following API functions are defined:
+SPLITS      - known split names, the split column stores their position.
+KeyIndex    - sorted-key lookup from key to row.
+Groups      - CSR grouping of the rows of a table by a key column.
+Tables      - the core tables of one dataset/splitBy with their indexes.
+buildTables - build the core tables from refs, annotations and images.
+"""
+
+import os.path as osp
+import json
+import numpy as np
+
+SPLITS = ['train', 'val', 'test', 'testA', 'testB', 'testC', 'testAB', 'testBC', 'testAC']
+
+
+def idColumn(values):
+	# int64 column if all ids are integers (memory-mappable), object column otherwise
+	values = list(values)
+	if all(isinstance(v, (int, long)) for v in values):
+		return np.array(values, dtype=np.int64)
+	column = np.empty(len(values), dtype=object)
+	column[:] = values
+	return column
+
+
+def pyValue(x):
+	# numpy scalar -> python scalar, so ids handed out look like the ones in the json
+	return x.item() if isinstance(x, np.generic) else x
+
+
+def saveArray(path, array):
+	np.save(path, array, allow_pickle=array.dtype == object)
+
+
+def loadArray(path):
+	try:
+		return np.load(path, mmap_mode='r')
+	except ValueError:
+		# object columns (non-integer ids) cannot be memory-mapped
+		return np.load(path, allow_pickle=True)
+
+
+class KeyIndex(object):
+	"""Sorted-key lookup: position(key) is the row holding key, -1 if none.
+
+	Like a dict built by assigning the rows in order, the last row wins when
+	a key occurs more than once.
+	"""
+
+	def __init__(self, sorted_keys, order):
+		self.sorted = sorted_keys
+		self.order = order
+
+	@classmethod
+	def build(cls, keys):
+		order = np.argsort(keys, kind='mergesort')
+		return cls(keys[order], order.astype(np.int64))
+
+	def __len__(self):
+		return len(self.sorted)
+
+	def _valid(self, key):
+		return self.sorted.dtype == object or isinstance(key, (int, long, np.integer))
+
+	def position(self, key):
+		if not self._valid(key):
+			return -1
+		i = int(np.searchsorted(self.sorted, key, side='right')) - 1
+		if i >= 0 and self.sorted[i] == key:
+			return int(self.order[i])
+		return -1
+
+	def positions(self, keys):
+		"""Rows of an array of keys, -1 for missing keys."""
+		keys = np.asarray(keys, dtype=self.sorted.dtype)
+		if len(self.sorted) == 0:
+			return np.full(len(keys), -1, dtype=np.int64)
+		i = np.searchsorted(self.sorted, keys, side='right') - 1
+		i[i < 0] = 0
+		found = self.sorted[i] == keys
+		return np.where(found, self.order[i], -1)
+
+	def rows(self, keys, name='key'):
+		"""Rows of an array of keys, KeyError listing the missing keys."""
+		rows = self.positions(keys)
+		missing = rows < 0
+		if missing.any():
+			missing_keys = np.asarray(keys)[missing].tolist()
+			raise KeyError('unknown %s %s%s' % (name, missing_keys[:10], ' (%d missing)' % len(missing_keys)
+												if len(missing_keys) > 10 else ''))
+		return rows
+
+	def arrays(self):
+		return {'sorted': self.sorted, 'order': self.order}
+
+
+class Groups(object):
+	"""Rows of a table grouped by a key column, CSR style.
+
+	keys are the sorted unique keys, the rows of keys[i] are
+	rows[offsets[i]:offsets[i+1]] in their original order.
+	"""
+
+	def __init__(self, keys, offsets, rows):
+		self.keys = keys
+		self.offsets = offsets
+		self.rows = rows
+
+	@classmethod
+	def build(cls, column):
+		order = np.argsort(column, kind='mergesort')
+		keys, starts = np.unique(column[order], return_index=True)
+		offsets = np.append(starts, len(column)).astype(np.int64)
+		return cls(keys, offsets, order.astype(np.int64))
+
+	def __len__(self):
+		return len(self.keys)
+
+	def group(self, key):
+		# group number of key, -1 if there is no such group
+		if self.keys.dtype != object and not isinstance(key, (int, long, np.integer)):
+			return -1
+		i = int(np.searchsorted(self.keys, key))
+		if i < len(self.keys) and self.keys[i] == key:
+			return i
+		return -1
+
+	def rowsOf(self, key):
+		i = self.group(key)
+		if i < 0:
+			return self.rows[:0]
+		return self.rows[self.offsets[i]:self.offsets[i+1]]
+
+	def _spans(self, keys):
+		# (start, length) in rows of the groups of keys, missing keys are skipped
+		keys = np.asarray(keys, dtype=self.keys.dtype)
+		if len(self.keys) == 0 or len(keys) == 0:
+			return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+		i = np.searchsorted(self.keys, keys)
+		found = i < len(self.keys)
+		found[found] = self.keys[i[found]] == keys[found]
+		i = i[found]
+		starts = self.offsets[i]
+		return starts, self.offsets[i+1] - starts
+
+	def sizeOfMany(self, keys):
+		"""Total number of rows in the groups of keys."""
+		return int(self._spans(keys)[1].sum())
+
+	def rowsOfMany(self, keys):
+		"""Rows of all groups of keys concatenated in the order of keys, missing keys are skipped."""
+		starts, lens = self._spans(keys)
+		# positions starts[k] .. starts[k]+lens[k] for every group k, in one gather
+		shift = np.repeat(starts - np.cumsum(lens) + lens, lens)
+		return self.rows[np.arange(lens.sum()) + shift]
+
+	def arrays(self):
+		return {'keys': self.keys, 'offsets': self.offsets, 'rows': self.rows}
+
+
+class Tables(object):
+	"""Core tables of one dataset/splitBy.
+
+	refs, anns, sents and imgs are dicts of equal length columns. Lookups:
+	ref_index, ann_index, sent_index, img_index - rows by id
+	ann_ref_index                               - ref row by ann_id
+	img_refs, img_anns, cat_refs, cat_anns,
+	split_refs, ref_sents                       - grouped rows
+	"""
+
+	TABLES = {'refs': ['ref_id', 'image_id', 'ann_id', 'category_id', 'split'],
+			  'anns': ['ann_id', 'image_id', 'category_id', 'bbox'],
+			  'sents': ['sent_id', 'ref_id', 'ref_row'],
+			  'imgs': ['image_id', 'height', 'width']}
+	INDEXES = {'ref_index': ('refs', 'ref_id'), 'ann_index': ('anns', 'ann_id'),
+			   'sent_index': ('sents', 'sent_id'), 'img_index': ('imgs', 'image_id'),
+			   'ann_ref_index': ('refs', 'ann_id')}
+	GROUPS = {'img_refs': ('refs', 'image_id'), 'img_anns': ('anns', 'image_id'),
+			  'cat_refs': ('refs', 'category_id'), 'cat_anns': ('anns', 'category_id'),
+			  'split_refs': ('refs', 'split'), 'ref_sents': ('sents', 'ref_row')}
+
+	def __init__(self, tables, split_names, indexes=None, groups=None):
+		self.split_names = split_names
+		for name in self.TABLES:
+			setattr(self, name, tables[name])
+		for name, (table, column) in self.INDEXES.items():
+			index = indexes[name] if indexes else KeyIndex.build(tables[table][column])
+			setattr(self, name, index)
+		for name, (table, column) in self.GROUPS.items():
+			group = groups[name] if groups else Groups.build(tables[table][column])
+			setattr(self, name, group)
+
+	def splitCode(self, split):
+		return self.split_names.index(split) if split in self.split_names else -1
+
+	def nbytes(self):
+		# total size of all arrays (for object columns only the pointers are counted)
+		return sum(array.nbytes for _, array in self._arrays())
+
+	def _arrays(self):
+		for name, columns in self.TABLES.items():
+			for column in columns:
+				yield '%s.%s' % (name, column), getattr(self, name)[column]
+		for name in self.INDEXES.keys() + self.GROUPS.keys():
+			for key, array in getattr(self, name).arrays().items():
+				yield '%s.%s' % (name, key), array
+
+	def save(self, path):
+		for name, array in self._arrays():
+			saveArray(osp.join(path, name+'.npy'), array)
+		with open(osp.join(path, 'tables.json'), 'w') as f:
+			json.dump({'split_names': self.split_names}, f)
+
+	@classmethod
+	def load(cls, path):
+		load = lambda name: loadArray(osp.join(path, name+'.npy'))
+		with open(osp.join(path, 'tables.json'), 'r') as f:
+			split_names = [str(s) for s in json.load(f)['split_names']]
+		tables = {name: {column: load('%s.%s' % (name, column)) for column in columns}
+				  for name, columns in cls.TABLES.items()}
+		indexes = {name: KeyIndex(load(name+'.sorted'), load(name+'.order')) for name in cls.INDEXES}
+		groups = {name: Groups(load(name+'.keys'), load(name+'.offsets'), load(name+'.rows'))
+				  for name in cls.GROUPS}
+		return cls(tables, split_names, indexes, groups)
+
+
+def buildTables(refs, anns, images):
+	"""Build the core tables from lists of ref, annotation and image dicts."""
+	split_names = list(SPLITS) + sorted(set(ref['split'] for ref in refs) - set(SPLITS))
+	split_code = {split: i for i, split in enumerate(split_names)}
+
+	tables = {}
+	tables['refs'] = {
+		'ref_id': idColumn(ref['ref_id'] for ref in refs),
+		'image_id': idColumn(ref['image_id'] for ref in refs),
+		'ann_id': idColumn(ref['ann_id'] for ref in refs),
+		'category_id': idColumn(ref['category_id'] for ref in refs),
+		'split': np.array([split_code[ref['split']] for ref in refs], dtype=np.int8),
+	}
+	tables['sents'] = {
+		'sent_id': idColumn(sent['sent_id'] for ref in refs for sent in ref['sentences']),
+		'ref_id': idColumn(ref['ref_id'] for ref in refs for _ in ref['sentences']),
+		'ref_row': np.array([row for row, ref in enumerate(refs) for _ in ref['sentences']], dtype=np.int64),
+	}
+	tables['anns'] = {
+		'ann_id': idColumn(ann['id'] for ann in anns),
+		'image_id': idColumn(ann['image_id'] for ann in anns),
+		'category_id': idColumn(ann['category_id'] for ann in anns),
+		'bbox': np.array([ann['bbox'] for ann in anns], dtype=np.float64).reshape(-1, 4),
+	}
+	tables['imgs'] = {
+		'image_id': idColumn(img['id'] for img in images),
+		'height': np.array([img['height'] for img in images], dtype=np.int32),
+		'width': np.array([img['width'] for img in images], dtype=np.int32),
+	}
+	return Tables(tables, split_names)
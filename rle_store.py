@@ -0,0 +1,150 @@
+"""
+Precomputed store of the compressed RLEs of the referred annotations.
+
+Turning a polygon into an RLE (frPyObjects) or parsing a refclef RLE string
+is the expensive part of getMask. This offline step does it once for every
+annotation referred to by the refs of a dataset/splitBy and stores, next to
+instances.json,
+
+	rles(splitBy).bin, .offsets.npy, .keys.npy, ...  - RLE counts keyed by ann_id (index_cache.RecordFile)
+	rles(splitBy).size.npy                          - [h, w] of each RLE
+	rles(splitBy).area.npy                          - area of each RLE (mask.area)
+	rles(splitBy).bbox.npy                          - tight [x, y, w, h] box of each RLE (mask.toBbox)
+	rles(splitBy).json                              - size and mtime of the source files
+
+REFER opens the store when it is up to date, after which a mask costs a
+lookup plus a decode.
+
+Usage:
+python rle_store.py --data_root data --dataset refcoco --splitBy unc
+
+The following API functions are defined:
+segmentationToRLE - merge the segments of an annotation into one compressed RLE.
+buildRLEStore     - build the store of the referred annotations of a REFER.
+RLEStore          - memory-mapped store, get(ann_id) returns an RLE.
+loadRLEStore      - open a store, None if missing or stale.
+"""
+
+import os
+import os.path as osp
+import json
+import numpy as np
+from external import mask
+import index_cache
+from refer_tables import loadArray
+
+STORE_VERSION = 1
+
+
+def segmentationToRLE(segmentation, h, w):
+	"""Compressed RLE of a polygon, RLE or list of RLE segmentation, segments merged."""
+	if type(segmentation) == dict:
+		rles = [segmentation]
+	elif type(segmentation[0]) == list:  # polygon
+		rles = mask.frPyObjects(segmentation, h, w)
+	else:
+		rles = segmentation
+	return mask.merge(rles) if len(rles) > 1 else rles[0]
+
+
+def storePath(data_dir, splitBy):
+	return osp.join(data_dir, 'rles(%s)' % splitBy)
+
+
+def buildRLEStore(refer, path=None):
+	"""Build the store of all annotations referred to by the refs of refer."""
+	path = path if path is not None else storePath(refer.DATA_DIR, refer.splitBy)
+	ann_ids = []
+	seen = set()
+	for ann_id in refer.tables.refs['ann_id'].tolist():
+		if ann_id not in seen:
+			seen.add(ann_id)
+			ann_ids.append(ann_id)
+
+	sizes, rles = [], []
+	def records():
+		for ann_id in ann_ids:
+			ann = refer.Anns[ann_id]
+			image = refer.Imgs[ann['image_id']]
+			rle = segmentationToRLE(refer.getSegmentation(ann), image['height'], image['width'])
+			sizes.append(rle['size'])
+			rles.append({'size': rle['size'], 'counts': rle['counts']})
+			yield ann_id, rle['counts']
+
+	tmp = '%s.tmp%d' % (path, os.getpid())
+	index_cache.writeRecords(tmp, records())
+	np.save(tmp+'.size.npy', np.array(sizes, dtype=np.int32).reshape(-1, 2))
+	np.save(tmp+'.area.npy', mask.area(rles) if rles else np.zeros(0, dtype=np.uint32))
+	np.save(tmp+'.bbox.npy', mask.toBbox(rles) if rles else np.zeros((0, 4)))
+	for suffix in ['.bin', '.offsets.npy', '.keys.npy', '.sorted.npy', '.order.npy',
+				   '.size.npy', '.area.npy', '.bbox.npy']:
+		os.rename(tmp+suffix, path+suffix)
+	sources = [osp.join(refer.DATA_DIR, 'instances.json'), osp.join(refer.DATA_DIR, 'refs(%s).p' % refer.splitBy)]
+	with open(path+'.json', 'w') as f:
+		json.dump({'version': STORE_VERSION, 'sources': index_cache.sourceStamp(sources)}, f)
+	return path
+
+
+class RLEStore(object):
+
+	def __init__(self, path):
+		self.path = path
+		self.records = index_cache.RecordFile(path)
+		self.sizes = loadArray(path+'.size.npy')
+		self.areas = loadArray(path+'.area.npy')
+		self.bboxes = loadArray(path+'.bbox.npy')
+
+	def __len__(self):
+		return len(self.records)
+
+	# pickled as its path, like the compiled index (see REFER.__getstate__)
+	def __getstate__(self):
+		return {'path': self.path}
+
+	def __setstate__(self, state):
+		self.__init__(state['path'])
+
+	def __contains__(self, ann_id):
+		return self.records.position(ann_id) >= 0
+
+	def get(self, ann_id):
+		# compressed RLE of ann_id, None if it is not in the store
+		i = self.records.position(ann_id)
+		if i < 0:
+			return None
+		return {'size': self.sizes[i].tolist(), 'counts': self.records.record(i)}
+
+	def area(self, ann_id):
+		return int(self.areas[self.records.position(ann_id)])
+
+	def bbox(self, ann_id):
+		return self.bboxes[self.records.position(ann_id)].tolist()
+
+
+def loadRLEStore(path, sources=None):
+	"""Open the store at path, None if it is missing or `sources` changed since it was built."""
+	if not osp.isfile(path+'.json'):
+		return None
+	with open(path+'.json', 'r') as f:
+		manifest = json.load(f)
+	if manifest.get('version') != STORE_VERSION:
+		return None
+	if sources is not None and index_cache.sourceStamp(sources) != manifest['sources']:
+		return None
+	return RLEStore(path)
+
+
+if __name__ == '__main__':
+	import argparse
+	import time
+	from refer import REFER
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--data_root', default=osp.join(osp.dirname(osp.abspath(__file__)), 'data'), help='folder containing the datasets')
+	parser.add_argument('--dataset', default='refcoco', help='refclef, refcoco, refcoco+ or refcocog')
+	parser.add_argument('--splitBy', default='unc', help='unc, google, umd or berkeley')
+	args = parser.parse_args()
+
+	refer = REFER(args.data_root, args.dataset, args.splitBy)
+	tic = time.time()
+	path = buildRLEStore(refer)
+	print 'stored %d RLEs in %s (t=%.2fs)' % (len(RLEStore(path)), path, time.time()-tic)
@@ -0,0 +1,201 @@
+"""
+Integer-encoded corpus of the referring expressions of a REFER.
+
+Training loaders build a vocabulary from sentToTokens and encode every
+sentence again, in every worker of every run. A TokenCorpus encodes them
+once, in the order of the sents table of refer_tables.py (refs in file
+order, then their sentences), as
+
+	vocab.json       - words ordered by decreasing count (ties by word) and their counts
+	tokens.npy       - int32, word ids of all sentences concatenated
+	offsets.npy      - int64, sentence i is tokens[offsets[i]:offsets[i+1]]
+	sent_ids.npy     - int64, sent_id of each sentence
+	ref_ids.npy      - int64, ref_id of each sentence
+
+kept in the compiled index of the REFER (corpus/ in its directory, rebuilt with it)
+and memory-mapped on load. Ids 0 and 1 are PAD and UNK, words follow from 2
+by decreasing count, so the vocabulary of a frequency threshold is a prefix
+of the stored one: min_count / max_vocab only move the id above which words
+become UNK, without encoding anything again.
+
+Batches gather the ids of many sentences with a few numpy operations:
+
+	corpus = refer.getCorpus(min_count=2)
+	batch = corpus.sentBatch(sent_ids, max_len=20)                   # padded
+	batch = corpus.refBatch(ref_ids, packed=True)                    # packed
+	batch['ids'], batch['lengths'], batch['sent_ids'], batch['ref_ids']
+
+The following API functions are defined:
+PAD, UNK      - ids of padding and of words out of the vocabulary.
+buildCorpus   - encode the sentences of a REFER.
+saveCorpus    - write encoded sentences to a directory.
+TokenCorpus   - vocabulary and encoded sentences, with padded and packed batches.
+loadCorpus    - open a saved corpus, None if missing.
+"""
+
+import os
+import os.path as osp
+import json
+import shutil
+import collections
+import numpy as np
+from refer_tables import KeyIndex, loadArray
+
+CORPUS_VERSION = 1
+PAD, UNK = 0, 1
+SPECIALS = ['<PAD>', '<UNK>']
+ARRAYS = ['tokens', 'offsets', 'sent_ids', 'ref_ids']
+
+
+def buildCorpus(refs):
+	"""Vocabulary and arrays of the sentences of refs, e.g. refer.data['refs']."""
+	refs = list(refs)
+	counts = collections.Counter()
+	sent_ids, ref_ids, lengths = [], [], []
+	for ref in refs:
+		for sent in ref['sentences']:
+			counts.update(sent['tokens'])
+			sent_ids.append(sent['sent_id'])
+			ref_ids.append(ref['ref_id'])
+			lengths.append(len(sent['tokens']))
+	words = sorted(counts, key=lambda w: (-counts[w], w))
+	wordToIx = dict((w, i+len(SPECIALS)) for i, w in enumerate(words))
+	tokens = np.fromiter((wordToIx[w] for ref in refs for sent in ref['sentences'] for w in sent['tokens']),
+						 dtype=np.int32, count=sum(lengths))
+	vocab = {'version': CORPUS_VERSION, 'words': SPECIALS + words,
+			 'counts': [0]*len(SPECIALS) + [counts[w] for w in words]}
+	arrays = {'tokens': tokens,
+			  'offsets': np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64),
+			  'sent_ids': np.array(sent_ids, dtype=np.int64),
+			  'ref_ids': np.array(ref_ids, dtype=np.int64)}
+	return vocab, arrays
+
+
+def saveCorpus(path, vocab, arrays):
+	# written to a temporary directory moved into place, as saveIndex
+	tmp = '%s.tmp%d' % (path, os.getpid())
+	if osp.isdir(tmp):
+		shutil.rmtree(tmp)
+	os.makedirs(tmp)
+	for name in ARRAYS:
+		np.save(osp.join(tmp, name+'.npy'), arrays[name])
+	with open(osp.join(tmp, 'vocab.json'), 'w') as f:
+		json.dump(vocab, f)
+	if osp.isdir(path):
+		shutil.rmtree(path)
+	os.rename(tmp, path)
+
+
+def loadCorpus(path, min_count=1, max_vocab=None):
+	"""Open the corpus saved in `path`, None if there is none or it was written by another version."""
+	vocab_file = osp.join(path, 'vocab.json')
+	if not osp.isfile(vocab_file):
+		return None
+	with open(vocab_file, 'r') as f:
+		vocab = json.load(f)
+	if vocab.get('version') != CORPUS_VERSION:
+		return None
+	arrays = dict((name, loadArray(osp.join(path, name+'.npy'))) for name in ARRAYS)
+	return TokenCorpus(vocab, arrays, min_count, max_vocab, path)
+
+
+class TokenCorpus(object):
+	"""Encoded sentences with the vocabulary of the words seen min_count times
+	or more, at most max_vocab of them (PAD and UNK not included).
+
+	vocab, wordToIx - words of the vocabulary, vocab[i] is the word of id i
+	counts          - number of occurrences of each word of vocab
+	tokens, offsets,
+	sent_ids,
+	ref_ids         - arrays of all sentences, see above
+	"""
+
+	def __init__(self, vocab, arrays, min_count=1, max_vocab=None, path=None):
+		self.path = path
+		self.min_count = min_count
+		self.max_vocab = max_vocab
+		for name in ARRAYS:
+			setattr(self, name, arrays[name])
+		words, counts = vocab['words'], vocab['counts']
+		# words are sorted by decreasing count, the kept ones are a prefix
+		size = len(SPECIALS) + sum(1 for c in counts[len(SPECIALS):] if c >= min_count)
+		if max_vocab is not None:
+			size = min(size, len(SPECIALS) + max_vocab)
+		self.vocab = words[:size]
+		self.counts = counts[:size]
+		self.wordToIx = dict((w, i) for i, w in enumerate(self.vocab))
+		self.sent_index = KeyIndex.build(np.asarray(self.sent_ids))
+		# ref_ids are grouped, the sentences of a ref being contiguous
+		starts = np.flatnonzero(np.diff(self.ref_ids)) + 1 if len(self.ref_ids) else np.zeros(0, dtype=np.int64)
+		self.ref_starts = np.concatenate([[0], starts, [len(self.ref_ids)]]).astype(np.int64)
+		self.ref_index = KeyIndex.build(np.asarray(self.ref_ids)[self.ref_starts[:-1]])
+
+	def __len__(self):
+		return len(self.sent_ids)
+
+	def __getstate__(self):
+		# a saved corpus is pickled as its path, workers memory-map the same files
+		if self.path is None:
+			return self.__dict__
+		return {'path': self.path, 'min_count': self.min_count, 'max_vocab': self.max_vocab}
+
+	def __setstate__(self, state):
+		if 'tokens' in state:
+			self.__dict__.update(state)
+		else:
+			self.__dict__.update(loadCorpus(state['path'], state['min_count'], state['max_vocab']).__dict__)
+
+	def encode(self, tokens):
+		"""Ids of a list of tokens, e.g. of a sentence not in the corpus."""
+		return np.array([self.wordToIx.get(w, UNK) for w in tokens], dtype=np.int32)
+
+	def decode(self, ids):
+		return [self.vocab[i] for i in ids if i != PAD]
+
+	def sentRows(self, sent_ids):
+		return self.sent_index.rows(sent_ids, 'sent_id')
+
+	def refRows(self, ref_ids, sample=False, rng=np.random):
+		"""Rows of the sentences of ref_ids (all of them in order, or one drawn at random per ref)."""
+		rows = self.ref_index.rows(ref_ids, 'ref_id')
+		starts = self.ref_starts[rows]
+		lens = self.ref_starts[rows+1] - starts
+		if sample:
+			return starts + (rng.random_sample(len(rows)) * lens).astype(np.int64)
+		# positions starts[k] .. starts[k]+lens[k] for every ref k, in one gather
+		shift = np.repeat(starts - np.cumsum(lens) + lens, lens)
+		return np.arange(lens.sum()) + shift
+
+	def sentBatch(self, sent_ids, max_len=None, packed=False):
+		return self.batch(self.sentRows(sent_ids), max_len, packed)
+
+	def refBatch(self, ref_ids, max_len=None, packed=False, sample=False, rng=np.random):
+		return self.batch(self.refRows(ref_ids, sample, rng), max_len, packed)
+
+	def batch(self, rows, max_len=None, packed=False):
+		"""
+		Ids of the sentences of rows, truncated to max_len tokens, as
+		padded: {'ids': int32 n x L (PAD after the end), 'lengths': int32 n}
+		packed: {'ids': int32 concatenated ids, 'offsets': int64 n+1}
+		together with their 'sent_ids' and 'ref_ids'.
+		"""
+		rows = np.asarray(rows, dtype=np.int64)
+		starts = self.offsets[rows]
+		lens = self.offsets[rows+1] - starts
+		if max_len is not None:
+			lens = np.minimum(lens, max_len)
+		batch = {'sent_ids': self.sent_ids[rows], 'ref_ids': self.ref_ids[rows],
+				 'lengths': lens.astype(np.int32)}
+		if packed:
+			shift = np.repeat(starts - np.cumsum(lens) + lens, lens)
+			ids = self.tokens[np.arange(lens.sum()) + shift]
+			batch['offsets'] = np.concatenate([[0], np.cumsum(lens)]).astype(np.int64)
+		else:
+			width = int(lens.max()) if len(lens) else 0
+			positions = np.arange(width)
+			inside = positions[None, :] < lens[:, None]
+			ids = np.zeros((len(rows), width), dtype=np.int32)
+			ids[inside] = self.tokens[(starts[:, None] + positions[None, :])[inside]]
+		# words out of the vocabulary, PAD stays PAD
+		batch['ids'] = np.where(ids >= len(self.vocab), UNK, ids).astype(np.int32, copy=False)
+		return batch